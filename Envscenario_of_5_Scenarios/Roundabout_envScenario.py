@@ -1,2 +1,142 @@
-Pending update
-Please email me if you need it
\ No newline at end of file
+from typing import List, Tuple, Optional, Union, Dict
+import math
+
+from highway_env.road.road import LaneIndex
+from highway_env.vehicle.controller import MDPVehicle
+from highway_env.vehicle.behavior import IDMVehicle
+
+from dilu.scenario.envScenarioCore import EnvScenarioCore, ScenarioPlugin
+from dilu.scenario.laneLocator import LaneLocator
+
+
+ACTIONS_ALL = {
+    0: 'LANE_LEFT',
+    1: 'IDLE',
+    2: 'LANE_RIGHT',
+    3: 'FASTER',
+    4: 'SLOWER'
+}
+
+ACTIONS_DESCRIPTION = {
+    0: 'Turn-left - change lane to the left of the current lane',
+    1: 'REMAIN - remain in the current lane with current speed',
+    2: 'Turn-right - change lane to the right of the current lane',
+    3: 'Acceleration - accelerate the car',
+    4: 'Deceleration - decelerate the car'
+}
+
+ROUNDABOUT_REMINDERS = (
+    '\nRemember:\n'
+    '- Always yield to vehicles already in the roundabout.\n'
+    '- Use the outer lane if you\'re planning to exit soon.\n'
+    '- Use the inner lane for going further around the roundabout.\n'
+    '- Signal before exiting the roundabout.\n'
+)
+
+# 根据 RoundaboutEnv 的定义，入口和出口车道的 (from, to)
+ENTRY_LANES = {
+    ('ser', 'ses'),
+    ('ner', 'nes'),
+    ('wer', 'wes'),
+    ('wxs', 'wxr'),
+    ('nxs', 'nxr'),
+}
+EXIT_LANES = {
+    ('eer', 'ees'),
+    ('exr', 'wxr'),
+    ('ees', 'ee'),
+    ('exs', 'exr'),
+}
+
+
+class RoundaboutPlugin(ScenarioPlugin):
+    envTypes = ('roundabout-v0',)
+    actionsDescription = ACTIONS_DESCRIPTION
+    actionNames = ACTIONS_ALL
+    actionsReminder = ROUNDABOUT_REMINDERS
+
+    # 环岛特定参数
+    center = (0, 0)
+    radius = 20
+
+    def __init__(self, scenario: EnvScenarioCore) -> None:
+        super().__init__(scenario)
+        # 代替 network.get_closest_lane_index 对所有车道的线性扫描
+        self.laneLocator = LaneLocator(scenario.network, scenario.geometry)
+
+    def is_on_roundabout(self, vehicle: Union[IDMVehicle, MDPVehicle]) -> bool:
+        x, y = vehicle.position
+        distance_from_center = math.sqrt((x - self.center[0]) ** 2 + (y - self.center[1]) ** 2)
+        return self.radius - 2 <= distance_from_center <= self.radius + 6  # 考虑到内外两条车道
+
+    def isOnRoundabout(self, vehicle: Union[IDMVehicle, MDPVehicle]) -> bool:
+        return self.is_on_roundabout(vehicle)
+
+    def get_angle_on_roundabout(self, vehicle: Union[IDMVehicle, MDPVehicle]) -> float:
+        x, y = vehicle.position
+        return math.degrees(math.atan2(y - self.center[1], x - self.center[0])) % 360
+
+    def is_at_entry_or_exit(
+            self, vehicle: Union[IDMVehicle, MDPVehicle]
+    ) -> Tuple[bool, str]:
+        from_lane, to_lane, _ = self.laneLocator.closestLaneIndex(vehicle.position)
+        if (from_lane, to_lane) in ENTRY_LANES:
+            return True, "entry"
+        elif (from_lane, to_lane) in EXIT_LANES:
+            return True, "exit"
+        return False, ""
+
+    def describe_roundabout(self) -> str:
+        ego = self.scenario.ego
+        angle = self.get_angle_on_roundabout(ego)
+        lane = self.laneLocator.closestLaneIndex(ego.position)[2]
+        description = f"You are driving on a roundabout. Your current position is at {angle:.2f} degrees. "
+        description += f"You are on the {'inner' if lane == 0 else 'outer'} lane. "
+        # 判断是否在入口或出口
+        is_entry_exit, entry_exit_type = self.is_at_entry_or_exit(ego)
+        if is_entry_exit:
+            if entry_exit_type == "entry":
+                description += "You are approaching the entry of the roundabout. Be prepared to yield to vehicles already in the roundabout. "
+            else:  # exit
+                description += "You are approaching an exit of the roundabout. If this is your intended exit, prepare to leave the roundabout. "
+        description += f"Your coordinates are ({ego.position[0]:.2f}, {ego.position[1]:.2f}). "
+        description += f"Your speed is {ego.speed:.2f} m/s and acceleration is {ego.action['acceleration']:.2f} m/s^2. "
+        return description
+
+    def describe_surrounding_vehicles(self) -> str:
+        # 和其他场景一样只描述这一帧记录下来的最近车辆，回放时可以得到同样的描述
+        scenario = self.scenario
+        ego = scenario.ego
+        surrounding_vehicles = scenario.getSurrendVehicles(10)
+        egoAngle = self.get_angle_on_roundabout(ego)
+        description = "Surrounding vehicles:\n"
+
+        for vehicle in surrounding_vehicles:
+            if self.is_on_roundabout(vehicle):
+                angle = self.get_angle_on_roundabout(vehicle)
+                relative_angle = (angle - egoAngle + 360) % 360
+                position = "ahead of" if 0 <= relative_angle <= 180 else "behind"
+
+                description += f"- Vehicle at {angle:.2f} degrees, {position} you. "
+                is_entry_exit, entry_exit_type = self.is_at_entry_or_exit(vehicle)
+                if is_entry_exit:
+                    if entry_exit_type == "entry":
+                        description += "It is approaching the entry of the roundabout. "
+                    else:
+                        description += "It is approaching the exit of the roundabout. "
+            else:
+                road_id = self.laneLocator.closestLaneIndex(vehicle.position)[0]
+                description += f"- Vehicle on {road_id} approaching the roundabout. "
+
+            description += f"Its speed is {vehicle.speed:.2f} m/s. "
+            description += f"Its coordinates are ({vehicle.position[0]:.2f}, {vehicle.position[1]:.2f}).\n"
+
+        return description
+
+    def describe(self, currentLaneIndex: LaneIndex) -> str:
+        return self.describe_roundabout() + self.describe_surrounding_vehicles()
+
+
+class EnvScenario(EnvScenarioCore):
+    plugins = (RoundaboutPlugin,)
+    defaultPlugin = RoundaboutPlugin
@@ -0,0 +1,310 @@
+from typing import List, Tuple, Optional, Union, Dict, AsyncIterator, Iterable, Sequence, TYPE_CHECKING
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import asyncio
+import itertools
+import json
+import os
+import re
+import threading
+import time
+
+from dilu.scenario.envScenarioCore import EnvScenarioCore
+from dilu.scenario.promptBuilder import (
+    PromptBuilder, Prompt, FewShot, DELIMITER, DRIVING_INTENTIONS,
+    renderMessages
+)
+from dilu.scenario.experienceMemory import ExperienceMemory, asFewShots
+from dilu.scenario.decisionCache import DecisionCache
+from dilu.scenario.decisionQueue import DecisionQueue
+from dilu.scenario.episodeRunner import (
+    EpisodeWorker, EpisodeTask, Episode, idlePolicy
+)
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+
+CHECK_MESSAGE = """
+You are a output checking assistant who is responsible for checking the output of another agent.
+
+The output you received is: {decision_action}
+
+Your should just output the right int type of action_id, with no other characters or delimiters.
+i.e. :
+{available_actions}
+
+You answer format would be:
+{delimiter} <correct action_id>
+"""
+
+ACTION_PATTERN = re.compile(r'(\d+)\s*$')
+
+
+def parseAction(
+        text: str, availableActions: List[int], delimiter: str = DELIMITER
+) -> Optional[int]:
+    # 取最后一个分隔符之后的动作编号，不在可用动作里时返回 None
+    match = ACTION_PATTERN.search(text.split(delimiter)[-1].strip())
+    if match and int(match.group(1)) in availableActions:
+        return int(match.group(1))
+    return None
+
+
+def createClient(
+        baseURL: Optional[str] = None, apiKey: Optional[str] = None,
+        maxConnections: int = 64, timeout: float = 120
+) -> 'AsyncOpenAI':
+    # 所有 episode 共用一个客户端和它的 HTTP 连接池。
+    # openai 和 httpx 只有调用 LLM 时才需要，在这里导入
+    import httpx
+    from openai import AsyncOpenAI
+
+    return AsyncOpenAI(
+        base_url=baseURL,
+        api_key=apiKey or os.environ.get('OPENAI_API_KEY', 'EMPTY'),
+        timeout=timeout,
+        http_client=httpx.AsyncClient(limits=httpx.Limits(
+            max_connections=maxConnections,
+            max_keepalive_connections=maxConnections
+        ))
+    )
+
+
+class AsyncDecisionDriver:
+    # 在一个事件循环里同时运行多个 episode。等待 LLM 回答时不占用仿真，
+    # 哪个 episode 的回答先到就先 step 那个环境。
+    # 同时在途的请求数由 concurrency 限制，同时运行的 episode 数由 maxEpisodes 限制
+    def __init__(
+            self, client: 'AsyncOpenAI', model: str, concurrency: int = 16,
+            maxEpisodes: int = 64, temperature: float = 0.0,
+            envConfigs: Optional[Dict[str, Dict]] = None,
+            databaseDir: str = 'episodes', sharedDB: bool = False,
+            runID: str = '', trajectoryDir: Optional[str] = None,
+            steps: int = 100, drivingIntentions: str = DRIVING_INTENTIONS,
+            fewShots: Sequence[FewShot] = (),
+            promptBuilder: Optional[PromptBuilder] = None,
+            memory: Optional[ExperienceMemory] = None, fewShotCount: int = 3,
+            decisionCache: Optional[DecisionCache] = None,
+            queue: Optional[DecisionQueue] = None,
+            networkCacheDir: Union[str, bool, None] = None
+    ) -> None:
+        self.client = client
+        self.model = model
+        self.concurrency = concurrency
+        self.maxEpisodes = maxEpisodes
+        self.temperature = temperature
+        self.drivingIntentions = drivingIntentions
+        self.fewShots = tuple(fewShots)
+        self.prompts = promptBuilder or PromptBuilder()
+        # 给定 memory 时，few-shot 按场景描述从同一场景类型的经验里检索
+        self.memory = memory
+        self.fewShotCount = fewShotCount
+        # 可选的决策缓存，量化后的场景相同时不再请求 LLM
+        self.decisionCache = decisionCache
+        # 给定 queue 时提示词经 DecisionQueue 合批后发给本地推理服务
+        self.queue = queue
+        self.worker = EpisodeWorker(
+            envConfigs or {}, idlePolicy, databaseDir, sharedDB, runID,
+            trajectoryDir, steps, networkCacheDir
+        )
+        self.semaphore: Optional[asyncio.Semaphore] = None
+        self.requests = 0
+        self.waitTime = 0.0
+        self.prefixTokens = 0
+        self.suffixTokens = 0
+
+    async def complete(self, messages: List[Dict[str, str]]) -> str:
+        if self.queue is not None:
+            return await self.queue.submit(renderMessages(messages))
+        # semaphore 要在事件循环里创建
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.concurrency)
+        async with self.semaphore:
+            start = time.perf_counter()
+            response = await self.client.chat.completions.create(
+                model=self.model, messages=messages,
+                temperature=self.temperature
+            )
+            self.requests += 1
+            self.waitTime += time.perf_counter() - start
+        return response.choices[0].message.content or ''
+
+    async def completePrompt(self, prompt: Prompt) -> str:
+        # 合批时按前缀分组，前缀文本已经缓存在 PromptPrefix 里
+        if self.queue is not None:
+            return await self.queue.submit(prompt.text, prompt.prefix.key)
+        return await self.complete(prompt.messages)
+
+    async def decide(
+            self, scenario: EnvScenarioCore, description: str,
+            availableActions: List[int]
+    ) -> Tuple[int, str, List[Dict], bool]:
+        # 返回 (动作, 回答, 用到的经验, 是否来自 decisionCache)
+        signature = None
+        if self.decisionCache is not None:
+            signature = self.decisionCache.signature(
+                scenario.envType, scenario.getScenarioKey(), availableActions
+            )
+            decision = self.decisionCache.get(signature)
+            if decision is not None:
+                return decision[0], decision[1], [], True
+
+        fewShots = self.fewShots
+        memories = []
+        if self.memory is not None:
+            # 经验带有场景特征时先按特征预筛选
+            key = None
+            if self.memory.hasKeys(scenario.envType):
+                key = scenario.getScenarioKey()
+            memories = self.memory.retrieve(
+                scenario.envType, description, self.fewShotCount, key
+            )
+            fewShots = tuple(asFewShots(memories))
+        prompt = self.prompts.build(
+            scenario.envType, description,
+            scenario.availableActionsDescription(), fewShots,
+            self.drivingIntentions
+        )
+        self.prefixTokens += prompt.prefixTokens
+        self.suffixTokens += prompt.suffixTokens
+        response = await self.completePrompt(prompt)
+        delimiter = self.prompts.delimiter
+        action = parseAction(response, availableActions, delimiter)
+        if action is None:
+            # 和 driverAgent 一样，输出格式不对时再请求一次检查
+            checked = await self.complete([{
+                'role': 'user', 'content': CHECK_MESSAGE.format(
+                    decision_action=response, delimiter=delimiter,
+                    available_actions=scenario.availableActionsDescription()
+                )
+            }])
+            action = parseAction(checked, availableActions, delimiter)
+        if action is None:
+            print(f"Invalid LLM output, using the default action: {response[-100:]}")
+            return (
+                idlePolicy(scenario, description, availableActions),
+                response, memories, False
+            )
+        if signature is not None:
+            self.decisionCache.put(signature, action, response)
+        return action, response, memories, False
+
+    async def runEpisode(self, task: EpisodeTask) -> Dict:
+        episode: Episode = self.worker.startEpisode(task)
+        try:
+            while not episode.finished:
+                description, availableActions = episode.observe()
+                action, response, memories, cached = await self.decide(
+                    episode.scenario, description, availableActions
+                )
+                episode.step(
+                    description, action, response,
+                    ','.join(memory['vectorID'] for memory in memories),
+                    '\n\n'.join(memory['response'] for memory in memories),
+                    cached
+                )
+        finally:
+            self.worker.finishEpisode(episode)
+        return episode.result()
+
+    async def run(self, tasks: Iterable[EpisodeTask]) -> AsyncIterator[Dict]:
+        # 按完成的先后返回每个 episode 的结果，一个结束后补上下一个任务
+        tasks = iter(tasks)
+        pending = {
+            asyncio.ensure_future(self.runEpisode(task))
+            for task in itertools.islice(tasks, self.maxEpisodes)
+        }
+        done = set()
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for future in done:
+                    task = next(tasks, None)
+                    if task is not None:
+                        pending.add(asyncio.ensure_future(self.runEpisode(task)))
+                    yield future.result()
+        finally:
+            # 一个 episode 出错或者调用方不再取结果时，取消其余的 episode 并等待它们结束，
+            # runEpisode 的 finally 会关闭各自的数据库；已经结束的 episode 的异常也在这里取出
+            for future in pending:
+                future.cancel()
+            await asyncio.gather(*pending, *done, return_exceptions=True)
+
+
+def runAsyncEpisodes(
+        tasks: List[EpisodeTask], model: str, baseURL: Optional[str] = None,
+        apiKey: Optional[str] = None, batchWindow: Optional[float] = None,
+        maxBatch: int = 32, **kwargs
+) -> List[Dict]:
+    # 给定 batchWindow 时通过 DecisionQueue 合批请求
+    async def collect() -> List[Dict]:
+        client = createClient(
+            baseURL, apiKey, kwargs.get('concurrency', 16)
+        )
+        if batchWindow is not None:
+            kwargs['queue'] = DecisionQueue(
+                client, model, batchWindow, maxBatch,
+                temperature=kwargs.get('temperature', 0.0)
+            )
+        driver = AsyncDecisionDriver(client, model, **kwargs)
+        try:
+            return [result async for result in driver.run(tasks)]
+        finally:
+            await client.close()
+    return asyncio.run(collect())
+
+
+class StubModelHandler(BaseHTTPRequestHandler):
+    # OpenAI 兼容的 /chat/completions 和 /completions，等待 delay 秒后返回固定的动作，
+    # 用于本地测试。/completions 的 prompt 可以是列表，每个提示词一个 choice
+    action = 1
+    delay = 0.0
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get('Content-Length', 0))
+        request = json.loads(self.rfile.read(length) or b'{}')
+        time.sleep(self.delay)
+        content = f"Keep the current state.\nResponse to user:{DELIMITER} {self.action}"
+        if self.path.endswith('/chat/completions'):
+            choices = [{
+                'index': 0, 'finish_reason': 'stop',
+                'message': {'role': 'assistant', 'content': content}
+            }]
+            objectType = 'chat.completion'
+        else:
+            prompts = request.get('prompt', '')
+            if isinstance(prompts, str):
+                prompts = [prompts]
+            choices = [
+                {'index': i, 'finish_reason': 'stop', 'text': content, 'logprobs': None}
+                for i in range(len(prompts))
+            ]
+            objectType = 'text_completion'
+        body = json.dumps({
+            'id': 'stub', 'object': objectType, 'created': int(time.time()),
+            'model': request.get('model', 'stub'),
+            'choices': choices,
+            'usage': {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0}
+        }).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+def serveStubModel(
+        port: int = 0, action: int = 1, delay: float = 0.0
+) -> ThreadingHTTPServer:
+    # 在后台线程里启动本地模型服务，baseURL 为 http://127.0.0.1:{server.server_port}/v1
+    handler = type('StubHandler', (StubModelHandler,), {
+        'action': action, 'delay': delay
+    })
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
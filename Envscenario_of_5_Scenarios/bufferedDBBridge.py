@@ -0,0 +1,455 @@
+from typing import List, Tuple, Optional, Union, Dict, Callable, Iterable
+from datetime import datetime
+import atexit
+import json
+import math
+import queue
+import sqlite3
+import threading
+import uuid
+
+from highway_env.envs.common.abstract import AbstractEnv
+from highway_env.vehicle.controller import MDPVehicle
+from highway_env.vehicle.behavior import IDMVehicle
+
+from dilu.scenario.DBBridge import DBBridge
+from dilu.scenario.networkGeometry import NetworkGeometry
+from dilu.scenario.vehicleRecord import VehicleRecord, EGO
+from dilu.scenario.vehicleSnapshot import VehicleSnapshot
+
+
+# 缓冲模式下车辆和 prompt 仍然写入 DBBridge 的 vehINFO / promptsLLM，只是改为批量写入。
+# vehINFO 没有的列（episodeID、航向、加速度和完整的车道）写入 vehicleLog，
+# decisionCache 的 cached 标记写入 decisionLog。共享数据库没有 vehINFO / promptsLLM，
+# 车辆和 prompt 写入 vehicleLog / promptLog
+CREATE_VEHICLE_LOG = """CREATE TABLE IF NOT EXISTS vehicleLog(
+    episodeID TEXT,
+    frame INT,
+    id INT,
+    isEgo BOOL,
+    x REAL,
+    y REAL,
+    heading REAL,
+    speed REAL,
+    acceleration REAL,
+    laneFrom TEXT,
+    laneTo TEXT,
+    laneID INT
+);"""
+
+CREATE_VEHICLE_LOG_INDEX = """CREATE INDEX IF NOT EXISTS vehicleLogFrame
+    ON vehicleLog (episodeID, frame);"""
+
+CREATE_PROMPT_LOG = """CREATE TABLE IF NOT EXISTS promptLog(
+    episodeID TEXT,
+    frame INT,
+    vectorID TEXT,
+    done BOOL,
+    description TEXT,
+    fewshots TEXT,
+    thoughtsAndAction TEXT,
+    cached BOOL DEFAULT 0,
+    PRIMARY KEY (episodeID, frame)
+);"""
+
+# ego 在每一帧描述之前的 route（JSON），回放时用来得到同样的 nextLane
+CREATE_ROUTE_LOG = """CREATE TABLE IF NOT EXISTS routeLog(
+    episodeID TEXT,
+    frame INT,
+    route TEXT,
+    PRIMARY KEY (episodeID, frame)
+);"""
+
+# episode 和路网，共享数据库和缓冲模式都写入，回放和导出视频时按 episodeID 读取
+CREATE_EPISODES = """CREATE TABLE IF NOT EXISTS episodes(
+    episodeID TEXT PRIMARY KEY,
+    runID TEXT,
+    envType TEXT,
+    seed INT,
+    networkHash TEXT,
+    startTime TEXT,
+    scenario TEXT
+);"""
+
+CREATE_NETWORKS = """CREATE TABLE IF NOT EXISTS networks(
+    networkHash TEXT PRIMARY KEY,
+    envType TEXT,
+    network TEXT
+);"""
+
+INSERT_EPISODE = """INSERT INTO episodes
+    (episodeID, runID, envType, seed, networkHash, startTime, scenario)
+    VALUES (?, ?, ?, ?, ?, ?, ?);"""
+
+INSERT_NETWORK = """INSERT OR IGNORE INTO networks
+    (networkHash, envType, network)
+    VALUES (?, ?, ?);"""
+
+# 每一帧的决策是否来自 decisionCache
+CREATE_DECISION_LOG = """CREATE TABLE IF NOT EXISTS decisionLog(
+    episodeID TEXT,
+    frame INT,
+    cached BOOL,
+    PRIMARY KEY (episodeID, frame)
+);"""
+
+INSERT_VEHICLE_LOG = """INSERT INTO vehicleLog
+    (episodeID, frame, id, isEgo, x, y, heading, speed, acceleration,
+     laneFrom, laneTo, laneID)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);"""
+
+INSERT_PROMPT_LOG = """INSERT OR REPLACE INTO promptLog
+    (episodeID, frame, vectorID, done, description, fewshots,
+     thoughtsAndAction, cached)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?);"""
+
+INSERT_ROUTE_LOG = """INSERT OR REPLACE INTO routeLog
+    (episodeID, frame, route)
+    VALUES (?, ?, ?);"""
+
+INSERT_DECISION_LOG = """INSERT OR REPLACE INTO decisionLog
+    (episodeID, frame, cached)
+    VALUES (?, ?, ?);"""
+
+# DBBridge 的 vehINFO / promptsLLM 各列的取值。DBBridge 属于 DiLu，不在本仓库里，
+# 建表之后按表里实际有的列生成 INSERT：这里没有的列留空，表里没有的列不写
+VEH_INFO_FIELDS: Dict[str, Callable[[int, VehicleRecord], object]] = {
+    'frame': lambda frame, record: frame,
+    'id': lambda frame, record: str(record.id),
+    'x': lambda frame, record: record.x,
+    'y': lambda frame, record: record.y,
+    'lane_id': lambda frame, record: str(record.laneIndex[2]),
+    'speedx': lambda frame, record: record.speed * math.cos(record.heading),
+    'speedy': lambda frame, record: record.speed * math.sin(record.heading),
+    'heading': lambda frame, record: record.heading,
+    'speed': lambda frame, record: record.speed,
+}
+
+# insertPrompts 的参数顺序
+PROMPTS_LLM_FIELDS = (
+    'decisionFrame', 'vectorID', 'done', 'description', 'fewshots',
+    'thoughtsAndAction'
+)
+
+
+def insertStatement(
+        conn: sqlite3.Connection, table: str, fields: Iterable[str]
+) -> Optional[Tuple[str, List[str]]]:
+    # 表里有的已知列和对应的 INSERT，表不存在时返回 None
+    tableColumns = {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+    columns = [field for field in fields if field in tableColumns]
+    if not columns:
+        return None
+    return (
+        f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}) "
+        f"VALUES ({', '.join('?' * len(columns))});",
+        columns
+    )
+
+
+def createEpisodeTables(conn: sqlite3.Connection) -> None:
+    with conn:
+        conn.execute(CREATE_EPISODES)
+        conn.execute(CREATE_NETWORKS)
+        # 之前建的 episodes 没有 scenario 列
+        columns = [row[1] for row in conn.execute('PRAGMA table_info(episodes)')]
+        if 'scenario' not in columns:
+            conn.execute('ALTER TABLE episodes ADD COLUMN scenario TEXT')
+
+
+def createLogTables(conn: sqlite3.Connection) -> None:
+    with conn:
+        conn.execute(CREATE_VEHICLE_LOG)
+        conn.execute(CREATE_VEHICLE_LOG_INDEX)
+        conn.execute(CREATE_PROMPT_LOG)
+        conn.execute(CREATE_ROUTE_LOG)
+        # 之前建的 promptLog 没有 cached 列
+        columns = [row[1] for row in conn.execute('PRAGMA table_info(promptLog)')]
+        if 'cached' not in columns:
+            conn.execute('ALTER TABLE promptLog ADD COLUMN cached BOOL DEFAULT 0')
+
+
+def recordRow(episodeID: str, frame: int, record: VehicleRecord) -> Tuple:
+    laneFrom, laneTo, laneID = record.laneIndex
+    return (
+        episodeID, frame, record.id, record.relation == EGO,
+        record.x, record.y, record.heading, record.speed,
+        record.acceleration, laneFrom, laneTo, laneID
+    )
+
+
+class DBWriter:
+    # 后台写线程：每个任务是一组 (sql, rows)，在同一个事务里用 executemany 写入。
+    # 队列有上限，写入跟不上时决策循环会在 submit 处等待，而不是无限占用内存。
+    def __init__(
+            self, database: str, queueSize: int = 8,
+            pragmas: Tuple[str, ...] = ()
+    ) -> None:
+        self.database = database
+        self.pragmas = pragmas
+        self.error: Optional[BaseException] = None
+        self.closed = False
+
+        self.jobs: queue.Queue = queue.Queue(maxsize=queueSize)
+        self.thread = threading.Thread(
+            target=self.writeLoop, name='DBWriter', daemon=True
+        )
+        self.thread.start()
+        # 进程退出前也要把队列里的数据写完
+        atexit.register(self.close)
+
+    def submit(self, batch: List[Tuple[str, List[Tuple]]]) -> None:
+        self.raiseError()
+        if self.closed:
+            raise RuntimeError(f"Writer for {self.database} is closed")
+        self.jobs.put(batch)
+
+    def sync(self) -> None:
+        # 等待之前提交的所有任务都已经 commit
+        done = threading.Event()
+        self.jobs.put(done)
+        done.wait()
+        self.raiseError()
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        self.jobs.put(None)
+        self.thread.join()
+        atexit.unregister(self.close)
+        self.raiseError()
+
+    def raiseError(self) -> None:
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise RuntimeError(
+                f"Background write to {self.database} failed"
+            ) from error
+
+    def writeLoop(self) -> None:
+        # sqlite3 的连接只能在创建它的线程里使用，所以在写线程里单独连接
+        conn = None
+        try:
+            conn = sqlite3.connect(self.database, timeout=30)
+            for pragma in self.pragmas:
+                conn.execute(pragma)
+            while True:
+                batch = self.jobs.get()
+                if batch is None:
+                    break
+                if isinstance(batch, threading.Event):
+                    batch.set()
+                    continue
+                try:
+                    with conn:
+                        for sql, rows in batch:
+                            conn.executemany(sql, rows)
+                except Exception as e:
+                    # 记录下来，在决策线程下一次 submit / close 时抛出
+                    self.error = e
+        except Exception as e:
+            # 连接失败后继续取出队列里的任务，submit / sync / close 不会一直等待
+            self.error = e
+            self.discard(e)
+        finally:
+            if conn is not None:
+                conn.close()
+
+    def discard(self, error: BaseException) -> None:
+        # 写不进数据库的任务直接丢弃，每丢弃一个都重新记录错误
+        while True:
+            batch = self.jobs.get()
+            if batch is None:
+                break
+            if isinstance(batch, threading.Event):
+                batch.set()
+            else:
+                self.error = error
+
+
+class FrameLogBuffer:
+    # 在内存里按 INSERT 语句缓存一个 episode 的行。车辆帧和 prompt 都计数，
+    # 合计达到 flushFrames 时交给 DBWriter，prompt 不会等到之后的车辆帧才写入
+    def __init__(
+            self, writer: DBWriter, env: AbstractEnv,
+            episodeID: str, flushFrames: int = 20
+    ) -> None:
+        self.writer = writer
+        self.env = env
+        self.episodeID = episodeID
+        self.flushFrames = flushFrames
+        self.rows: Dict[str, List[Tuple]] = {}
+        self.bufferedRows = 0
+
+    def add(self, sql: str, rows: Iterable[Tuple]) -> None:
+        self.rows.setdefault(sql, []).extend(rows)
+
+    def insertVehicle(self, frame: int, SVs: List[IDMVehicle]) -> None:
+        # 车辆对象在下一步仿真时会被修改，所以行数据必须在这里立即取出
+        snapshot = VehicleSnapshot(self.env.vehicle, SVs)
+        self.insertRecords(
+            frame, snapshot.egoRecord(), snapshot.records(),
+            getattr(self.env.vehicle, 'route', None)
+        )
+
+    def insertRecords(
+            self, frame: int, egoRecord: VehicleRecord,
+            records: List[VehicleRecord], route: Optional[List] = None
+    ) -> None:
+        self.addRecords(frame, [egoRecord] + list(records))
+        if route is not None:
+            # route 在之后的 next_lane 中会被修改，这里立即序列化
+            self.add(INSERT_ROUTE_LOG, [(
+                self.episodeID, frame, json.dumps([list(lidx) for lidx in route])
+            )])
+        self.countRow()
+
+    def addRecords(self, frame: int, records: List[VehicleRecord]) -> None:
+        self.add(INSERT_VEHICLE_LOG, [
+            recordRow(self.episodeID, frame, record) for record in records
+        ])
+
+    def insertPrompts(
+            self, frame: int, vectorID: str, done: bool,
+            description: str, fewshots: str, thoughtsAndAction: str,
+            cached: bool = False
+    ) -> None:
+        self.addPrompt(
+            (frame, vectorID, done, description, fewshots, thoughtsAndAction),
+            cached
+        )
+        self.countRow()
+
+    def addPrompt(self, prompt: Tuple, cached: bool) -> None:
+        self.add(INSERT_PROMPT_LOG, [(self.episodeID,) + prompt + (cached,)])
+
+    def countRow(self) -> None:
+        self.bufferedRows += 1
+        if self.bufferedRows >= self.flushFrames:
+            self.flush()
+
+    def flush(self) -> None:
+        batch = [(sql, rows) for sql, rows in self.rows.items() if rows]
+        if batch:
+            self.writer.submit(batch)
+        self.rows = {}
+        self.bufferedRows = 0
+
+
+class DBBridgeLogBuffer(FrameLogBuffer):
+    # 缓冲模式：车辆和 prompt 写入 DBBridge 的 vehINFO / promptsLLM，
+    # 其余的列写入 vehicleLog 和 decisionLog。INSERT 在 DBBridge 建表之后由 prepare 生成
+    def __init__(
+            self, writer: DBWriter, env: AbstractEnv,
+            episodeID: str, flushFrames: int = 20
+    ) -> None:
+        super().__init__(writer, env, episodeID, flushFrames)
+        self.vehInfo: Optional[Tuple[str, List[str]]] = None
+        self.promptsLLM: Optional[Tuple[str, List[str]]] = None
+
+    def prepare(self, conn: sqlite3.Connection) -> None:
+        self.vehInfo = insertStatement(conn, 'vehINFO', VEH_INFO_FIELDS)
+        self.promptsLLM = insertStatement(conn, 'promptsLLM', PROMPTS_LLM_FIELDS)
+
+    def addRecords(self, frame: int, records: List[VehicleRecord]) -> None:
+        super().addRecords(frame, records)
+        if self.vehInfo is not None:
+            sql, columns = self.vehInfo
+            self.add(sql, [
+                tuple(VEH_INFO_FIELDS[column](frame, record) for column in columns)
+                for record in records
+            ])
+
+    def addPrompt(self, prompt: Tuple, cached: bool) -> None:
+        if self.promptsLLM is not None:
+            sql, columns = self.promptsLLM
+            values = dict(zip(PROMPTS_LLM_FIELDS, prompt))
+            self.add(sql, [tuple(values[column] for column in columns)])
+        self.add(INSERT_DECISION_LOG, [(self.episodeID, prompt[0], cached)])
+
+
+class BufferedDBBridge(DBBridge):
+    # insertVehicle / insertPrompts 只把行数据放进内存缓冲区，
+    # 由后台写线程批量写入，决策循环不再等待每一行的 commit
+    def __init__(
+            self, database: str, env: AbstractEnv,
+            flushFrames: int = 20, queueSize: int = 8,
+            scenario: Optional[str] = None,
+            networkCacheDir: Union[str, bool, None] = None
+    ) -> None:
+        super().__init__(database, env)
+        self.writer = DBWriter(database, queueSize)
+        self.episodeID = uuid.uuid4().hex
+        self.buffer = DBBridgeLogBuffer(
+            self.writer, env, self.episodeID, flushFrames
+        )
+        # 和共享数据库一样记录 episode、生成描述的 EnvScenario 模块和路网，
+        # replayReader 和 videoExport 可以直接读取这个数据库
+        self.scenario = scenario
+        self.networkCacheDir = networkCacheDir
+        self.envType = ''
+        self.geometry: Optional[NetworkGeometry] = None
+        # 没有调用 close 时，进程退出前也要把缓冲区里的数据写完
+        atexit.register(self.close)
+
+    def createTable(self):
+        super().createTable()
+        conn = sqlite3.connect(self.database)
+        createEpisodeTables(conn)
+        createLogTables(conn)
+        with conn:
+            conn.execute(CREATE_DECISION_LOG)
+        self.buffer.prepare(conn)
+        conn.close()
+
+    def insertSimINFO(self, envType: str, seed: int):
+        super().insertSimINFO(envType, seed)
+        self.envType = envType
+        self.geometry = NetworkGeometry.forEnv(
+            self.env, envType, self.networkCacheDir
+        )
+        self.writer.submit([(INSERT_EPISODE, [(
+            self.episodeID, '', envType, seed, self.geometry.hash,
+            datetime.now().isoformat(timespec='seconds'), self.scenario
+        )])])
+
+    def insertNetwork(self):
+        super().insertNetwork()
+        if self.geometry is None:
+            self.geometry = NetworkGeometry.forEnv(
+                self.env, self.envType, self.networkCacheDir
+            )
+        self.writer.submit([(INSERT_NETWORK, [(
+            self.geometry.hash, self.envType,
+            json.dumps(self.geometry.description, separators=(',', ':'))
+        )])])
+
+    def insertVehicle(self, frame: int, SVs: List[IDMVehicle]) -> None:
+        self.buffer.insertVehicle(frame, SVs)
+
+    def insertRecords(
+            self, frame: int, egoRecord: VehicleRecord,
+            records: List[VehicleRecord], route: Optional[List] = None
+    ) -> None:
+        self.buffer.insertRecords(frame, egoRecord, records, route)
+
+    def insertPrompts(
+            self, frame: int, vectorID: str, done: bool,
+            description: str, fewshots: str, thoughtsAndAction: str,
+            cached: bool = False
+    ) -> None:
+        self.buffer.insertPrompts(
+            frame, vectorID, done, description, fewshots, thoughtsAndAction,
+            cached
+        )
+
+    def flush(self) -> None:
+        self.buffer.flush()
+
+    def close(self) -> None:
+        atexit.unregister(self.close)
+        try:
+            self.buffer.flush()
+        finally:
+            self.writer.close()
@@ -0,0 +1,46 @@
+from typing import List, Tuple, Optional, Union, Dict
+
+import numpy as np
+
+from dilu.scenario.vehicleSnapshot import VehicleSnapshot
+
+
+# 与 np.allclose(rel_vel, 0) 的默认容差相同
+VELOCITY_ATOL = 1e-8
+
+
+def rowDot(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return np.matmul(a[:, None, :], b[:, :, None])[:, 0, 0]
+
+
+class ConflictTable:
+    # 一次数组运算得到快照里所有周车相对 ego 的冲突时间、冲突点和冲突时刻的间距，
+    # 计算方式与原来逐车调用的 getCollisionPoint 相同：
+    #   t = (p_sv - p_ego)·(v_sv - v_ego) / |v_sv - v_ego|^2，冲突点为 p_ego + v_ego * t
+    # 相对速度为 0 或 t < 0 的车辆没有冲突点
+    def __init__(self, snapshot: VehicleSnapshot) -> None:
+        self.snapshot = snapshot
+        relPos = snapshot.relativePositions
+        relVel = snapshot.velocities - snapshot.egoVelocity
+
+        moving = ~np.all(np.abs(relVel) <= VELOCITY_ATOL, axis=1)
+        # 用 matmul 逐行求点积，舍入方式与 np.dot 相同，冲突点和逐车计算的结果完全一致
+        numerator = rowDot(relPos, relVel)
+        denominator = rowDot(relVel, relVel)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.times = np.where(moving, numerator / denominator, np.nan)
+
+        self.points = (
+            snapshot.egoPosition + snapshot.egoVelocity * self.times[:, None]
+        )
+        gaps = relPos + relVel * self.times[:, None]
+        self.gaps = np.hypot(gaps[:, 0], gaps[:, 1])
+        # t 为 nan 时比较结果为 False，也就没有冲突点
+        self.valid = (
+            moving & (self.times >= 0) & ~np.isnan(self.points).any(axis=1)
+        )
+
+    def conflictPoint(self, row: Optional[int]) -> Optional[np.ndarray]:
+        if row is None or not self.valid[row]:
+            return None
+        return self.points[row]
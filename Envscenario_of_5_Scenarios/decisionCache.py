@@ -0,0 +1,55 @@
+from typing import List, Tuple, Optional, Union, Dict, Hashable
+from collections import OrderedDict
+
+import numpy as np
+
+from dilu.scenario.scenarioKey import scaleKeys
+
+
+class DecisionCache:
+    # 按量化后的场景特征缓存 LLM 的决策。特征（getScenarioKey）按 KEY_SCALES
+    # 缩放后再除以 resolution 取整：resolution=1 时速度按 2 m/s、间距按 10 m 分档，
+    # 车道分组里有没有车辆、路口和环岛标志也都包含在内。
+    # 签名还包括 envType 和可用动作，相同签名的帧直接复用之前的回答，按 LRU 淘汰
+    def __init__(self, maxSize: int = 4096, resolution: float = 1.0) -> None:
+        self.maxSize = maxSize
+        self.resolution = resolution
+        self.decisions: 'OrderedDict[Hashable, Tuple[int, str]]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self.decisions)
+
+    def signature(
+            self, envType: str, key: np.ndarray, availableActions: List[int]
+    ) -> Hashable:
+        quantized = np.round(scaleKeys(key)[0] / self.resolution).astype(np.int64)
+        return envType, quantized.tobytes(), tuple(availableActions)
+
+    def get(self, signature: Hashable) -> Optional[Tuple[int, str]]:
+        decision = self.decisions.get(signature)
+        if decision is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.decisions.move_to_end(signature)
+        return decision
+
+    def put(self, signature: Hashable, action: int, response: str) -> None:
+        self.decisions[signature] = (action, response)
+        self.decisions.move_to_end(signature)
+        if len(self.decisions) > self.maxSize:
+            self.decisions.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Union[int, float]]:
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self.decisions),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hitRate': self.hits / lookups if lookups else 0.0
+        }
@@ -0,0 +1,123 @@
+from typing import List, Tuple, Optional, Union, Dict, Hashable, Set, TYPE_CHECKING
+from collections import deque
+import asyncio
+import time
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+
+class QueueItem:
+    __slots__ = ('text', 'future', 'submitted', 'sent')
+
+    def __init__(self, text: str, future: asyncio.Future) -> None:
+        self.text = text
+        self.future = future
+        self.submitted = time.perf_counter()
+        self.sent = 0.0
+
+
+class DecisionQueue:
+    # 汇总所有 episode 的提示词。第一个提示词到达后等待 window 秒，
+    # 期间到达的提示词按前缀（系统提示词和 few-shot 集合）分组，每组作为一个
+    # /completions 请求的 prompt 列表一起提交给本地推理服务，回答按 index 分回各个 episode。
+    # 一组达到 maxBatch 时立即提交；同时在途的批次数由 concurrency 限制
+    def __init__(
+            self, client: 'AsyncOpenAI', model: str, window: float = 0.02,
+            maxBatch: int = 32, concurrency: int = 4, temperature: float = 0.0,
+            maxTokens: int = 512, generationPrompt: str = '<|assistant|>\n',
+            maxRecords: int = 10000
+    ) -> None:
+        self.client = client
+        self.model = model
+        self.window = window
+        self.maxBatch = maxBatch
+        self.concurrency = concurrency
+        self.temperature = temperature
+        self.maxTokens = maxTokens
+        self.generationPrompt = generationPrompt
+        self.pending: Dict[Hashable, List[QueueItem]] = {}
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.batches: Set[asyncio.Future] = set()
+        self.semaphore: Optional[asyncio.Semaphore] = None
+        self.requests = 0
+        self.items = 0
+        self.maxBatchSize = 0
+        self.queueWait = 0.0
+        self.latency = 0.0
+        # 最近 maxRecords 个提示词的 (批大小, 排队时间, 总延迟)
+        self.records: 'deque[Tuple[int, float, float]]' = deque(maxlen=maxRecords)
+
+    async def submit(self, text: str, prefixKey: Hashable = None) -> str:
+        loop = asyncio.get_running_loop()
+        item = QueueItem(text, loop.create_future())
+        group = self.pending.setdefault(prefixKey, [])
+        group.append(item)
+        if len(group) >= self.maxBatch:
+            self.dispatch(prefixKey)
+        elif self.timer is None:
+            self.timer = loop.call_later(self.window, self.flush)
+        return await item.future
+
+    def flush(self) -> None:
+        self.timer = None
+        for prefixKey in list(self.pending):
+            self.dispatch(prefixKey)
+
+    def dispatch(self, prefixKey: Hashable) -> None:
+        batch = asyncio.ensure_future(self.send(self.pending.pop(prefixKey)))
+        self.batches.add(batch)
+        batch.add_done_callback(self.batches.discard)
+
+    async def send(self, items: List[QueueItem]) -> None:
+        # semaphore 要在事件循环里创建
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.concurrency)
+        async with self.semaphore:
+            sent = time.perf_counter()
+            for item in items:
+                item.sent = sent
+            try:
+                response = await self.client.completions.create(
+                    model=self.model,
+                    prompt=[item.text + self.generationPrompt for item in items],
+                    temperature=self.temperature, max_tokens=self.maxTokens
+                )
+            except Exception as error:
+                for item in items:
+                    if not item.future.done():
+                        item.future.set_exception(error)
+                return
+        answered = time.perf_counter()
+        texts: Dict[int, str] = {}
+        for choice in response.choices:
+            # 服务返回的回答少于提示词或者 index 超出范围时，只让没有回答的提示词失败
+            if 0 <= choice.index < len(items):
+                texts[choice.index] = choice.text or ''
+        self.requests += 1
+        self.items += len(items)
+        self.maxBatchSize = max(self.maxBatchSize, len(items))
+        for i, item in enumerate(items):
+            queueWait = item.sent - item.submitted
+            latency = answered - item.submitted
+            self.queueWait += queueWait
+            self.latency += latency
+            self.records.append((len(items), queueWait, latency))
+            if item.future.done():
+                continue
+            if i in texts:
+                item.future.set_result(texts[i])
+            else:
+                item.future.set_exception(RuntimeError(
+                    f"No completion for prompt {i} of a batch of {len(items)}"
+                ))
+
+    def stats(self) -> Dict[str, Union[int, float]]:
+        return {
+            'requests': self.requests,
+            'items': self.items,
+            'meanBatchSize': self.items / self.requests if self.requests else 0.0,
+            'maxBatchSize': self.maxBatchSize,
+            'meanQueueWait': self.queueWait / self.items if self.items else 0.0,
+            'meanLatency': self.latency / self.items if self.items else 0.0
+        }
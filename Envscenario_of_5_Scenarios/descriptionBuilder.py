@@ -0,0 +1,33 @@
+from typing import List, Tuple, Optional, Union, Dict
+
+
+class FragmentCache:
+    # 缓存上一帧和当前帧生成的周车描述片段，键是模板和填入模板的值。
+    # 车道关系片段（车辆编号、车道关系、前方还是后方）在帧之间通常不变，直接复用；
+    # 状态片段的键是记录里的原始数值，只有停着的车辆（排队、在路口等待）数值完全相同，
+    # 相同的数值打印出来也完全相同，输出和直接格式化一致。
+    # 只保留上一帧和当前帧用到的片段，缓存不会随仿真时间增长
+    def __init__(self) -> None:
+        self.current: Dict[Tuple, str] = {}
+        self.previous: Dict[Tuple, str] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def startFrame(self) -> None:
+        self.previous = self.current
+        self.current = {}
+
+    def render(self, template: str, *values: Union[int, float, str]) -> str:
+        key = (template, *values)
+        fragment = self.current.get(key)
+        if fragment is None:
+            fragment = self.previous.get(key)
+            if fragment is None:
+                fragment = template.format(*values)
+                self.misses += 1
+            else:
+                self.hits += 1
+            self.current[key] = fragment
+        else:
+            self.hits += 1
+        return fragment
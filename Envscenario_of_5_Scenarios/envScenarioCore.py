@@ -0,0 +1,703 @@
+from typing import List, Tuple, Optional, Union, Dict, Type, Iterable
+from datetime import datetime
+import math
+import os
+
+from highway_env.road.road import Road, RoadNetwork, LaneIndex
+from highway_env.road.lane import StraightLane
+from highway_env.envs.common.abstract import AbstractEnv
+from highway_env.vehicle.controller import MDPVehicle
+from highway_env.vehicle.behavior import IDMVehicle
+import numpy as np
+
+from dilu.scenario.DBBridge import DBBridge
+from dilu.scenario.bufferedDBBridge import BufferedDBBridge
+from dilu.scenario.sharedScenarioDB import SharedDBBridge
+from dilu.scenario.trajectoryStore import TrajectoryWriter
+from dilu.scenario.envPlotter import ScePlotter
+from dilu.scenario.sceneRenderer import SceneRenderer, ScenePainter
+from dilu.scenario.vehicleSnapshot import VehicleSnapshot
+from dilu.scenario.vehicleRecord import VehicleRecord, AHEAD
+from dilu.scenario.spatialIndex import UniformGrid
+from dilu.scenario.networkGeometry import NetworkGeometry
+from dilu.scenario.descriptionBuilder import FragmentCache
+from dilu.scenario.conflictPoints import ConflictTable
+from dilu.scenario.scenarioKey import (
+    KEY_LANE_GROUPS, MISSING_GAP, NO_CONFLICT_TIME
+)
+
+
+# 一帧内 describe、plotSce 和 DBBridge 共享的邻车数量上限，
+# 较少的查询直接从这份结果里截取
+MAX_SURROUND_VEHICLES = 10
+
+# 周车描述里车道关系之后的部分，依次是位置、速度、加速度和车道内的位置
+SV_STATE_LANE_POSITION = "The position of it is `({:.2f}, {:.2f})`, speed is {:.2f} m/s, acceleration is {:.2f} m/s^2, and lane position is {:.2f} m.\n"
+
+
+# DiscreteMetaAction.get_available_actions 依次追加可用动作的顺序
+AVAILABLE_ACTION_ORDER = ('IDLE', 'LANE_LEFT', 'LANE_RIGHT', 'FASTER', 'SLOWER')
+
+AVAILABLE_ACTIONS_HEADER = 'Your available actions are: \n'
+
+# 一个动作子集：(按 get_available_actions 顺序排列的动作, 描述文本, 结构化的动作列表)
+ActionsEntry = Tuple[
+    Tuple[int, ...], str, Tuple[Dict[str, Union[int, str]], ...]
+]
+
+
+def actionMask(actions: Iterable[int]) -> int:
+    mask = 0
+    for action in actions:
+        mask |= 1 << action
+    return mask
+
+
+def buildActionsTable(
+        actionNames: Dict[int, str], actionsDescription: Dict[int, str],
+        reminder: str = ''
+) -> Dict[int, ActionsEntry]:
+    # 以位掩码为键，列出所有动作子集（5 个动作共 32 种）的可用动作描述
+    known = sorted(
+        (
+            action for action, name in actionNames.items()
+            if action in actionsDescription and name in AVAILABLE_ACTION_ORDER
+        ),
+        key=lambda action: AVAILABLE_ACTION_ORDER.index(actionNames[action])
+    )
+    table: Dict[int, ActionsEntry] = {}
+    for subset in range(1 << len(known)):
+        actions = tuple(
+            action for i, action in enumerate(known) if subset >> i & 1
+        )
+        text = AVAILABLE_ACTIONS_HEADER + ''.join(
+            actionsDescription[action] + ' Action_id: ' + str(action) + '\n'
+            for action in actions
+        ) + reminder
+        options = tuple(
+            {
+                'id': action, 'name': actionNames[action],
+                'description': actionsDescription[action]
+            }
+            for action in actions
+        )
+        table[actionMask(actions)] = (actions, text, options)
+    return table
+
+
+class ScenarioPlugin:
+    # 一个场景和 EnvScenarioCore 不同的地方：描述用的文本、危险区域的大小、
+    # 周车的车道分类和 describe 的流程。EnvScenario 初始化时按 envType 选出插件，
+    # 之后每一帧都不再判断当前是哪种场景
+    envTypes: Tuple[str, ...] = ()
+
+    actionsDescription: Dict[int, str] = {}
+    # 动作编号到 DiscreteMetaAction 动作名的映射（即各场景的 ACTIONS_ALL）
+    actionNames: Dict[int, str] = {}
+    # 附在可用动作描述后面的固定提示
+    actionsReminder = ''
+    # 子类定义时由 buildActionsTable 生成
+    actionsTable: Dict[int, ActionsEntry] = {}
+    # 危险区域的两个矩形，(横向, 纵向) 的半宽
+    dangerArea: Tuple[Tuple[float, float], ...] = ((3, 17.5), (2, 2.5))
+
+    laneLeads: Dict[str, str] = {
+        'current lane': "- Car `{}` is driving on the same lane as you and {}. ",
+        'right lane': "- Car `{}` is driving on the lane to your right and {}. ",
+        'left lane': "- Car `{}` is driving on the lane to your left and {}. ",
+        'target lane': "- Vehicle `{}` is driving on your target lane and {}. "
+    }
+    # None 表示描述周车在车道内的位置
+    svState: Optional[str] = None
+    svPrefix = "Other vehicles are driving around you, and below is their basic information:\n"
+    noSVDescription = "There are no other vehicles driving near you, so you can drive completely according to your own ideas.\n"
+    noValidSVDescription = 'No other vehicles driving near you, so you can drive completely according to your own ideas.\n'
+    # True 时按 processSVsNormalLane 选出的顺序描述周车，否则按距离顺序
+    describeValidOrder = False
+
+    def __init__(self, scenario: 'EnvScenarioCore') -> None:
+        self.scenario = scenario
+
+    def __init_subclass__(cls, **kwargs) -> None:
+        super().__init_subclass__(**kwargs)
+        # 模块导入时为每个插件生成一次可用动作描述表
+        cls.actionsTable = buildActionsTable(
+            cls.actionNames, cls.actionsDescription, cls.actionsReminder
+        )
+
+    @classmethod
+    def matches(cls, envType: str) -> bool:
+        return any(name in envType.lower() for name in cls.envTypes)
+
+    def actionsEntry(self, availableActions: List[int]) -> Optional[ActionsEntry]:
+        # 顺序与表里不同（不是 DiscreteMetaAction 的动作空间）时返回 None
+        entry = self.actionsTable.get(actionMask(availableActions))
+        if entry is not None and entry[0] == tuple(availableActions):
+            return entry
+        return None
+
+    def describeActions(self, availableActions: List[int]) -> str:
+        avaliableActionDescription = AVAILABLE_ACTIONS_HEADER
+        for action in availableActions:
+            avaliableActionDescription += self.actionsDescription[action] + ' Action_id: ' + str(
+                action) + '\n'
+        return avaliableActionDescription
+
+    def availableActionsDescription(self) -> str:
+        availableActions = self.scenario.env.get_available_actions()
+        entry = self.actionsEntry(availableActions)
+        if entry is not None:
+            return entry[1]
+        return self.describeActions(availableActions) + self.actionsReminder
+
+    def availableActionsList(self) -> List[Dict[str, Union[int, str]]]:
+        availableActions = self.scenario.env.get_available_actions()
+        entry = self.actionsEntry(availableActions)
+        if entry is not None:
+            return [dict(option) for option in entry[2]]
+        return [
+            {
+                'id': action, 'name': self.actionNames.get(action, ''),
+                'description': self.actionsDescription[action]
+            }
+            for action in availableActions
+            if action in self.actionsDescription
+        ]
+
+    def isInJunction(self, vehicle: Union[IDMVehicle, MDPVehicle]) -> bool:
+        return False
+
+    def isOnRoundabout(self, vehicle: Union[IDMVehicle, MDPVehicle]) -> bool:
+        return False
+
+    def getLanePosition(self, vehicle: Union[IDMVehicle, MDPVehicle]) -> float:
+        currentLane = self.scenario.network.get_lane(vehicle.lane_index)
+        if not isinstance(currentLane, StraightLane):
+            raise ValueError(
+                "The vehicle is in a junction, can't get lane position"
+            )
+        else:
+            return np.linalg.norm(vehicle.position - currentLane.start)
+
+    def processNormalLane(self, lidx: LaneIndex) -> str:
+        scenario = self.scenario
+        ego = scenario.ego
+        sideLanes = scenario.geometry.allSideLanes(lidx, scenario.network)
+        numLanes = len(sideLanes)
+        if numLanes == 1:
+            description = "You are driving on a road with only one lane, you can't change lane. "
+        else:
+            egoLaneRank = lidx[2]
+            if egoLaneRank == 0:
+                description = f"You are driving on a road with {numLanes} lanes, occupying the leftmost lane. "
+            elif egoLaneRank == numLanes - 1:
+                description = f"You are driving on a road with {numLanes} lanes, occupying the rightmost lane. "
+            else:
+                laneRankDict = {
+                    1: 'second',
+                    2: 'third',
+                    3: 'fourth'
+                }
+                description = f"You are driving on a {numLanes}-lane highway, occupying the {laneRankDict[egoLaneRank]} lane from the left."
+
+        description += f"You are located at coordinates `({ego.position[0]:.2f}, {ego.position[1]:.2f})`. Your vehicle is moving at {ego.speed:.2f} m/s with an acceleration of {ego.action['acceleration']:.2f} m/s^2. Your lateral position within the lane is {scenario.getLanePosition(ego):.2f} m.\n"
+        return description
+
+    def processNextLane(self, currentLaneIndex: LaneIndex) -> Optional[LaneIndex]:
+        # processSVsNormalLane 用来划分 target lane 的下一条车道
+        return self.scenario.nextLane(currentLaneIndex)
+
+    def describeNextLane(self, currentLaneIndex: LaneIndex) -> Optional[LaneIndex]:
+        # describeSVNormalLane 用来判断周车是否在 target lane 上的下一条车道
+        return self.scenario.nextLane(currentLaneIndex)
+
+    def classifySVs(
+            self, snapshot: VehicleSnapshot, members: np.ndarray,
+            currentLaneIndex: LaneIndex, sideLanes: List[LaneIndex],
+            nextLane: Optional[LaneIndex]
+    ) -> Dict[str, np.ndarray]:
+        return {
+            k: mask & members
+            for k, mask in snapshot.laneGroupMasks(
+                currentLaneIndex, len(sideLanes), nextLane
+            ).items()
+        }
+
+    def keepsAllSVs(self, laneGroup: str) -> bool:
+        # 返回 True 的车道分组保留所有车辆，其他分组只保留前后最近的两辆
+        return False
+
+    def rightLaneLead(
+            self, lidx: LaneIndex, currentLaneIndex: LaneIndex
+    ) -> str:
+        return self.laneLeads['right lane']
+
+    def otherLaneLead(self, lidx: LaneIndex) -> Optional[str]:
+        # 不在 ego 所在 road 上、也不在 nextLane 上的车辆默认不描述
+        return None
+
+    def laneLead(
+            self, lidx: LaneIndex, currentLaneIndex: LaneIndex,
+            sideLanes: List[LaneIndex], nextLane: Optional[LaneIndex]
+    ) -> Optional[str]:
+        # 首先判断车辆是不是和 ego 在同一条 road 上
+        #   如果在同一条 road 上，则判断在哪条 lane 上
+        #   如果不在同一条 road 上，则判断是否在 next_lane 上
+        if lidx in sideLanes:
+            if lidx == currentLaneIndex:
+                return self.laneLeads['current lane']
+            laneRelative = lidx[2] - currentLaneIndex[2]
+            if laneRelative == 1:
+                # laneRelative = 1 表示车辆在 ego 的右侧车道上行驶
+                return self.rightLaneLead(lidx, currentLaneIndex)
+            elif laneRelative == -1:
+                # laneRelative = -1 表示车辆在 ego 的左侧车道上行驶
+                return self.laneLeads['left lane']
+            # laneRelative 是其他的值表示在更远的车道上，不需要考虑
+            return None
+        elif lidx == nextLane:
+            return self.laneLeads['target lane']
+        return self.otherLaneLead(lidx)
+
+    def describe(self, currentLaneIndex: LaneIndex) -> str:
+        roadCondition = self.processNormalLane(currentLaneIndex)
+        SVDescription = self.scenario.describeSVNormalLane(currentLaneIndex)
+        return roadCondition + SVDescription
+
+
+def selectPlugin(
+        plugins: Tuple[Type[ScenarioPlugin], ...],
+        defaultPlugin: Type[ScenarioPlugin], envType: str
+) -> Type[ScenarioPlugin]:
+    for plugin in plugins:
+        if plugin.matches(envType):
+            return plugin
+    return defaultPlugin
+
+
+class EnvScenarioCore:
+    # 所有场景共用的邻车查询、周车快照、数据库记录和绘图，
+    # 各场景只在 plugins 里注册自己的 ScenarioPlugin
+    plugins: Tuple[Type[ScenarioPlugin], ...] = ()
+    defaultPlugin: Type[ScenarioPlugin] = ScenarioPlugin
+
+    def __init__(
+            self, env: AbstractEnv, envType: str,
+            seed: int, database: str = None, bufferedDB: bool = False,
+            sharedDB: bool = False, runID: str = '',
+            trajectoryDir: str = None,
+            renderer: Optional[Union[SceneRenderer, ScenePainter]] = None,
+            networkCacheDir: Union[str, bool, None] = None
+    ) -> None:
+        # 路网的静态描述（车道组、车道类型和长度），同样配置的环境只生成一次。
+        # networkCacheDir 为 None 时缓存在默认目录，为 False 时只缓存在内存里
+        self.attachEnv(env, envType, NetworkGeometry.forEnv(
+            env, envType, networkCacheDir
+        ))
+
+        self.plotter = ScePlotter()
+        # 给定 renderer 时 plotSce 交给它画图：SceneRenderer 由渲染进程异步生成，
+        # ScenePainter 在当前进程里用缓存的路网背景同步生成
+        self.renderer = renderer
+        if sharedDB:
+            # 多个 EnvScenario 共用一个数据库，已有的文件不能删除；
+            # 每个 episode 用 episodeID 区分，路网按哈希只写一次
+            self.database = database or 'scenarios.db'
+            self.dbBridge = SharedDBBridge(
+                self.database, env, runID, scenario=type(self).__module__,
+                networkCacheDir=networkCacheDir
+            )
+        else:
+            if database:
+                self.database = database
+            else:
+                self.database = datetime.strftime(
+                    datetime.now(), '%Y-%m-%d_%H-%M-%S'
+                ) + '.db'
+
+            if os.path.exists(self.database):
+                os.remove(self.database)
+
+            if bufferedDB:
+                # 车辆和 prompt 先缓存在内存里，由后台线程批量写入数据库
+                self.dbBridge = BufferedDBBridge(
+                    self.database, env, scenario=type(self).__module__,
+                    networkCacheDir=networkCacheDir
+                )
+            else:
+                self.dbBridge = DBBridge(self.database, env)
+
+        self.dbBridge.createTable()
+        self.dbBridge.insertSimINFO(envType, seed)
+        # 每个 episode 的数据库都是新文件，需要写入路网；共享数据库里已有这个路网时跳过
+        if not (isinstance(self.dbBridge, SharedDBBridge) and self.dbBridge.hasNetwork()):
+            self.dbBridge.insertNetwork()
+
+        # 可选的列式轨迹文件，和数据库同时写入，用于跨 episode 的聚合分析
+        self.trajectory: Optional[TrajectoryWriter] = None
+        if trajectoryDir:
+            self.trajectory = TrajectoryWriter(
+                trajectoryDir, envType, seed,
+                getattr(self.dbBridge, 'episodeID', None),
+                geometry=self.geometry, scenario=type(self).__module__
+            )
+
+    def attachEnv(
+            self, env: AbstractEnv, envType: str, geometry: NetworkGeometry
+    ) -> None:
+        self.env = env
+        self.envType = envType
+
+        self.ego: MDPVehicle = env.vehicle
+
+        self.road: Road = env.road
+        self.network: RoadNetwork = self.road.network
+        self.geometry = geometry
+
+        self.plugin = selectPlugin(
+            self.plugins, self.defaultPlugin, envType
+        )(self)
+        # 下面的四个变量用来判断车辆是否在 ego 的危险视距内
+        (lateral1, longitudinal1), (lateral2, longitudinal2) = self.plugin.dangerArea
+        self.theta1 = math.atan(lateral1/longitudinal1)
+        self.theta2 = math.atan(lateral2/longitudinal2)
+        self.radius1 = np.linalg.norm([lateral1, longitudinal1])
+        self.radius2 = np.linalg.norm([lateral2, longitudinal2])
+
+        # 以 env.steps 标识决策帧，同一帧内的邻车查询和周车快照只计算一次
+        self.frameSteps: Optional[int] = None
+        self.frameCount: int = 0
+        self.frameVehicles: List[IDMVehicle] = []
+        self.spatialIndex: Optional[UniformGrid] = None
+        self.snapshot: Optional[VehicleSnapshot] = None
+        self.conflictTable: Optional[ConflictTable] = None
+        self.frameNextLanes: Dict[Tuple, LaneIndex] = {}
+        # 周车描述片段，上一帧生成过的相同片段直接复用
+        self.fragments = FragmentCache()
+
+    @classmethod
+    def offline(
+            cls, env: AbstractEnv, envType: str, geometry: NetworkGeometry
+    ) -> 'EnvScenarioCore':
+        # 不连接数据库和绘图，只用记录下来的车辆状态重新生成描述，见 replayReader
+        scenario = cls.__new__(cls)
+        scenario.attachEnv(env, envType, geometry)
+        scenario.plotter = None
+        scenario.renderer = None
+        scenario.dbBridge = None
+        scenario.trajectory = None
+        return scenario
+
+    def refreshFrame(self, vehicles_count: int = MAX_SURROUND_VEHICLES) -> None:
+        if self.frameSteps != self.env.steps:
+            # 每帧重建一次空间索引，邻车查询只检查 ego 附近的网格
+            self.spatialIndex = UniformGrid(
+                self.road.vehicles, self.env.PERCEPTION_DISTANCE
+            )
+            self.frameSteps = self.env.steps
+            self.frameCount = 0
+            self.frameNextLanes = {}
+            self.fragments.startFrame()
+        if vehicles_count > self.frameCount:
+            count = max(vehicles_count, MAX_SURROUND_VEHICLES)
+            self.frameVehicles = self.spatialIndex.closeVehiclesTo(
+                self.ego, self.env.PERCEPTION_DISTANCE,
+                count=count-1, see_behind=True,
+                sort='sorted'
+            )
+            self.frameCount = count
+            self.snapshot = VehicleSnapshot(self.ego, self.frameVehicles)
+
+    def nextLane(self, currentLaneIndex: LaneIndex) -> LaneIndex:
+        # 同一帧内 next_lane 的结果只计算一次。next_lane 会弹出 route 中已经走完的
+        # 路段，所以调用前后的 route 都作为缓存的键
+        self.refreshFrame(0)
+        key = (currentLaneIndex, tuple(self.ego.route or ()))
+        if key not in self.frameNextLanes:
+            nextLane = self.network.next_lane(
+                currentLaneIndex, self.ego.route, self.ego.position
+            )
+            self.frameNextLanes[key] = nextLane
+            self.frameNextLanes[
+                (currentLaneIndex, tuple(self.ego.route or ()))
+            ] = nextLane
+        return self.frameNextLanes[key]
+
+    def getSurrendVehicles(self, vehicles_count: int) -> List[IDMVehicle]:
+        # close_vehicles_to 的结果按距离稳定排序，截取前 k 辆与直接查询 k 辆的结果相同
+        self.refreshFrame(vehicles_count)
+        return self.frameVehicles[:vehicles_count-1]
+
+    def plotSce(self, fileName: str) -> None:
+        SVs = self.getSurrendVehicles(10)
+        if self.renderer is not None:
+            self.renderer.submit(self.geometry, SVs, self.ego, fileName)
+            return
+        self.plotter.plotSce(self.network, SVs, self.ego, fileName)
+
+    def getUnitVector(self, radian: float) -> Tuple[float, float]:
+        return (
+            math.cos(radian), math.sin(radian)
+        )
+
+    def isInJunction(self, vehicle: Union[IDMVehicle, MDPVehicle]) -> bool:
+        return self.plugin.isInJunction(vehicle)
+
+    def getLanePosition(self, vehicle: Union[IDMVehicle, MDPVehicle]) -> float:
+        return self.plugin.getLanePosition(vehicle)
+
+    def availableActionsDescription(self) -> str:
+        return self.plugin.availableActionsDescription()
+
+    def availableActionsList(self) -> List[Dict[str, Union[int, str]]]:
+        return self.plugin.availableActionsList()
+
+    def processNormalLane(self, lidx: LaneIndex) -> str:
+        return self.plugin.processNormalLane(lidx)
+
+    def getSVRelativeState(self, sv: IDMVehicle) -> str:
+        # CAUTION: 这里有一个问题，pygame 的 y 轴是上下颠倒的，向下是 y 轴的正方向。
+        #       因此，在 highway-v0 上，车辆向左换道实际上是向右运动。因此判断车辆相
+        #       对自车的位置，不能用向量来算，直接根据车辆在哪条车道上来判断是比较合适
+        #       的，向量只能用来判断车辆在 ego 的前方还是后方
+        if self.getRecord(sv).relation == AHEAD:
+            return 'is ahead of you'
+        else:
+            return 'is behind of you'
+
+    def getSnapshot(self, SVs: List[IDMVehicle]) -> VehicleSnapshot:
+        # 当前帧的快照包含这些车辆时直接复用，否则临时建一个
+        self.refreshFrame()
+        if self.snapshot.covers(SVs):
+            return self.snapshot
+        return VehicleSnapshot(self.ego, SVs)
+
+    def getRecord(self, sv: IDMVehicle) -> VehicleRecord:
+        snapshot = self.getSnapshot([sv])
+        return snapshot.records()[snapshot.rowOf(sv)]
+
+    def getFrameRecords(
+            self, vehicles_count: int = MAX_SURROUND_VEHICLES
+    ) -> Tuple[VehicleRecord, List[VehicleRecord]]:
+        # ego 和 getSurrendVehicles(vehicles_count) 中车辆的记录，顺序相同
+        SVs = self.getSurrendVehicles(vehicles_count)
+        return self.snapshot.egoRecord(), self.snapshot.records()[:len(SVs)]
+
+    def getVehDis(self, veh: IDMVehicle):
+        snapshot = self.getSnapshot([veh])
+        return snapshot.distances[snapshot.rowOf(veh)]
+
+    def getClosestSV(self, SVs: List[IDMVehicle]):
+        if SVs:
+            snapshot = self.getSnapshot(SVs)
+            distances = snapshot.distances[snapshot.rowsOf(SVs)]
+            return SVs[int(np.argmin(distances))]
+        else:
+            return None
+
+    def pickSVs(
+            self, snapshot: VehicleSnapshot, rows: Tuple[Optional[int], ...]
+    ) -> Tuple[Optional[IDMVehicle], ...]:
+        return tuple(
+            snapshot.vehicles[row] if row is not None else None
+            for row in rows
+        )
+
+    def processSingleLaneSVs(self, SingleLaneSVs: List[IDMVehicle]):
+        # 返回当前车道上，前方最近的车辆和后方最近的车辆，如果没有，则为 None
+        if SingleLaneSVs:
+            snapshot = self.getSnapshot(SingleLaneSVs)
+            return self.pickSVs(
+                snapshot, snapshot.closestAheadBehind(
+                    snapshot.memberMask(SingleLaneSVs)
+                )
+            )
+        else:
+            return None, None
+
+    def processSVsNormalLane(
+            self, SVs: List[IDMVehicle], currentLaneIndex: LaneIndex
+    ):
+        # 目前 description 中的车辆有些太多了，需要处理一下，只保留最靠近 ego 的几辆车
+        nextLane = self.plugin.processNextLane(currentLaneIndex)
+        sideLanes = self.geometry.allSideLanes(currentLaneIndex, self.network)
+        snapshot = self.getSnapshot(SVs)
+        members = snapshot.memberMask(SVs)
+        classifiedSVs = self.plugin.classifySVs(
+            snapshot, members, currentLaneIndex, sideLanes, nextLane
+        )
+
+        validVehicles: List[IDMVehicle] = []
+        existVehicles: Dict[str, bool] = {}
+        for k, mask in classifiedSVs.items():
+            existVehicles[k] = bool(mask.any())
+            if self.plugin.keepsAllSVs(k):
+                validVehicles.extend(
+                    snapshot.vehicles[row] for row in np.flatnonzero(mask)
+                )
+                continue
+            ahead, behind = self.pickSVs(
+                snapshot, snapshot.closestAheadBehind(mask)
+            )
+            if ahead:
+                validVehicles.append(ahead)
+            if behind:
+                validVehicles.append(behind)
+
+        return validVehicles, existVehicles
+
+    def describeSVState(self, sv: IDMVehicle, lead: str) -> str:
+        # lead 是车辆和 ego 的车道关系，后面接车辆的位置、速度和加速度
+        record = self.getRecord(sv)
+        lead = self.fragments.render(
+            lead, record.id, self.getSVRelativeState(sv)
+        )
+        if self.plugin.svState is not None:
+            return lead + self.fragments.render(
+                self.plugin.svState,
+                record.x, record.y, record.speed, record.acceleration
+            )
+        return lead + self.fragments.render(
+            SV_STATE_LANE_POSITION,
+            record.x, record.y, record.speed, record.acceleration,
+            self.getLanePosition(sv)
+        )
+
+    def describeSVNormalLane(self, currentLaneIndex: LaneIndex) -> str:
+        # 当 ego 在 StraightLane 上时，车道信息是重要的，需要处理车道信息
+        # 不在 ego 所在 road 上、也不在 nextLane 上的车辆由插件决定是否描述，
+        # 在描述范围内的车辆统计它关于 ego 的相对运动状态
+        plugin = self.plugin
+        nextLane = plugin.describeNextLane(currentLaneIndex)
+        sideLanes = self.geometry.allSideLanes(currentLaneIndex, self.network)
+        surroundVehicles = self.getSurrendVehicles(10)
+        validVehicles, existVehicles = self.processSVsNormalLane(
+            surroundVehicles, currentLaneIndex
+        )
+        if not surroundVehicles:
+            return plugin.noSVDescription
+
+        if plugin.describeValidOrder:
+            describedVehicles = validVehicles
+        else:
+            validIDs = {id(sv) for sv in validVehicles}
+            describedVehicles = [
+                sv for sv in surroundVehicles if id(sv) in validIDs
+            ]
+        SVDescription = []
+        for sv in describedVehicles:
+            lead = plugin.laneLead(
+                sv.lane_index, currentLaneIndex, sideLanes, nextLane
+            )
+            if lead is None:
+                continue
+            SVDescription.append(self.describeSVState(sv, lead))
+
+        if SVDescription:
+            return plugin.svPrefix + ''.join(SVDescription)
+        else:
+            return plugin.noValidSVDescription
+
+    def isInDangerousArea(self, sv: IDMVehicle) -> bool:
+        snapshot = self.getSnapshot([sv])
+        dangerous = snapshot.dangerousMask(
+            self.theta1, self.theta2, self.radius1, self.radius2
+        )
+        return bool(dangerous[snapshot.rowOf(sv)])
+
+    def getConflictTable(self, SVs: List[IDMVehicle]) -> ConflictTable:
+        # 同一个快照的冲突点只计算一次
+        snapshot = self.getSnapshot(SVs)
+        if self.conflictTable is None or self.conflictTable.snapshot is not snapshot:
+            self.conflictTable = ConflictTable(snapshot)
+        return self.conflictTable
+
+    def getCollisionPoint(self, sv: IDMVehicle) -> Optional[np.ndarray]:
+        # 原来逐车检查冲突点是否在道路上用的是 get_closest_lane_index，
+        # 它总会返回一条车道，所以这里不再单独检查
+        conflicts = self.getConflictTable([sv])
+        return conflicts.conflictPoint(conflicts.snapshot.rowOf(sv))
+
+    def getScenarioKey(self) -> np.ndarray:
+        # 当前帧的定长数值特征，字段顺序见 scenarioKey.KEY_FIELDS，
+        # 经验检索可以直接用它预筛选，不需要先对描述文本做嵌入
+        ego = self.ego
+        currentLaneIndex = ego.lane_index
+        sideLanes = self.geometry.allSideLanes(currentLaneIndex, self.network)
+        SVs = self.getSurrendVehicles(10)
+        snapshot = self.getSnapshot(SVs)
+        # 用 describeNextLane 取 target lane，不会重复打印 processNextLane 的错误信息
+        laneGroups = self.plugin.classifySVs(
+            snapshot, snapshot.memberMask(SVs), currentLaneIndex, sideLanes,
+            self.plugin.describeNextLane(currentLaneIndex)
+        )
+
+        key = [
+            currentLaneIndex[2], len(sideLanes),
+            ego.speed, ego.action['acceleration']
+        ]
+        for group in KEY_LANE_GROUPS:
+            for row in snapshot.closestAheadBehind(laneGroups[group]):
+                if row is None:
+                    key += [MISSING_GAP, 0.0]
+                else:
+                    key += [
+                        snapshot.distances[row],
+                        snapshot.speeds[row] - ego.speed
+                    ]
+
+        conflicts = self.getConflictTable(SVs)
+        times = conflicts.times[conflicts.valid]
+        key += [
+            self.plugin.isInJunction(ego), self.plugin.isOnRoundabout(ego),
+            min(float(times.min()), NO_CONFLICT_TIME)
+            if times.size else NO_CONFLICT_TIME
+        ]
+        return np.array(key, dtype=np.float32)
+
+    def describe(self, decisionFrame: int) -> str:
+        if isinstance(self.dbBridge, (BufferedDBBridge, SharedDBBridge)):
+            # 本模块的数据库直接写入这一帧的车辆记录
+            egoRecord, records = self.getFrameRecords(10)
+            self.dbBridge.insertRecords(
+                decisionFrame, egoRecord, records,
+                getattr(self.ego, 'route', None)
+            )
+        else:
+            surroundVehicles = self.getSurrendVehicles(10)
+            self.dbBridge.insertVehicle(decisionFrame, surroundVehicles)
+        if self.trajectory is not None:
+            self.trajectory.append(
+                decisionFrame, *self.getFrameRecords(10),
+                route=getattr(self.ego, 'route', None)
+            )
+        return self.describeFrame()
+
+    def describeFrame(self) -> str:
+        currentLaneIndex: LaneIndex = self.ego.lane_index
+        return self.plugin.describe(currentLaneIndex)
+
+    def promptsCommit(
+        self, decisionFrame: int, vectorID: str, done: bool,
+        description: str, fewshots: str, thoughtsAndAction: str,
+        cached: bool = False
+    ):
+        # cached 表示决策来自 decisionCache 而不是 LLM，
+        # 只有本模块的数据库（缓冲模式和共享数据库）有这一列
+        if isinstance(self.dbBridge, (BufferedDBBridge, SharedDBBridge)):
+            self.dbBridge.insertPrompts(
+                decisionFrame, vectorID, done, description,
+                fewshots, thoughtsAndAction, cached
+            )
+        else:
+            self.dbBridge.insertPrompts(
+                decisionFrame, vectorID, done, description,
+                fewshots, thoughtsAndAction
+            )
+
+    def close(self) -> None:
+        # 缓冲模式和共享数据库模式下把还没有写入数据库的车辆和 prompt 全部写完
+        if isinstance(self.dbBridge, (BufferedDBBridge, SharedDBBridge)):
+            self.dbBridge.close()
+        if self.trajectory is not None:
+            self.trajectory.close()
@@ -0,0 +1,207 @@
+from typing import List, Tuple, Optional, Union, Dict, Callable, Iterator, Type
+import importlib
+import multiprocessing
+import multiprocessing.util
+import os
+
+import gymnasium as gym
+import highway_env
+from highway_env.envs.common.abstract import AbstractEnv
+
+from dilu.scenario.envScenarioCore import EnvScenarioCore
+from dilu.scenario.replayReader import scenarioModule
+from dilu.scenario.sharedScenarioDB import ScenarioDatabase
+
+
+# (envType, seed)，或者 (envType, seed, EnvScenario 模块) 指定生成描述的模块
+EpisodeTask = Union[Tuple[str, int], Tuple[str, int, str]]
+# policy(scenario, description, availableActions) -> action
+Policy = Callable[[EnvScenarioCore, str, List[int]], int]
+
+
+def idlePolicy(
+        scenario: EnvScenarioCore, description: str, availableActions: List[int]
+) -> int:
+    # 没有接入 LLM 时的默认策略：保持当前车道和速度
+    idle = scenario.env.action_type.actions_indexes.get('IDLE')
+    return idle if idle in availableActions else availableActions[0]
+
+
+class Episode:
+    # 一个正在运行的 episode：环境、EnvScenario 和已经做出的决策
+    def __init__(
+            self, envType: str, seed: int, module: str, env: gym.Env,
+            scenario: EnvScenarioCore, database: str, steps: int
+    ) -> None:
+        self.envType = envType
+        self.seed = seed
+        self.module = module
+        self.env = env
+        self.scenario = scenario
+        self.database = database
+        self.steps = steps
+        self.frame = 0
+        self.frames: List[Dict] = []
+        self.done = False
+        self.truncated = False
+
+    @property
+    def finished(self) -> bool:
+        return self.done or self.truncated or self.frame >= self.steps
+
+    def observe(self) -> Tuple[str, List[int]]:
+        description = self.scenario.describe(self.frame)
+        return description, self.env.unwrapped.get_available_actions()
+
+    def step(
+            self, description: str, action: int, response: str = '',
+            vectorID: str = '', fewshots: str = '', cached: bool = False
+    ) -> None:
+        _, _, self.done, self.truncated, _ = self.env.step(action)
+        self.scenario.promptsCommit(
+            self.frame, vectorID, self.done, description, fewshots,
+            response or str(action), cached
+        )
+        self.frames.append({
+            'frame': self.frame,
+            'description': description,
+            'action': int(action),
+            'cached': cached
+        })
+        self.frame += 1
+
+    def result(self) -> Dict:
+        return {
+            'envType': self.envType,
+            'seed': self.seed,
+            'module': self.module,
+            'database': self.database,
+            # 共享数据库里用 episodeID 取出这个 episode 的行
+            'episodeID': getattr(self.scenario.dbBridge, 'episodeID', None),
+            'crashed': bool(self.env.unwrapped.vehicle.crashed),
+            'done': bool(self.done),
+            'truncated': bool(self.truncated),
+            'frames': self.frames
+        }
+
+
+class EpisodeWorker:
+    # 进程池里每个进程一个。进程在多个 episode 之间复用，
+    # highway_env 的导入、环境对象和路网几何（NetworkGeometry.forEnv）每个进程只准备一次
+    def __init__(
+            self, envConfigs: Dict[str, Dict], policy: Policy,
+            databaseDir: str, sharedDB: bool, runID: str,
+            trajectoryDir: Optional[str], steps: int,
+            networkCacheDir: Union[str, bool, None] = None
+    ) -> None:
+        self.envConfigs = envConfigs
+        self.policy = policy
+        self.databaseDir = databaseDir
+        self.sharedDB = sharedDB
+        self.runID = runID
+        self.trajectoryDir = trajectoryDir
+        self.steps = steps
+        self.networkCacheDir = networkCacheDir
+        # 每个 envType 空闲的环境对象
+        self.envs: Dict[str, List[gym.Env]] = {}
+        os.makedirs(databaseDir, exist_ok=True)
+
+    def acquireEnv(self, envType: str) -> gym.Env:
+        # 同一个 envType 的 episode 用 reset(seed) 复用空闲的环境对象，
+        # 同时运行的 episode（见 asyncDriver）各自占用一个
+        free = self.envs.setdefault(envType, [])
+        if free:
+            return free.pop()
+        return gym.make(envType, config=self.envConfigs.get(envType, {}))
+
+    def releaseEnv(self, envType: str, env: gym.Env) -> None:
+        self.envs[envType].append(env)
+
+    def scenarioClass(self, module: str) -> Type[EnvScenarioCore]:
+        return importlib.import_module(module).EnvScenario
+
+    def databasePath(self, envType: str, seed: int) -> str:
+        if self.sharedDB:
+            return os.path.join(self.databaseDir, 'scenarios.db')
+        return os.path.join(self.databaseDir, f'{envType}-{seed}.db')
+
+    def startEpisode(self, task: EpisodeTask) -> Episode:
+        envType, seed = task[:2]
+        module = task[2] if len(task) > 2 else scenarioModule(envType)
+        env = self.acquireEnv(envType)
+        env.reset(seed=seed)
+        database = self.databasePath(envType, seed)
+        sce = self.scenarioClass(module)(
+            env.unwrapped, envType, seed, database,
+            sharedDB=self.sharedDB, runID=self.runID,
+            trajectoryDir=self.trajectoryDir,
+            networkCacheDir=self.networkCacheDir
+        )
+        return Episode(envType, seed, module, env, sce, database, self.steps)
+
+    def finishEpisode(self, episode: Episode) -> None:
+        episode.scenario.close()
+        self.releaseEnv(episode.envType, episode.env)
+
+    def run(self, task: EpisodeTask) -> Dict:
+        episode = self.startEpisode(task)
+        try:
+            while not episode.finished:
+                description, availableActions = episode.observe()
+                episode.step(description, self.policy(
+                    episode.scenario, description, availableActions
+                ))
+        finally:
+            self.finishEpisode(episode)
+        return episode.result()
+
+
+# 每个工作进程里的 EpisodeWorker，由 initWorker 创建
+worker: Optional[EpisodeWorker] = None
+
+
+def initWorker(*args) -> None:
+    global worker
+    # fork 出来的进程复制了父进程已经打开的共享数据库，但没有复制它的写线程，
+    # 每个工作进程重新打开自己的连接
+    ScenarioDatabase.instances.clear()
+    # 工作进程通过 os._exit 退出，atexit 不会执行，用 Finalize 在退出前关闭写线程
+    multiprocessing.util.Finalize(None, ScenarioDatabase.closeAll, exitpriority=10)
+    worker = EpisodeWorker(*args)
+
+
+def runTask(task: EpisodeTask) -> Dict:
+    return worker.run(task)
+
+
+def runEpisodes(
+        tasks: List[EpisodeTask], envConfigs: Optional[Dict[str, Dict]] = None,
+        policy: Policy = idlePolicy, databaseDir: str = 'episodes',
+        sharedDB: bool = False, runID: str = '',
+        trajectoryDir: Optional[str] = None, steps: int = 100,
+        processes: Optional[int] = None,
+        networkCacheDir: Union[str, bool, None] = None
+) -> Iterator[Dict]:
+    # 把 (envType, seed) 任务分给进程池，每个 episode 结束后立即返回它的结果
+    # （描述、动作、数据库路径和 episodeID），返回顺序是完成的先后顺序。
+    # policy 要能被 pickle，即模块级别的函数
+    args = (
+        envConfigs or {}, policy, databaseDir, sharedDB, runID,
+        trajectoryDir, steps, networkCacheDir
+    )
+    if processes == 1 or len(tasks) <= 1:
+        # 在当前进程里运行，已经打开的共享数据库继续使用
+        yield from map(EpisodeWorker(*args).run, tasks)
+        return
+    # 不用 with：Pool.__exit__ 会 terminate 工作进程，这里先 close 再 join，
+    # 让工作进程正常退出
+    pool = multiprocessing.Pool(processes, initWorker, args)
+    try:
+        yield from pool.imap_unordered(runTask, tasks)
+    except BaseException:
+        pool.terminate()
+        raise
+    else:
+        pool.close()
+    finally:
+        pool.join()
@@ -0,0 +1,377 @@
+from typing import List, Tuple, Optional, Union, Dict, Callable, Sequence
+import json
+import math
+import os
+import re
+import uuid
+import zlib
+
+import numpy as np
+
+from dilu.scenario.networkGeometry import writeAtomic
+from dilu.scenario.promptBuilder import FewShot
+from dilu.scenario.scenarioKey import KEY_DIM, scaleKeys
+
+
+EMBEDDING_DIM = 512
+
+WORD_PATTERN = re.compile(r'[a-z_]+|\d+')
+
+# embed(texts) -> (len(texts), dim) 的向量
+Embedding = Callable[[Sequence[str]], np.ndarray]
+
+
+def hashingEmbedding(texts: Sequence[str], dim: int = EMBEDDING_DIM) -> np.ndarray:
+    # 没有指定向量模型时的默认嵌入：单词和相邻词对按 crc32 散列到 dim 维计数，
+    # 不同进程得到的向量相同
+    vectors = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        words = WORD_PATTERN.findall(text.lower())
+        tokens = words + [a + ' ' + b for a, b in zip(words, words[1:])]
+        buckets = [zlib.crc32(token.encode()) % dim for token in tokens]
+        np.add.at(vectors[row], buckets, 1.0)
+    return vectors
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def topK(scores: np.ndarray, k: int) -> np.ndarray:
+    if len(scores) <= k:
+        return np.argsort(-scores)
+    best = np.argpartition(-scores, k)[:k]
+    return best[np.argsort(-scores[best])]
+
+
+class IVFIndex:
+    # 余弦相似度（metric='cosine'）或欧氏距离（metric='l2'）的倒排索引：
+    # k-means 把向量分到 nlist 个簇，查询时只比较离查询最近的 nprobe 个簇里的向量。
+    # 向量少于 trainSize 时直接逐个比较；数量比上次训练时增长到 4 倍后重新训练
+    def __init__(
+            self, dim: int, nlist: Optional[int] = None, nprobe: int = 8,
+            trainSize: int = 1024, seed: int = 0, metric: str = 'cosine'
+    ) -> None:
+        self.dim = dim
+        self.metric = metric
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.trainSize = trainSize
+        self.seed = seed
+        self.count = 0
+        self.vectors = np.empty((0, dim), dtype=np.float32)
+        self.assignments = np.empty(0, dtype=np.int32)
+        self.centroids: Optional[np.ndarray] = None
+        self.trainedCount = 0
+        self.lists: List[List[int]] = []
+        # 倒排表的数组形式，插入后对应的簇标记为 None，查询用到时再转换
+        self.listArrays: List[Optional[np.ndarray]] = []
+
+    def __len__(self) -> int:
+        return self.count
+
+    def prepare(self, vectors: np.ndarray) -> np.ndarray:
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        return normalize(vectors) if self.metric == 'cosine' else vectors
+
+    def similarity(self, queries: np.ndarray, vectors: np.ndarray) -> np.ndarray:
+        # 越大越相似：余弦相似度，或者负的欧氏距离平方
+        products = queries @ vectors.T
+        if self.metric == 'cosine':
+            return products
+        return (
+            2 * products - np.einsum('ij,ij->i', vectors, vectors)
+            - np.einsum('ij,ij->i', queries, queries)[:, None]
+        )
+
+    def reserve(self, count: int) -> None:
+        if count <= len(self.vectors):
+            return
+        capacity = max(count, 2 * len(self.vectors), 64)
+        vectors = np.empty((capacity, self.dim), dtype=np.float32)
+        vectors[:self.count] = self.vectors[:self.count]
+        assignments = np.full(capacity, -1, dtype=np.int32)
+        assignments[:self.count] = self.assignments[:self.count]
+        self.vectors, self.assignments = vectors, assignments
+
+    def add(self, vectors: np.ndarray) -> np.ndarray:
+        vectors = self.prepare(vectors)
+        rows = np.arange(self.count, self.count + len(vectors))
+        self.reserve(self.count + len(vectors))
+        self.vectors[rows] = vectors
+        self.count += len(vectors)
+        if self.centroids is None:
+            if self.count >= self.trainSize:
+                self.train()
+        elif self.count >= 4 * self.trainedCount:
+            self.train()
+        else:
+            self.assign(rows)
+        return rows
+
+    def train(self) -> None:
+        data = self.vectors[:self.count]
+        nlist = self.nlist or max(1, int(math.sqrt(self.count)))
+        rng = np.random.default_rng(self.seed)
+        sample = data[rng.choice(
+            self.count, min(self.count, 64 * nlist), replace=False
+        )]
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)]
+        for _ in range(10):
+            labels = np.argmax(self.similarity(sample, centroids), axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            counts = np.bincount(labels, minlength=nlist)
+            # 空簇保留原来的中心
+            filled = counts > 0
+            if self.metric == 'cosine':
+                centroids[filled] = normalize(sums[filled])
+            else:
+                centroids[filled] = sums[filled] / counts[filled, None]
+        self.centroids = centroids
+        self.trainedCount = self.count
+        self.lists = [[] for _ in range(nlist)]
+        self.listArrays = [None] * nlist
+        self.assign(np.arange(self.count))
+
+    def assign(self, rows: np.ndarray) -> None:
+        labels = np.argmax(
+            self.similarity(self.vectors[rows], self.centroids), axis=1
+        )
+        self.assignments[rows] = labels
+        for row, label in zip(rows.tolist(), labels.tolist()):
+            self.lists[label].append(row)
+            self.listArrays[label] = None
+
+    def listArray(self, label: int) -> np.ndarray:
+        array = self.listArrays[label]
+        if array is None:
+            array = np.array(self.lists[label], dtype=np.int64)
+            self.listArrays[label] = array
+        return array
+
+    def search(
+            self, queries: np.ndarray, k: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        # 返回 (scores, rows)，形状都是 (len(queries), k)，不足 k 个的位置 row 为 -1
+        queries = self.prepare(queries)
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        rows = np.full((len(queries), k), -1, dtype=np.int64)
+        if self.count == 0:
+            return scores, rows
+        if self.centroids is None:
+            allScores = self.similarity(queries, self.vectors[:self.count])
+            for i, queryScores in enumerate(allScores):
+                best = topK(queryScores, k)
+                scores[i, :len(best)] = queryScores[best]
+                rows[i, :len(best)] = best
+            return scores, rows
+        nprobe = min(self.nprobe, len(self.centroids))
+        probes = np.argpartition(
+            -self.similarity(queries, self.centroids), nprobe - 1, axis=1
+        )[:, :nprobe]
+        for i, query in enumerate(queries):
+            candidates = np.concatenate([
+                self.listArray(label) for label in probes[i]
+            ])
+            candidateScores = self.similarity(
+                query[None], self.vectors[candidates]
+            )[0]
+            best = topK(candidateScores, k)
+            scores[i, :len(best)] = candidateScores[best]
+            rows[i, :len(best)] = candidates[best]
+        return scores, rows
+
+    def save(self, path: str) -> None:
+        arrays = {
+            'vectors': self.vectors[:self.count],
+            'assignments': self.assignments[:self.count],
+            'trainedCount': np.array(self.trainedCount)
+        }
+        if self.centroids is not None:
+            arrays['centroids'] = self.centroids
+        tmpPath = f'{path}.{os.getpid()}.tmp'
+        with open(tmpPath, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmpPath, path)
+
+    def load(self, path: str) -> None:
+        with np.load(path) as data:
+            self.count = 0
+            self.vectors = np.empty((0, self.dim), dtype=np.float32)
+            self.reserve(len(data['vectors']))
+            self.count = len(data['vectors'])
+            self.vectors[:self.count] = data['vectors']
+            self.assignments[:self.count] = data['assignments']
+            self.trainedCount = int(data['trainedCount'])
+            self.centroids = data['centroids'] if 'centroids' in data else None
+        if self.centroids is not None:
+            nlist = len(self.centroids)
+            self.lists = [[] for _ in range(nlist)]
+            self.listArrays = [None] * nlist
+            for row, label in enumerate(self.assignments[:self.count].tolist()):
+                self.lists[label].append(row)
+
+
+def asFewShots(entries: List[Dict]) -> List[FewShot]:
+    return [(entry['human_question'], entry['response']) for entry in entries]
+
+
+class ExperienceMemory:
+    # 按场景类型分别保存经验（场景描述的向量和对应的 human_question / response），
+    # 检索时只在同一场景类型的索引里找最相似的 k 条作为 few-shot。
+    # 添加经验时给出 EnvScenario.getScenarioKey() 的数值特征，就同时建立特征索引：
+    # 检索时先用特征找出 candidates 个近邻，有描述时再按描述向量重新排序，
+    # 没有描述时直接返回特征最近的 k 条，完全不需要嵌入。embed 为 None 时只用特征。
+    # directory 下每个场景类型一个 .json（经验内容），以及描述向量的 .npz 和特征的 .keys.npz
+    def __init__(
+            self, directory: Optional[str] = None,
+            embed: Optional[Embedding] = hashingEmbedding,
+            dim: int = EMBEDDING_DIM, nprobe: int = 8
+    ) -> None:
+        self.directory = directory
+        self.embed = embed
+        self.dim = dim
+        self.nprobe = nprobe
+        self.indexes: Dict[str, IVFIndex] = {}
+        self.keyIndexes: Dict[str, IVFIndex] = {}
+        self.entries: Dict[str, List[Dict]] = {}
+        self.dirty = set()
+        if directory and os.path.isdir(directory):
+            for name in os.listdir(directory):
+                if name.endswith('.json'):
+                    self.load(name[:-len('.json')])
+
+    def __len__(self) -> int:
+        return sum(len(entries) for entries in self.entries.values())
+
+    def hasKeys(self, scenarioType: str) -> bool:
+        return scenarioType in self.keyIndexes
+
+    def addBatch(
+            self, scenarioType: str, descriptions: Sequence[str],
+            fewShots: Sequence[FewShot],
+            vectors: Optional[np.ndarray] = None,
+            keys: Optional[np.ndarray] = None
+    ) -> List[str]:
+        # 两个索引的行号和 entries 一一对应，同一场景类型的经验要么都有特征，要么都没有
+        entries = self.entries.setdefault(scenarioType, [])
+        if entries and (keys is not None) != self.hasKeys(scenarioType):
+            raise ValueError(
+                f"Experiences of {scenarioType} must all have scenario keys or none"
+            )
+        if keys is not None:
+            if scenarioType not in self.keyIndexes:
+                self.keyIndexes[scenarioType] = IVFIndex(
+                    KEY_DIM, nprobe=self.nprobe, metric='l2'
+                )
+            self.keyIndexes[scenarioType].add(scaleKeys(keys))
+        if vectors is None and self.embed is not None:
+            vectors = self.embed(descriptions)
+        if vectors is not None:
+            if scenarioType not in self.indexes:
+                self.indexes[scenarioType] = IVFIndex(self.dim, nprobe=self.nprobe)
+            self.indexes[scenarioType].add(vectors)
+
+        vectorIDs = []
+        for question, response in fewShots:
+            vectorID = uuid.uuid4().hex
+            entries.append({
+                'vectorID': vectorID, 'human_question': question,
+                'response': response
+            })
+            vectorIDs.append(vectorID)
+        self.dirty.add(scenarioType)
+        return vectorIDs
+
+    def add(
+            self, scenarioType: str, description: str, question: str,
+            response: str, key: Optional[np.ndarray] = None
+    ) -> str:
+        return self.addBatch(
+            scenarioType, [description], [(question, response)],
+            keys=None if key is None else [key]
+        )[0]
+
+    def rerank(
+            self, scenarioType: str, vectors: np.ndarray,
+            candidates: np.ndarray, k: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        # 在特征预筛选出的候选经验里按描述向量的相似度取前 k 条
+        index = self.indexes[scenarioType]
+        queries = index.prepare(vectors)
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        rows = np.full((len(queries), k), -1, dtype=np.int64)
+        for i, query in enumerate(queries):
+            valid = candidates[i][candidates[i] >= 0]
+            candidateScores = index.similarity(query[None], index.vectors[valid])[0]
+            best = topK(candidateScores, k)
+            scores[i, :len(best)] = candidateScores[best]
+            rows[i, :len(best)] = valid[best]
+        return scores, rows
+
+    def retrieveBatch(
+            self, scenarioType: str, descriptions: Sequence[str] = (),
+            k: int = 3, vectors: Optional[np.ndarray] = None,
+            keys: Optional[np.ndarray] = None, candidates: int = 32
+    ) -> List[List[Dict]]:
+        queryCount = len(keys) if keys is not None else len(descriptions)
+        if scenarioType not in self.entries:
+            return [[] for _ in range(queryCount)]
+        if vectors is None and descriptions and self.embed is not None:
+            vectors = self.embed(descriptions)
+        if keys is not None and self.hasKeys(scenarioType):
+            keyIndex = self.keyIndexes[scenarioType]
+            if vectors is not None and scenarioType in self.indexes:
+                _, rows = keyIndex.search(scaleKeys(keys), max(k, candidates))
+                scores, rows = self.rerank(scenarioType, vectors, rows, k)
+            else:
+                scores, rows = keyIndex.search(scaleKeys(keys), k)
+        elif vectors is not None and scenarioType in self.indexes:
+            scores, rows = self.indexes[scenarioType].search(vectors, k)
+        else:
+            return [[] for _ in range(queryCount)]
+        entries = self.entries[scenarioType]
+        return [
+            [
+                dict(entries[row], score=float(score))
+                for score, row in zip(queryScores, queryRows) if row >= 0
+            ]
+            for queryScores, queryRows in zip(scores, rows)
+        ]
+
+    def retrieve(
+            self, scenarioType: str, description: str = '', k: int = 3,
+            key: Optional[np.ndarray] = None
+    ) -> List[Dict]:
+        return self.retrieveBatch(
+            scenarioType, [description] if description else [], k,
+            keys=None if key is None else [key]
+        )[0]
+
+    def save(self) -> None:
+        # 只写有新经验的场景类型
+        os.makedirs(self.directory, exist_ok=True)
+        for scenarioType in sorted(self.dirty):
+            path = os.path.join(self.directory, scenarioType)
+            if scenarioType in self.indexes:
+                self.indexes[scenarioType].save(path + '.npz')
+            if scenarioType in self.keyIndexes:
+                self.keyIndexes[scenarioType].save(path + '.keys.npz')
+            writeAtomic(path + '.json', json.dumps(self.entries[scenarioType]))
+        self.dirty.clear()
+
+    def load(self, scenarioType: str) -> None:
+        path = os.path.join(self.directory, scenarioType)
+        if os.path.exists(path + '.npz'):
+            index = IVFIndex(self.dim, nprobe=self.nprobe)
+            index.load(path + '.npz')
+            self.indexes[scenarioType] = index
+        if os.path.exists(path + '.keys.npz'):
+            keyIndex = IVFIndex(KEY_DIM, nprobe=self.nprobe, metric='l2')
+            keyIndex.load(path + '.keys.npz')
+            self.keyIndexes[scenarioType] = keyIndex
+        with open(path + '.json', encoding='utf-8') as f:
+            self.entries[scenarioType] = json.load(f)
@@ -0,0 +1,120 @@
+from typing import List, Tuple, Optional, Union, Dict
+import math
+
+from highway_env.road.road import RoadNetwork, LaneIndex
+from highway_env.road.lane import (
+    AbstractLane, StraightLane, CircularLane, SineLane
+)
+import numpy as np
+
+from dilu.scenario.networkGeometry import NetworkGeometry
+
+
+# 沿中心线采样求包围盒的步长，包围盒向外扩展半个步长就能包住整条中心线
+SAMPLE_STEP = 2.0
+GRID_CELL_SIZE = 20.0
+# 浮点误差的余量，保证下界不会大于真实距离
+EPSILON = 1e-6
+
+
+def laneMargin(lane: AbstractLane) -> float:
+    # lane.distance 是车道坐标下的 |r| + 纵向超出长度，它不小于到中心线的欧氏距离。
+    # SineLane 超出车道两端时横向偏移按超出点的正弦值计算，最多再差 2 倍振幅；
+    # 其他类型的车道无法给出下界，总是作为候选车道
+    if isinstance(lane, SineLane):
+        return SAMPLE_STEP / 2 + 2 * abs(lane.amplitude) + EPSILON
+    if isinstance(lane, (StraightLane, CircularLane)):
+        return SAMPLE_STEP / 2 + EPSILON
+    return math.inf
+
+
+def laneBox(lane: AbstractLane) -> np.ndarray:
+    count = max(int(math.ceil(lane.length / SAMPLE_STEP)), 1) + 1
+    points = np.array([
+        lane.position(s, 0) for s in np.linspace(0, lane.length, count)
+    ])
+    return np.concatenate((points.min(axis=0), points.max(axis=0)))
+
+
+class LaneLocator:
+    # 与 network.get_closest_lane_index 的结果相同。每条车道有一个扩展后的包围盒，
+    # 点到包围盒的距离是车道距离的下界：先用网格取出查询点附近的车道得到当前最近距离，
+    # 再只计算下界不超过这个距离的车道，其余车道不需要计算精确距离
+    boxesCache: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+
+    def __init__(
+            self, network: RoadNetwork,
+            geometry: Optional[NetworkGeometry] = None,
+            cellSize: float = GRID_CELL_SIZE
+    ) -> None:
+        self.network = network
+        self.cellSize = cellSize
+        self.indexes: List[LaneIndex] = []
+        self.lanes: List[AbstractLane] = []
+        for _from, toDict in network.graph.items():
+            for _to, lanes in toDict.items():
+                for _id, lane in enumerate(lanes):
+                    self.indexes.append((_from, _to, _id))
+                    self.lanes.append(lane)
+
+        # 同一个路网的包围盒只计算一次
+        cached = self.boxesCache.get(geometry.hash) if geometry else None
+        if cached is None or len(cached[0]) != len(self.lanes):
+            boxes = np.array(
+                [laneBox(lane) for lane in self.lanes]
+            ).reshape(-1, 4)
+            margins = np.array([laneMargin(lane) for lane in self.lanes])
+            cached = (boxes, margins)
+            if geometry:
+                self.boxesCache[geometry.hash] = cached
+        self.boxes, self.margins = cached
+
+        self.cells: Dict[Tuple[int, int], List[int]] = {}
+        for row in np.flatnonzero(np.isfinite(self.margins)):
+            xMin, yMin = self.cellOf(self.boxes[row, :2] - self.margins[row])
+            xMax, yMax = self.cellOf(self.boxes[row, 2:] + self.margins[row])
+            for cx in range(xMin, xMax + 1):
+                for cy in range(yMin, yMax + 1):
+                    self.cells.setdefault((cx, cy), []).append(int(row))
+
+    def cellOf(self, position: np.ndarray) -> Tuple[int, int]:
+        return (
+            math.floor(position[0] / self.cellSize),
+            math.floor(position[1] / self.cellSize)
+        )
+
+    def lowerBounds(self, position: np.ndarray) -> np.ndarray:
+        x, y = position[0], position[1]
+        dx = np.maximum(
+            np.maximum(self.boxes[:, 0] - x, x - self.boxes[:, 2]), 0
+        )
+        dy = np.maximum(
+            np.maximum(self.boxes[:, 1] - y, y - self.boxes[:, 3]), 0
+        )
+        return np.hypot(dx, dy) - self.margins
+
+    def closestLaneIndex(
+            self, position: np.ndarray, heading: Optional[float] = None
+    ) -> LaneIndex:
+        position = np.asarray(position, dtype=float)
+        distances: Dict[int, float] = {}
+        for row in self.cells.get(self.cellOf(position), []):
+            distances[row] = self.lanes[row].distance_with_heading(
+                position, heading
+            )
+        best = min(distances.values(), default=math.inf)
+
+        bounds = self.lowerBounds(position)
+        for row in np.argsort(bounds, kind='stable'):
+            if bounds[row] > best:
+                break
+            row = int(row)
+            if row not in distances:
+                distances[row] = self.lanes[row].distance_with_heading(
+                    position, heading
+                )
+                best = min(best, distances[row])
+
+        # 距离相同时取遍历顺序靠前的车道，与 np.argmin 一致
+        row = min(distances, key=lambda r: (distances[r], r))
+        return self.indexes[row]
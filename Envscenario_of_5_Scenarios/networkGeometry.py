@@ -0,0 +1,194 @@
+from typing import List, Tuple, Optional, Union, Dict
+import hashlib
+import json
+import os
+
+import highway_env
+from highway_env.envs.common.abstract import AbstractEnv
+from highway_env.road.road import RoadNetwork, LaneIndex
+from highway_env.road.lane import (
+    AbstractLane, StraightLane, CircularLane, SineLane
+)
+import numpy as np
+
+
+# 不认识的车道类型用沿中心线等距采样的点来描述几何形状
+LANE_SAMPLES = 16
+
+
+def defaultNetworkCacheDir() -> str:
+    # 路网描述默认的磁盘缓存目录，多个进程共用。每次调用时读取环境变量
+    return os.environ.get(
+        'DILU_NETWORK_CACHE',
+        os.path.join(os.path.expanduser('~'), '.cache', 'dilu', 'networks')
+    )
+
+
+def laneGeometry(lane: AbstractLane) -> Dict:
+    geometry = {
+        'type': type(lane).__name__,
+        'length': float(lane.length),
+        'width': float(lane.width_at(0)),
+    }
+    if isinstance(lane, SineLane):
+        geometry.update(
+            start=lane.start.tolist(), end=lane.end.tolist(),
+            amplitude=float(lane.amplitude),
+            pulsation=float(lane.pulsation), phase=float(lane.phase)
+        )
+    elif isinstance(lane, StraightLane):
+        geometry.update(start=lane.start.tolist(), end=lane.end.tolist())
+    elif isinstance(lane, CircularLane):
+        geometry.update(
+            center=lane.center.tolist(), radius=float(lane.radius),
+            startPhase=float(lane.start_phase),
+            endPhase=float(lane.end_phase), clockwise=bool(lane.clockwise)
+        )
+    else:
+        geometry['points'] = [
+            lane.position(s, 0).tolist()
+            for s in np.linspace(0, lane.length, LANE_SAMPLES)
+        ]
+    return geometry
+
+
+def describeNetwork(network: RoadNetwork) -> List[Dict]:
+    # 按 graph 的遍历顺序列出所有车道，同样的环境配置得到同样的列表
+    return [
+        {'lane': [_from, _to, _id], **laneGeometry(lane)}
+        for _from, toDict in network.graph.items()
+        for _to, lanes in toDict.items()
+        for _id, lane in enumerate(lanes)
+    ]
+
+
+def networkHash(description: List[Dict]) -> str:
+    # 内容寻址：几何形状完全相同的路网得到同一个哈希值
+    text = json.dumps(description, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def configKey(env: AbstractEnv, envType: str) -> str:
+    # highway / merge / intersection / roundabout / racetrack 的路网只由环境类型、
+    # 配置和 highway_env 的版本决定，与随机种子无关
+    text = json.dumps(
+        {
+            'env': type(env).__name__, 'envType': envType,
+            'config': env.config, 'version': highway_env.__version__
+        },
+        sort_keys=True, default=str
+    )
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def networkFingerprint(network: RoadNetwork) -> str:
+    # 比完整的路网描述便宜得多的内容哈希：每条车道的编号、类型、长度、宽度和两端的位置，
+    # 用来确认缓存的描述就是当前的路网
+    values = []
+    for _from, toDict in network.graph.items():
+        for _to, lanes in toDict.items():
+            for _id, lane in enumerate(lanes):
+                values.append([
+                    _from, _to, _id, type(lane).__name__,
+                    float(lane.length), float(lane.width_at(0)),
+                    *lane.position(0, 0).tolist(),
+                    *lane.position(lane.length, 0).tolist()
+                ])
+    text = json.dumps(values, separators=(',', ':'))
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def writeAtomic(path: str, text: str) -> None:
+    # 先写临时文件再替换，其他进程不会读到写了一半的文件
+    tmpPath = f'{path}.{os.getpid()}.tmp'
+    with open(tmpPath, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmpPath, path)
+
+
+class NetworkGeometry:
+    # 路网的静态描述：每条车道的类型、长度、几何形状，以及每条 road 的
+    # 车道组（即 all_side_lanes 的结果）。按环境类型和配置缓存在内存和磁盘上，
+    # 每个 episode 开始时只需要查一次缓存，并用 networkFingerprint 确认缓存的是当前的路网
+    memory: Dict[str, 'NetworkGeometry'] = {}
+
+    def __init__(
+            self, description: List[Dict], netHash: Optional[str] = None,
+            fingerprint: Optional[str] = None
+    ) -> None:
+        self.description = description
+        self.hash = netHash or networkHash(description)
+        # 生成描述时路网的 networkFingerprint，从数据库或轨迹目录读出的描述没有
+        self.fingerprint = fingerprint
+        self.laneTypes: Dict[LaneIndex, str] = {}
+        self.laneLengths: Dict[LaneIndex, float] = {}
+        self.sideLanes: Dict[Tuple[str, str], List[LaneIndex]] = {}
+        for entry in description:
+            lidx = tuple(entry['lane'])
+            self.laneTypes[lidx] = entry['type']
+            self.laneLengths[lidx] = entry['length']
+            self.sideLanes.setdefault(lidx[:2], []).append(lidx)
+        self.laneCount = len(description)
+
+    @classmethod
+    def fromNetwork(cls, network: RoadNetwork) -> 'NetworkGeometry':
+        return cls(
+            describeNetwork(network), fingerprint=networkFingerprint(network)
+        )
+
+    @classmethod
+    def forEnv(
+            cls, env: AbstractEnv, envType: str,
+            cacheDir: Union[str, bool, None] = None
+    ) -> 'NetworkGeometry':
+        # cacheDir 为 None 时使用 defaultNetworkCacheDir()，为 False 时只缓存在内存里
+        if cacheDir is None:
+            cacheDir = defaultNetworkCacheDir()
+        key = configKey(env, envType)
+        network = env.road.network
+        fingerprint = networkFingerprint(network)
+        geometry = cls.memory.get(key)
+        if (geometry is None or geometry.fingerprint != fingerprint) and cacheDir:
+            geometry = cls.load(cacheDir, key)
+        # 内容对不上说明缓存的不是这个路网（比如生成路网的代码改变了），重新生成
+        if geometry is None or geometry.fingerprint != fingerprint:
+            geometry = cls.fromNetwork(network)
+            if cacheDir:
+                geometry.save(cacheDir, key)
+        cls.memory[key] = geometry
+        return geometry
+
+    @classmethod
+    def load(cls, cacheDir: str, key: str) -> Optional['NetworkGeometry']:
+        # 缓存读不出来时当作没有命中，不影响仿真
+        # .key 文件的内容是路网哈希和 networkFingerprint，旧格式的文件只有哈希
+        try:
+            with open(os.path.join(cacheDir, key + '.key')) as f:
+                netHash, fingerprint = f.read().split()
+            with open(os.path.join(cacheDir, netHash + '.json')) as f:
+                description = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return cls(description, netHash, fingerprint)
+
+    def save(self, cacheDir: str, key: str) -> None:
+        try:
+            os.makedirs(cacheDir, exist_ok=True)
+            descriptionPath = os.path.join(cacheDir, self.hash + '.json')
+            if not os.path.exists(descriptionPath):
+                writeAtomic(descriptionPath, json.dumps(self.description))
+            writeAtomic(
+                os.path.join(cacheDir, key + '.key'),
+                f'{self.hash}\n{self.fingerprint}'
+            )
+        except OSError as e:
+            print(f"Warning: failed to cache network geometry: {e}")
+
+    def allSideLanes(
+            self, lidx: LaneIndex, network: Optional[RoadNetwork] = None
+    ) -> List[LaneIndex]:
+        # 与 network.all_side_lanes 的结果相同，但不需要每帧重新生成
+        sideLanes = self.sideLanes.get(lidx[:2])
+        if sideLanes is None and network is not None:
+            return network.all_side_lanes(lidx)
+        return sideLanes
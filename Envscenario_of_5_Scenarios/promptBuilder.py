@@ -0,0 +1,152 @@
+from typing import List, Tuple, Optional, Union, Dict, Callable, Sequence
+from collections import OrderedDict
+import re
+
+
+DELIMITER = "####"
+
+# DiLu driverAgent.few_shot_decision 的系统提示词和 human 消息模板（见 System_Prompt.md /
+# Human_message.md）。它们是方法内的局部变量，不能导入，这里只作为 PromptBuilder 的默认值，
+# 其他提示词通过构造参数传入。{delimiter} 由 PromptBuilder 填入
+SYSTEM_MESSAGE = """
+You are AI Driver. As a mature driving assistant, you provide accurate and correct advice for human drivers in complex urban driving scenarios.
+
+You will receive:
+1. A detailed description of the driving scenario of the current frame.
+2. Your history of previous decisions.
+3. The available actions you are allowed to take.
+
+All of these elements are delimited by {delimiter}.
+
+Your response should follow this format:
+<reasoning>
+<reasoning>
+<repeat until you have a decision>
+Response to user:{delimiter} <only output one `Action_id` as an integer, without any action name or explanation. The output decision must be unique and unambiguous. For example, if you decide to accelerate, then output `3`>
+
+Ensure to include {delimiter} to separate every step.
+"""
+
+HUMAN_MESSAGE = """
+Above messages are some examples of how you successfully made decisions in the past. These scenarios are similar to the current one. Refer to those examples to make a decision for the current scenario.
+
+current scenarios descriptions are attached as below:
+{delimiter} Driving scenario description:
+{scenario_description}
+{delimiter} Available actions:
+{available_actions}
+{delimiter} Driving Intentions:
+{driving_intentions}
+"""
+
+DRIVING_INTENTIONS = "Your driving intention is to drive safely and avoid collisions"
+
+# 一条 few-shot 记忆：(human_question, response)，见 Few-Shot Examples.md
+FewShot = Tuple[str, str]
+
+TOKEN_PATTERN = re.compile(r'\w+|[^\w\s]')
+
+
+def approximateTokens(text: str) -> int:
+    # 没有指定分词器时按单词和标点估计 token 数
+    return len(TOKEN_PATTERN.findall(text))
+
+
+def renderMessages(messages: Sequence[Dict[str, str]]) -> str:
+    # 给本地补全模型用的纯文本格式，相同的消息总是得到逐字节相同的文本
+    return ''.join(
+        f"<|{message['role']}|>\n{message['content']}\n" for message in messages
+    )
+
+
+class PromptPrefix:
+    # 系统提示词和 few-shot 消息，同一个 (场景类型, few-shot 集合) 只生成一次，
+    # 之后每次决策都引用同一个对象
+    __slots__ = ('key', 'messages', 'text', 'tokens')
+
+    def __init__(
+            self, key: Tuple, messages: Tuple[Dict[str, str], ...],
+            countTokens: Callable[[str], int]
+    ) -> None:
+        self.key = key
+        self.messages = messages
+        self.text = renderMessages(messages)
+        self.tokens = countTokens(self.text)
+
+
+class Prompt:
+    __slots__ = ('prefix', 'human', 'suffixTokens')
+
+    def __init__(
+            self, prefix: PromptPrefix, human: Dict[str, str], suffixTokens: int
+    ) -> None:
+        self.prefix = prefix
+        self.human = human
+        self.suffixTokens = suffixTokens
+
+    @property
+    def prefixTokens(self) -> int:
+        return self.prefix.tokens
+
+    @property
+    def messages(self) -> List[Dict[str, str]]:
+        return [*self.prefix.messages, self.human]
+
+    @property
+    def text(self) -> str:
+        return self.prefix.text + renderMessages((self.human,))
+
+
+class PromptBuilder:
+    # 每次决策只有场景描述和可用动作变化。静态前缀按 (场景类型, few-shot 集合)
+    # 缓存，消息顺序和内容固定，本地或服务端的前缀缓存可以稳定命中。
+    # few-shot 由记忆检索得到，集合可能很多，只保留最近用到的 maxPrefixes 个
+    def __init__(
+            self, systemMessage: str = SYSTEM_MESSAGE,
+            humanMessage: str = HUMAN_MESSAGE, delimiter: str = DELIMITER,
+            countTokens: Callable[[str], int] = approximateTokens,
+            maxPrefixes: int = 256
+    ) -> None:
+        self.systemMessage = systemMessage.format(delimiter=delimiter)
+        self.humanMessage = humanMessage
+        self.delimiter = delimiter
+        self.countTokens = countTokens
+        self.maxPrefixes = maxPrefixes
+        self.prefixes: 'OrderedDict[Tuple, PromptPrefix]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def prefix(
+            self, scenarioType: str, fewShots: Sequence[FewShot] = ()
+    ) -> PromptPrefix:
+        key = (scenarioType, tuple(fewShots))
+        prefix = self.prefixes.get(key)
+        if prefix is not None:
+            self.hits += 1
+            self.prefixes.move_to_end(key)
+            return prefix
+        self.misses += 1
+        messages = [{'role': 'system', 'content': self.systemMessage}]
+        for question, response in fewShots:
+            messages.append({'role': 'user', 'content': question})
+            messages.append({'role': 'assistant', 'content': response})
+        prefix = PromptPrefix(key, tuple(messages), self.countTokens)
+        self.prefixes[key] = prefix
+        if len(self.prefixes) > self.maxPrefixes:
+            self.prefixes.popitem(last=False)
+        return prefix
+
+    def build(
+            self, scenarioType: str, description: str, availableActions: str,
+            fewShots: Sequence[FewShot] = (),
+            drivingIntentions: str = DRIVING_INTENTIONS
+    ) -> Prompt:
+        human = {'role': 'user', 'content': self.humanMessage.format(
+            delimiter=self.delimiter, scenario_description=description,
+            available_actions=availableActions,
+            driving_intentions=drivingIntentions
+        )}
+        return Prompt(
+            self.prefix(scenarioType, fewShots), human,
+            self.countTokens(renderMessages((human,)))
+        )
@@ -0,0 +1,260 @@
+from typing import List, Tuple, Optional, Union, Dict, Iterator
+import importlib
+import json
+import multiprocessing
+import sqlite3
+
+from highway_env.envs.common.abstract import AbstractEnv
+from highway_env.road.road import Road, RoadNetwork, LaneIndex
+from highway_env.road.lane import (
+    AbstractLane, StraightLane, CircularLane, SineLane, PolyLaneFixedWidth
+)
+from highway_env.vehicle.kinematics import Vehicle
+import numpy as np
+
+from dilu.scenario.networkGeometry import NetworkGeometry
+from dilu.scenario.trajectoryStore import TrajectoryStore, COLUMNS
+
+
+# 没有记录 EnvScenario 模块时（runEpisodes 的默认任务、旧的数据库），按 envType 选择
+ENV_SCENARIOS = {
+    'highway': 'dilu.scenario.Highway_envScenario',
+    'merge': 'dilu.scenario.Merge_envScenario',
+    'intersection': 'dilu.scenario.Intersection_envScenario',
+    'roundabout': 'dilu.scenario.Roundabout_envScenario',
+    'racetrack': 'dilu.scenario.Racetrack_envScenario',
+}
+
+SELECT_EPISODES = """SELECT episodeID, envType, networkHash FROM episodes;"""
+SELECT_TABLES = """SELECT name FROM sqlite_master WHERE type = 'table';"""
+SELECT_ROUTES = """SELECT frame, route FROM routeLog WHERE episodeID = ?;"""
+SELECT_NETWORK = """SELECT network FROM networks WHERE networkHash = ?;"""
+SELECT_FRAMES = """SELECT frame, id, isEgo, x, y, heading, speed,
+    acceleration, laneFrom, laneTo, laneID
+    FROM vehicleLog WHERE episodeID = ? ORDER BY frame, rowid;"""
+
+
+def scenarioModule(envType: str) -> str:
+    for name, module in ENV_SCENARIOS.items():
+        if name in envType.lower():
+            return module
+    raise ValueError(f"No EnvScenario module for env type {envType}")
+
+
+def checkEpisodesTable(conn: sqlite3.Connection, database: str) -> List[str]:
+    # 共享数据库和缓冲模式（bufferedDBBridge）的数据库记录了 episode 和路网，返回数据库里的表名
+    tables = [row[0] for row in conn.execute(SELECT_TABLES)]
+    if 'episodes' not in tables:
+        if 'vehINFO' in tables:
+            raise ValueError(
+                f"{database} was written by DBBridge and has no episodes or "
+                "networks table; record episodes with sharedDB=True, "
+                "bufferedDB=True or trajectoryDir to replay or export them"
+            )
+        raise ValueError(f"{database} is not a shared scenario database")
+    return tables
+
+
+def buildLane(entry: Dict) -> AbstractLane:
+    # 由 networkGeometry.laneGeometry 的描述重建车道，几何参数与原车道完全相同
+    laneType = entry['type']
+    width = entry['width']
+    if laneType == 'SineLane':
+        return SineLane(
+            entry['start'], entry['end'], entry['amplitude'],
+            entry['pulsation'], entry['phase'], width
+        )
+    elif 'start' in entry:
+        return StraightLane(entry['start'], entry['end'], width)
+    elif 'center' in entry:
+        return CircularLane(
+            entry['center'], entry['radius'], entry['startPhase'],
+            entry['endPhase'], entry['clockwise'], width
+        )
+    # 其他类型的车道只保存了中心线的采样点
+    return PolyLaneFixedWidth(entry['points'], width)
+
+
+def buildNetwork(geometry: NetworkGeometry) -> RoadNetwork:
+    network = RoadNetwork()
+    for entry in geometry.description:
+        _from, _to, _ = entry['lane']
+        network.add_lane(_from, _to, buildLane(entry))
+    return network
+
+
+def splitFrames(columns: Dict[str, np.ndarray]) -> Iterator[Tuple[int, Dict[str, np.ndarray]]]:
+    # 行按帧的先后排列，相邻帧号不同的位置就是帧的边界
+    frames = columns['frame']
+    bounds = np.concatenate((
+        [0], np.flatnonzero(frames[1:] != frames[:-1]) + 1, [len(frames)]
+    ))
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        yield int(frames[start]), {
+            name: values[start:end] for name, values in columns.items()
+        }
+
+
+class ReplayEnv:
+    # EnvScenarioCore 用到的 AbstractEnv 属性，车辆来自记录而不是仿真
+    PERCEPTION_DISTANCE = AbstractEnv.PERCEPTION_DISTANCE
+
+    def __init__(self, network: RoadNetwork) -> None:
+        self.road = Road(network=network, vehicles=[])
+        self.vehicle = Vehicle(None, [0, 0])
+        self.steps = 0
+
+
+class ScenarioReplay:
+    # 用记录下来的车辆状态和路网描述重新调用插件的 describe，不创建 AbstractEnv。
+    # 同一个 EnvScenario 模块、envType 和路网的所有 episode 共用一个实例
+    def __init__(
+            self, module: str, envType: str, geometry: NetworkGeometry
+    ) -> None:
+        scenarioClass = importlib.import_module(module).EnvScenario
+        self.network = buildNetwork(geometry)
+        self.env = ReplayEnv(self.network)
+        self.scenario = scenarioClass.offline(self.env, envType, geometry)
+
+    def setVehicle(
+            self, veh: Vehicle, columns: Dict[str, np.ndarray], row: int
+    ) -> Vehicle:
+        veh.position = np.array(
+            [columns['x'][row], columns['y'][row]], dtype=float
+        )
+        veh.heading = float(columns['heading'][row])
+        veh.speed = float(columns['speed'][row])
+        veh.action = {
+            'steering': 0, 'acceleration': float(columns['acceleration'][row])
+        }
+        veh.lane_index = (
+            str(columns['laneFrom'][row]), str(columns['laneTo'][row]),
+            int(columns['laneID'][row])
+        )
+        veh.lane = self.network.get_lane(veh.lane_index)
+        veh.recordID = int(columns['id'][row])
+        return veh
+
+    def describeFrame(
+            self, columns: Dict[str, np.ndarray],
+            route: Optional[List] = None
+    ) -> str:
+        # columns 是一帧的行，ego 一行，周车按记录时的顺序排列
+        ego = self.env.vehicle
+        SVs = []
+        for row in range(len(columns['frame'])):
+            if columns['isEgo'][row]:
+                self.setVehicle(ego, columns, row)
+            else:
+                SVs.append(self.setVehicle(Vehicle(None, [0, 0]), columns, row))
+        ego.route = [tuple(lidx) for lidx in route] if route else route
+        self.env.road.vehicles[:] = [ego] + SVs
+        # 每次调用都是新的一帧，帧号可能在不同 episode 之间重复
+        self.env.steps += 1
+        return self.scenario.describeFrame()
+
+
+# 每个进程缓存自己的 ScenarioReplay
+replays: Dict[Tuple[str, str, str], ScenarioReplay] = {}
+
+
+def getReplay(
+        module: str, envType: str, geometry: NetworkGeometry
+) -> ScenarioReplay:
+    key = (module, envType, geometry.hash)
+    if key not in replays:
+        replays[key] = ScenarioReplay(module, envType, geometry)
+    return replays[key]
+
+
+def replayTrajectoryEpisode(
+        directory: str, episodeID: str, module: Optional[str] = None
+) -> Dict[int, str]:
+    store = TrajectoryStore(directory)
+    descriptions: Dict[int, str] = {}
+    for meta in store.index:
+        if meta['episodeID'] != episodeID:
+            continue
+        replay = getReplay(
+            module or meta['scenario'] or scenarioModule(meta['envType']),
+            meta['envType'], store.geometry(meta['networkHash'])
+        )
+        for frame, columns in splitFrames(store.loadChunk(meta)):
+            descriptions[frame] = replay.describeFrame(
+                columns, meta['routes'].get(str(frame))
+            )
+    return descriptions
+
+
+def replayDatabaseEpisode(
+        database: str, episodeID: str, module: Optional[str] = None
+) -> Dict[int, str]:
+    conn = sqlite3.connect(database)
+    try:
+        tables = checkEpisodesTable(conn, database)
+        columns = [row[1] for row in conn.execute('PRAGMA table_info(episodes)')]
+        envType, netHash, scenario = conn.execute(
+            f"""SELECT envType, networkHash,
+                {'scenario' if 'scenario' in columns else 'NULL'}
+                FROM episodes WHERE episodeID = ?;""", (episodeID,)
+        ).fetchone()
+        network = conn.execute(SELECT_NETWORK, (netHash,)).fetchone()[0]
+        rows = conn.execute(SELECT_FRAMES, (episodeID,)).fetchall()
+        # 旧的数据库没有 routeLog，nextLane 由路网按 ego 的位置选择
+        routes = {
+            frame: json.loads(route)
+            for frame, route in conn.execute(SELECT_ROUTES, (episodeID,))
+        } if 'routeLog' in tables else {}
+    finally:
+        conn.close()
+    replay = getReplay(
+        module or scenario or scenarioModule(envType), envType,
+        NetworkGeometry(json.loads(network), netHash)
+    )
+    descriptions: Dict[int, str] = {}
+    if not rows:
+        return descriptions
+    columns = {
+        name: np.array(values, dtype=dtype)
+        for (name, dtype), values in zip(COLUMNS, zip(*rows))
+    }
+    for frame, frameColumns in splitFrames(columns):
+        descriptions[frame] = replay.describeFrame(
+            frameColumns, routes.get(frame)
+        )
+    return descriptions
+
+
+def replayTask(task: Tuple[str, str, str, Optional[str]]) -> Tuple[str, Dict[int, str]]:
+    source, path, episodeID, module = task
+    if source == 'trajectory':
+        return episodeID, replayTrajectoryEpisode(path, episodeID, module)
+    return episodeID, replayDatabaseEpisode(path, episodeID, module)
+
+
+def replayCorpus(
+        directory: Optional[str] = None, database: Optional[str] = None,
+        module: Optional[str] = None, processes: Optional[int] = None
+) -> Dict[str, Dict[int, str]]:
+    # 重新生成一个轨迹目录或共享数据库里所有 episode 的描述，
+    # 每个 episode 是一个任务，由进程池并行处理
+    if directory:
+        tasks = [
+            ('trajectory', directory, episodeID, module)
+            for episodeID in TrajectoryStore(directory).episodes()
+        ]
+    else:
+        conn = sqlite3.connect(database)
+        try:
+            checkEpisodesTable(conn, database)
+            episodeIDs = [row[0] for row in conn.execute(SELECT_EPISODES)]
+        finally:
+            conn.close()
+        tasks = [
+            ('database', database, episodeID, module)
+            for episodeID in episodeIDs
+        ]
+    if processes == 1 or len(tasks) <= 1:
+        return dict(map(replayTask, tasks))
+    with multiprocessing.Pool(processes) as pool:
+        return dict(pool.imap_unordered(replayTask, tasks))
@@ -0,0 +1,41 @@
+from typing import List, Tuple, Optional, Union, Dict
+
+from highway_env.envs.common.abstract import AbstractEnv
+import numpy as np
+
+
+# 与 processSVsNormalLane 相同的车道分组，每组取前后最近的车辆
+KEY_LANE_GROUPS = ('current lane', 'left lane', 'right lane', 'target lane')
+
+KEY_FIELDS: Tuple[str, ...] = (
+    'laneRank', 'laneCount', 'egoSpeed', 'egoAcceleration',
+    *(
+        f'{group} {side} {value}'
+        for group in KEY_LANE_GROUPS
+        for side in ('ahead', 'behind')
+        for value in ('gap', 'relativeSpeed')
+    ),
+    'inJunction', 'onRoundabout', 'timeToConflict'
+)
+KEY_DIM = len(KEY_FIELDS)
+
+# 没有车辆时间距取感知距离、相对速度取 0；没有冲突点时冲突时间取 NO_CONFLICT_TIME
+MISSING_GAP = AbstractEnv.PERCEPTION_DISTANCE
+NO_CONFLICT_TIME = 30.0
+
+# 检索时各个字段除以这里的尺度再比较欧氏距离，使车道、速度、间距和时间的差别大致可比；
+# 路口和环岛的标志尺度最小，状态不同的场景不会被当作近邻
+KEY_SCALES = np.array([
+    1.0, 1.0, 2.0, 1.0,
+    *(
+        scale
+        for _ in KEY_LANE_GROUPS
+        for _ in ('ahead', 'behind')
+        for scale in (10.0, 2.0)
+    ),
+    0.1, 0.1, 2.0
+], dtype=np.float32)
+
+
+def scaleKeys(keys: np.ndarray) -> np.ndarray:
+    return np.atleast_2d(np.asarray(keys, dtype=np.float32)) / KEY_SCALES
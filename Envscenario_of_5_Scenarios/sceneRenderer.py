@@ -0,0 +1,327 @@
+from typing import List, Tuple, Optional, Union, Dict, Set
+import itertools
+import multiprocessing
+import queue
+import threading
+
+from highway_env.road.lane import (
+    AbstractLane, StraightLane, CircularLane, SineLane
+)
+from highway_env.vehicle.controller import MDPVehicle
+from highway_env.vehicle.behavior import IDMVehicle
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import LineCollection, PolyCollection
+from matplotlib.figure import Figure
+from PIL import Image
+import numpy as np
+
+from dilu.scenario.networkGeometry import NetworkGeometry
+
+
+# 一辆车的 (x, y, heading, length, width)
+VehicleState = Tuple[float, float, float, float, float]
+
+# 交给渲染进程的一帧：(路网哈希, 文件名, ego, 周车)，只有几十个浮点数
+FrameRecord = Tuple[str, str, VehicleState, Tuple[VehicleState, ...]]
+
+# 弯道和正弦车道的边线每隔这么多米采样一个点
+BORDER_STEP = 2.0
+
+# 栅格化背景的像素上限和四周留白（米）
+MAX_BACKGROUND_PIXELS = 16_000_000
+BACKGROUND_MARGIN = 20.0
+
+LANE_COLOR = '#7f7f7f'
+LANE_WIDTH = 1.0
+SV_COLOR = '#1f77b4'
+EGO_COLOR = '#d62728'
+
+
+def vehicleState(veh: Union[IDMVehicle, MDPVehicle]) -> VehicleState:
+    return (
+        float(veh.position[0]), float(veh.position[1]), float(veh.heading),
+        float(veh.LENGTH), float(veh.WIDTH)
+    )
+
+
+def buildLane(entry: Dict) -> Optional[AbstractLane]:
+    # 由 networkGeometry 的车道描述重建车道，不认识的类型返回 None
+    width = entry['width']
+    if entry['type'] == 'SineLane':
+        return SineLane(
+            entry['start'], entry['end'], entry['amplitude'],
+            entry['pulsation'], entry['phase'], width=width
+        )
+    if entry['type'] == 'StraightLane':
+        return StraightLane(entry['start'], entry['end'], width=width)
+    if entry['type'] == 'CircularLane':
+        return CircularLane(
+            entry['center'], entry['radius'], entry['startPhase'],
+            entry['endPhase'], clockwise=entry['clockwise'], width=width
+        )
+    return None
+
+
+def laneBorders(entry: Dict) -> List[np.ndarray]:
+    lane = buildLane(entry)
+    if lane is None:
+        return [np.asarray(entry['points'], dtype=float)]
+    if isinstance(lane, StraightLane) and not isinstance(lane, SineLane):
+        samples = np.array([0.0, lane.length])
+    else:
+        samples = np.linspace(
+            0, lane.length, max(2, int(lane.length / BORDER_STEP) + 1)
+        )
+    half = entry['width'] / 2
+    return [
+        np.array([lane.position(s, lateral) for s in samples])
+        for lateral in (-half, half)
+    ]
+
+
+def vehicleCorners(states: np.ndarray) -> np.ndarray:
+    # (N, 5) 的车辆状态一次算出 (N, 4, 2) 的矩形顶点
+    x, y, heading, length, width = states.T
+    cos, sin = np.cos(heading), np.sin(heading)
+    signs = np.array([[1, 1], [-1, 1], [-1, -1], [1, -1]], dtype=float)
+    dx = signs[:, 0] * (length / 2)[:, None]
+    dy = signs[:, 1] * (width / 2)[:, None]
+    return np.stack([
+        x[:, None] + dx * cos[:, None] - dy * sin[:, None],
+        y[:, None] + dx * sin[:, None] + dy * cos[:, None]
+    ], axis=-1)
+
+
+def frameRecord(
+        netHash: str, fileName: str, ego: MDPVehicle, SVs: List[IDMVehicle]
+) -> FrameRecord:
+    return (
+        netHash, fileName, vehicleState(ego),
+        tuple(vehicleState(sv) for sv in SVs)
+    )
+
+
+class NetworkBackground:
+    # 路网的静态图层。车道边线只采样一次；路网不超过 MAX_BACKGROUND_PIXELS 时
+    # 再按输出图片的像素比例栅格化一次，之后每帧只截取视野内的部分贴到图上。
+    # highway 的车道长 10 km，栅格太大，直接用 LineCollection 画直线
+    def __init__(self, description: List[Dict], scale: float, dpi: int) -> None:
+        self.borders = [
+            border for entry in description for border in laneBorders(entry)
+        ]
+        self.scale = scale
+        self.raster: Optional[np.ndarray] = None
+        if not self.borders:
+            return
+        points = np.concatenate(self.borders)
+        self.origin = points.min(axis=0) - BACKGROUND_MARGIN
+        size = np.ceil(
+            (points.max(axis=0) + BACKGROUND_MARGIN - self.origin) * scale
+        ).astype(int)
+        if size[0] * size[1] <= MAX_BACKGROUND_PIXELS:
+            self.raster = self.rasterize(size, dpi)
+
+    def lines(self) -> LineCollection:
+        return LineCollection(
+            self.borders, colors=LANE_COLOR, linewidths=LANE_WIDTH
+        )
+
+    def rasterize(self, size: np.ndarray, dpi: int) -> np.ndarray:
+        width, height = size
+        figure = Figure(figsize=(width / dpi, height / dpi), dpi=dpi)
+        canvas = FigureCanvasAgg(figure)
+        axes = figure.add_axes([0, 0, 1, 1])
+        axes.axis('off')
+        axes.set_xlim(self.origin[0], self.origin[0] + width / self.scale)
+        axes.set_ylim(self.origin[1] + height / self.scale, self.origin[1])
+        axes.add_collection(self.lines())
+        canvas.draw()
+        return np.asarray(canvas.buffer_rgba()).copy()
+
+    def blit(self, pixels: np.ndarray, left: float, top: float) -> None:
+        # 把视野左上角 (left, top) 开始的那部分栅格拷进画布的像素缓冲，超出栅格的部分为白色
+        pixels.fill(255)
+        height, width = pixels.shape[:2]
+        column = int(round((left - self.origin[0]) * self.scale))
+        row = int(round((top - self.origin[1]) * self.scale))
+        rows, columns = self.raster.shape[:2]
+        r0, r1 = max(row, 0), min(row + height, rows)
+        c0, c1 = max(column, 0), min(column + width, columns)
+        if r0 < r1 and c0 < c1:
+            pixels[r0 - row:r1 - row, c0 - column:c1 - column] = \
+                self.raster[r0:r1, c0:c1]
+
+
+class SceneCanvas:
+    # 一个路网一张图：背景在创建时生成，所有车辆画在同一个 PolyCollection 里，
+    # 每帧只更新顶点和颜色。有栅格背景时先把它拷进 Agg 的像素缓冲再只画 axes，
+    # 耗时与车辆数量成正比而与车道数量无关
+    def __init__(
+            self, description: List[Dict], viewRange: Tuple[float, float],
+            dpi: int
+    ) -> None:
+        self.viewRange = viewRange
+        self.dpi = dpi
+        self.figure = Figure(
+            figsize=(viewRange[0] / 10, viewRange[1] / 10), dpi=dpi
+        )
+        self.canvas = FigureCanvasAgg(self.figure)
+        self.width = int(round(viewRange[0] / 10 * dpi))
+        self.height = int(round(viewRange[1] / 10 * dpi))
+        self.axes = self.figure.add_axes([0, 0, 1, 1])
+        self.axes.set_aspect('equal')
+        self.axes.axis('off')
+        self.background = NetworkBackground(
+            description, self.width / viewRange[0], dpi
+        )
+        if self.background.raster is None:
+            self.axes.add_collection(self.background.lines())
+        self.vehicles = self.axes.add_collection(PolyCollection(
+            [], edgecolors='black', linewidths=0.5
+        ))
+        self.canvas.draw()
+
+    def draw(
+            self, ego: VehicleState, SVs: Tuple[VehicleState, ...]
+    ) -> np.ndarray:
+        # 返回画布的 RGBA 像素缓冲，下一次 draw 时会被覆盖
+        states = np.array([*SVs, ego], dtype=float).reshape(-1, 5)
+        self.vehicles.set_verts(vehicleCorners(states))
+        self.vehicles.set_facecolor([SV_COLOR] * len(SVs) + [EGO_COLOR])
+        rangeX, rangeY = self.viewRange
+        left, top = ego[0] - rangeX / 2, ego[1] - rangeY / 2
+        self.axes.set_xlim(left, left + rangeX)
+        # 与 highway_env 的画面一致，y 轴向下
+        self.axes.set_ylim(top + rangeY, top)
+        if self.background.raster is None:
+            self.canvas.draw()
+            return np.asarray(self.canvas.buffer_rgba())
+        renderer = self.canvas.get_renderer()
+        renderer.clear()
+        pixels = np.asarray(renderer.buffer_rgba())
+        self.background.blit(pixels, left, top)
+        self.axes.draw(renderer)
+        return pixels
+
+    def render(self, record: FrameRecord) -> None:
+        _, fileName, ego, SVs = record
+        Image.fromarray(self.draw(ego, SVs)).save(fileName)
+
+
+class ScenePainter:
+    # 在当前进程里同步画图，接口与 SceneRenderer 相同，也可以直接作为
+    # EnvScenario 的 renderer；每个路网的背景和画布只生成一次
+    def __init__(
+            self, viewRange: Tuple[float, float] = (100.0, 40.0), dpi: int = 100
+    ) -> None:
+        self.viewRange = viewRange
+        self.dpi = dpi
+        self.descriptions: Dict[str, List[Dict]] = {}
+        self.canvases: Dict[str, SceneCanvas] = {}
+
+    def addNetwork(self, netHash: str, description: List[Dict]) -> None:
+        self.descriptions[netHash] = description
+
+    def canvas(self, netHash: str) -> SceneCanvas:
+        canvas = self.canvases.get(netHash)
+        if canvas is None:
+            canvas = self.canvases[netHash] = SceneCanvas(
+                self.descriptions[netHash], self.viewRange, self.dpi
+            )
+        return canvas
+
+    def paint(self, record: FrameRecord) -> None:
+        self.canvas(record[0]).render(record)
+
+    def submit(
+            self, geometry: NetworkGeometry, SVs: List[IDMVehicle],
+            ego: MDPVehicle, fileName: str
+    ) -> None:
+        if geometry.hash not in self.descriptions:
+            self.addNetwork(geometry.hash, geometry.description)
+        self.paint(frameRecord(geometry.hash, fileName, ego, SVs))
+
+    def close(self) -> None:
+        pass
+
+
+def renderLoop(
+        tasks: Union[queue.Queue, multiprocessing.Queue],
+        viewRange: Tuple[float, float], dpi: int
+) -> None:
+    # 渲染进程（或线程）的主循环：('network', 哈希, 描述) 注册路网，
+    # ('frame', FrameRecord) 渲染一帧，None 结束
+    painter = ScenePainter(viewRange, dpi)
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        if task[0] == 'network':
+            painter.addNetwork(task[1], task[2])
+            continue
+        try:
+            painter.paint(task[1])
+        except Exception as e:
+            print(f"Warning: failed to render {task[1][1]}: {e}")
+
+
+class SceneRenderer:
+    # EnvScenario.plotSce 只把路网哈希和车辆状态放进队列，由 processes 个渲染进程
+    # 异步画图，仿真不等待 matplotlib。每个路网的描述只发给每个进程一次。
+    # processes=0 时在后台线程里渲染，用于不能再创建子进程的 Pool worker。
+    # 队列里最多 maxPending 帧，渲染跟不上时 submit 才会等待
+    def __init__(
+            self, processes: int = 2, maxPending: int = 1024,
+            viewRange: Tuple[float, float] = (100.0, 40.0), dpi: int = 100
+    ) -> None:
+        count = max(processes, 1)
+        perWorker = max(maxPending // count, 1)
+        if processes > 0:
+            self.queues = [multiprocessing.Queue(perWorker) for _ in range(count)]
+            self.workers = [
+                multiprocessing.Process(
+                    target=renderLoop, args=(tasks, viewRange, dpi), daemon=True
+                )
+                for tasks in self.queues
+            ]
+        else:
+            self.queues = [queue.Queue(perWorker)]
+            self.workers = [threading.Thread(
+                target=renderLoop, args=(self.queues[0], viewRange, dpi),
+                daemon=True
+            )]
+        for worker in self.workers:
+            worker.start()
+        self.sentNetworks: List[Set[str]] = [set() for _ in self.queues]
+        self.order = itertools.cycle(range(len(self.queues)))
+        self.submitted = 0
+        self.closed = False
+
+    def submit(
+            self, geometry: NetworkGeometry, SVs: List[IDMVehicle],
+            ego: MDPVehicle, fileName: str
+    ) -> None:
+        i = next(self.order)
+        if geometry.hash not in self.sentNetworks[i]:
+            self.queues[i].put(('network', geometry.hash, geometry.description))
+            self.sentNetworks[i].add(geometry.hash)
+        self.queues[i].put(
+            ('frame', frameRecord(geometry.hash, fileName, ego, SVs))
+        )
+        self.submitted += 1
+
+    def close(self) -> None:
+        # 等待已经提交的帧全部画完
+        if self.closed:
+            return
+        self.closed = True
+        for tasks in self.queues:
+            tasks.put(None)
+        for worker in self.workers:
+            worker.join()
+
+    def __enter__(self) -> 'SceneRenderer':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
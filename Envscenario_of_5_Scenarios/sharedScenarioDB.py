@@ -0,0 +1,171 @@
+from typing import List, Tuple, Optional, Union, Dict, Set
+from datetime import datetime
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import uuid
+
+from highway_env.envs.common.abstract import AbstractEnv
+from highway_env.vehicle.behavior import IDMVehicle
+
+from dilu.scenario.bufferedDBBridge import (
+    DBWriter, FrameLogBuffer, createLogTables, createEpisodeTables,
+    INSERT_EPISODE, INSERT_NETWORK
+)
+from dilu.scenario.networkGeometry import NetworkGeometry
+from dilu.scenario.vehicleRecord import VehicleRecord
+
+
+# WAL 模式下多个进程可以同时写同一个数据库文件，读取也不会被写入阻塞
+WAL_PRAGMAS = ('PRAGMA journal_mode=WAL', 'PRAGMA synchronous=NORMAL')
+
+
+class ScenarioDatabase:
+    # 一个进程里指向同一个文件的所有 EnvScenario 共用一个 ScenarioDatabase，
+    # 也就共用同一个写线程和 sqlite 连接
+    instances: Dict[str, 'ScenarioDatabase'] = {}
+    instancesLock = threading.Lock()
+
+    @classmethod
+    def open(cls, database: str) -> 'ScenarioDatabase':
+        path = os.path.abspath(database)
+        with cls.instancesLock:
+            if path not in cls.instances:
+                cls.instances[path] = cls(path)
+            return cls.instances[path]
+
+    def __init__(self, database: str) -> None:
+        self.database = database
+        conn = sqlite3.connect(database, timeout=30)
+        for pragma in WAL_PRAGMAS:
+            conn.execute(pragma)
+        createEpisodeTables(conn)
+        createLogTables(conn)
+        # 数据库里已有的路网（之前的运行或其他进程写入的）不再重复写入
+        storedNetworks = {
+            row[0] for row in conn.execute('SELECT networkHash FROM networks')
+        }
+        conn.close()
+
+        self.writer = DBWriter(database, pragmas=WAL_PRAGMAS)
+        self.networksLock = threading.Lock()
+        self.writtenNetworks: Set[str] = storedNetworks
+
+    def insertEpisode(
+            self, episodeID: str, runID: str, envType: str,
+            seed: int, netHash: str, scenario: Optional[str] = None
+    ) -> None:
+        self.writer.submit([(INSERT_EPISODE, [(
+            episodeID, runID, envType, seed, netHash,
+            datetime.now().isoformat(timespec='seconds'), scenario
+        )])])
+
+    def hasNetwork(self, netHash: str) -> bool:
+        with self.networksLock:
+            return netHash in self.writtenNetworks
+
+    def insertNetwork(
+            self, netHash: str, envType: str, description: List[Dict]
+    ) -> None:
+        # 每个路网哈希只写一次，其他进程已经写过的由 INSERT OR IGNORE 跳过
+        with self.networksLock:
+            if netHash in self.writtenNetworks:
+                return
+            self.writtenNetworks.add(netHash)
+        self.writer.submit([(INSERT_NETWORK, [(
+            netHash, envType, json.dumps(description, separators=(',', ':'))
+        )])])
+
+    def close(self) -> None:
+        with ScenarioDatabase.instancesLock:
+            ScenarioDatabase.instances.pop(self.database, None)
+        self.writer.close()
+
+    @classmethod
+    def closeAll(cls) -> None:
+        for db in list(cls.instances.values()):
+            db.close()
+
+
+class SharedDBBridge:
+    # 和 DBBridge 的接口相同，但所有 episode 写入同一个数据库，
+    # 用 episodeID 区分不同的 episode，runID 区分不同的实验。
+    # scenario 是生成描述的 EnvScenario 模块，回放时用同一个模块
+    def __init__(
+            self, database: str, env: AbstractEnv,
+            runID: str = '', flushFrames: int = 20,
+            scenario: Optional[str] = None,
+            networkCacheDir: Union[str, bool, None] = None
+    ) -> None:
+        self.database = database
+        self.env = env
+        self.runID = runID
+        self.scenario = scenario
+        self.networkCacheDir = networkCacheDir
+        self.episodeID = uuid.uuid4().hex
+        self.db = ScenarioDatabase.open(database)
+        self.buffer = FrameLogBuffer(
+            self.db.writer, env, self.episodeID, flushFrames
+        )
+        self.envType = ''
+        self.geometry: Optional[NetworkGeometry] = None
+        # 没有调用 close 时，进程退出前也要把这个 episode 缓冲的数据写完
+        atexit.register(self.close)
+
+    def createTable(self):
+        # 表在 ScenarioDatabase 打开时已经建好
+        pass
+
+    def insertSimINFO(self, envType: str, seed: int):
+        self.envType = envType
+        # 路网描述来自缓存，同样配置的 episode 不会重复序列化路网
+        self.geometry = NetworkGeometry.forEnv(
+            self.env, envType, self.networkCacheDir
+        )
+        self.db.insertEpisode(
+            self.episodeID, self.runID, envType, seed, self.geometry.hash,
+            self.scenario
+        )
+
+    def hasNetwork(self) -> bool:
+        return self.geometry is not None and self.db.hasNetwork(self.geometry.hash)
+
+    def insertNetwork(self):
+        if self.geometry is None:
+            self.geometry = NetworkGeometry.forEnv(
+                self.env, self.envType, self.networkCacheDir
+            )
+        self.db.insertNetwork(
+            self.geometry.hash, self.envType, self.geometry.description
+        )
+
+    def insertVehicle(self, frame: int, SVs: List[IDMVehicle]) -> None:
+        self.buffer.insertVehicle(frame, SVs)
+
+    def insertRecords(
+            self, frame: int, egoRecord: VehicleRecord,
+            records: List[VehicleRecord], route: Optional[List] = None
+    ) -> None:
+        self.buffer.insertRecords(frame, egoRecord, records, route)
+
+    def insertPrompts(
+            self, frame: int, vectorID: str, done: bool,
+            description: str, fewshots: str, thoughtsAndAction: str,
+            cached: bool = False
+    ) -> None:
+        self.buffer.insertPrompts(
+            frame, vectorID, done, description, fewshots, thoughtsAndAction,
+            cached
+        )
+
+    def flush(self) -> None:
+        self.buffer.flush()
+
+    def close(self) -> None:
+        # 只提交这个 episode 的数据并等待写线程 commit，共享的写线程在进程退出时关闭。
+        # 进程池的工作进程退出时不会执行 atexit，不能依赖它写完剩下的数据
+        atexit.unregister(self.close)
+        self.buffer.flush()
+        self.db.writer.sync()
@@ -0,0 +1,98 @@
+from typing import List, Tuple, Optional, Union, Dict
+import math
+
+from highway_env.vehicle.controller import MDPVehicle
+from highway_env.vehicle.behavior import IDMVehicle
+import numpy as np
+
+
+class UniformGrid:
+    # 每帧用所有车辆的位置重建一次的均匀网格，半径查询只检查查询圆覆盖到的网格，
+    # 代替 road.close_vehicles_to 对 road.vehicles 的线性扫描和全量排序
+    def __init__(
+            self, vehicles: List[Union[IDMVehicle, MDPVehicle]],
+            cellSize: float
+    ) -> None:
+        self.vehicles = list(vehicles)
+        self.cellSize = cellSize
+        count = len(self.vehicles)
+        self.positions = np.empty((count, 2), dtype=float)
+        for i, veh in enumerate(self.vehicles):
+            self.positions[i] = veh.position
+
+        # 按网格坐标排序后，同一个网格里的车辆是一段连续的行号
+        cells = np.floor(self.positions / cellSize).astype(int)
+        order = np.lexsort((cells[:, 1], cells[:, 0]))
+        sortedCells = cells[order]
+        if count:
+            changed = np.any(sortedCells[1:] != sortedCells[:-1], axis=1)
+            starts = np.concatenate(([0], np.flatnonzero(changed) + 1))
+        else:
+            starts = np.empty(0, dtype=int)
+        ends = np.append(starts[1:], count)
+        self.cells: Dict[Tuple[int, int], np.ndarray] = {
+            (int(sortedCells[s, 0]), int(sortedCells[s, 1])): order[s:e]
+            for s, e in zip(starts, ends)
+        }
+
+    def __len__(self) -> int:
+        return len(self.vehicles)
+
+    def cellOf(self, position: np.ndarray) -> Tuple[int, int]:
+        return (
+            math.floor(position[0] / self.cellSize),
+            math.floor(position[1] / self.cellSize)
+        )
+
+    def candidateRows(self, position: np.ndarray, radius: float) -> np.ndarray:
+        xMin, yMin = self.cellOf(np.asarray(position) - radius)
+        xMax, yMax = self.cellOf(np.asarray(position) + radius)
+        found = [
+            self.cells[(cx, cy)]
+            for cx in range(xMin, xMax + 1)
+            for cy in range(yMin, yMax + 1)
+            if (cx, cy) in self.cells
+        ]
+        if not found:
+            return np.empty(0, dtype=int)
+        # 保持 road.vehicles 中的原始顺序，排序时距离相同的车辆先后与线性扫描一致
+        return np.sort(np.concatenate(found))
+
+    def rowsWithin(self, position: np.ndarray, radius: float) -> np.ndarray:
+        rows = self.candidateRows(position, radius)
+        delta = self.positions[rows] - np.asarray(position, dtype=float)
+        return rows[np.hypot(delta[:, 0], delta[:, 1]) < radius]
+
+    def within(
+            self, position: np.ndarray, radius: float
+    ) -> List[Union[IDMVehicle, MDPVehicle]]:
+        return [self.vehicles[row] for row in self.rowsWithin(position, radius)]
+
+    def nearest(
+            self, position: np.ndarray, count: int, radius: float
+    ) -> List[Union[IDMVehicle, MDPVehicle]]:
+        # 半径内按欧氏距离最近的 count 辆车
+        rows = self.rowsWithin(position, radius)
+        delta = self.positions[rows] - np.asarray(position, dtype=float)
+        distances = np.hypot(delta[:, 0], delta[:, 1])
+        order = np.argsort(distances, kind='stable')[:count]
+        return [self.vehicles[row] for row in rows[order]]
+
+    def closeVehiclesTo(
+            self, vehicle: Union[IDMVehicle, MDPVehicle], distance: float,
+            count: Optional[int] = None, see_behind: bool = True,
+            sort: bool = True
+    ) -> List[Union[IDMVehicle, MDPVehicle]]:
+        # 与 road.close_vehicles_to 的筛选、排序规则一致，只是候选车辆来自网格
+        vehicles = [
+            v for v in self.within(vehicle.position, distance)
+            if v is not vehicle
+            and (see_behind or -2 * vehicle.LENGTH < vehicle.lane_distance_to(v))
+        ]
+        if sort:
+            vehicles = sorted(
+                vehicles, key=lambda v: abs(vehicle.lane_distance_to(v))
+            )
+        if count:
+            vehicles = vehicles[:count]
+        return vehicles
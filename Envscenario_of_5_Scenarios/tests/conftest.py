@@ -0,0 +1,43 @@
+import importlib
+import os
+import warnings
+
+import pytest
+
+# 这些模块放在 DiLu 的 dilu/scenario 目录下使用，没有安装 DiLu 时跳过测试
+pytest.importorskip('dilu.scenario.DBBridge')
+pytest.importorskip('highway_env')
+
+import gymnasium as gym
+import highway_env
+import numpy as np
+
+warnings.filterwarnings('ignore')
+
+ENV_CONFIG = {'action': {'type': 'DiscreteMetaAction'}, 'duration': 100}
+
+
+def recordEpisode(module: str, envType: str, seed: int, steps: int, **kwargs):
+    # 用随机的可用动作运行一个 episode，每帧写入车辆和 prompt，返回 EnvScenario 和各帧的描述
+    env = gym.make(envType, config=ENV_CONFIG).unwrapped
+    env.reset(seed=seed)
+    scenarioClass = importlib.import_module('dilu.scenario.' + module).EnvScenario
+    # 路网缓存写在数据库所在的临时目录里，不写入用户目录
+    kwargs.setdefault('networkCacheDir', os.path.join(
+        os.path.dirname(kwargs['database']), 'networks'
+    ))
+    sce = scenarioClass(env, envType, seed, **kwargs)
+    rng = np.random.RandomState(seed)
+    descriptions = {}
+    try:
+        for frame in range(steps):
+            descriptions[frame] = sce.describe(frame)
+            _, _, done, truncated, _ = env.step(
+                int(rng.choice(env.get_available_actions()))
+            )
+            sce.promptsCommit(frame, '', done, descriptions[frame], '', '')
+            if done or truncated:
+                break
+    finally:
+        sce.close()
+    return sce, descriptions
@@ -0,0 +1,54 @@
+import importlib
+import inspect
+
+import pytest
+
+from dilu.scenario.envScenarioCore import (
+    ScenarioPlugin, AVAILABLE_ACTION_ORDER, actionMask
+)
+
+
+MODULES = [
+    'Highway_envScenario', 'Merge_envScenario', 'Intersection_envScenario',
+    'Racetrack_envScenario', 'Roundabout_envScenario'
+]
+
+
+def pluginClasses():
+    plugins = {}
+    for module in MODULES:
+        namespace = importlib.import_module('dilu.scenario.' + module)
+        for name, value in vars(namespace).items():
+            if inspect.isclass(value) and issubclass(value, ScenarioPlugin) \
+                    and value.actionNames:
+                plugins[f'{module}.{name}'] = value
+    return plugins
+
+
+PLUGINS = pluginClasses()
+
+
+@pytest.mark.parametrize('name', sorted(PLUGINS))
+def test_actionsTableMatchesDescribeActions(name):
+    # describeActions 只用到类属性，不需要构造场景
+    plugin = PLUGINS[name].__new__(PLUGINS[name])
+    # get_available_actions 的顺序
+    known = [
+        action for actionName in AVAILABLE_ACTION_ORDER
+        for action, value in plugin.actionNames.items()
+        if value == actionName and action in plugin.actionsDescription
+    ]
+    assert len(plugin.actionsTable) == 1 << len(known)
+    for subset in range(1 << len(known)):
+        actions = [action for i, action in enumerate(known) if subset >> i & 1]
+        entry = plugin.actionsEntry(actions)
+        assert entry is not None
+        assert entry[1] == plugin.describeActions(actions) + plugin.actionsReminder
+        assert plugin.actionsTable[actionMask(actions)] is entry
+
+
+def test_everyPluginHasFullTable():
+    # 五个动作的场景都有 32 种可用动作组合
+    sizes = {name: len(plugin.actionsTable) for name, plugin in PLUGINS.items()}
+    assert all(size in (8, 32) for size in sizes.values())
+    assert sum(size == 32 for size in sizes.values()) >= 4
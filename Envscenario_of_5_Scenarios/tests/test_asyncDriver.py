@@ -0,0 +1,126 @@
+import asyncio
+import subprocess
+import sys
+
+import pytest
+
+from dilu.scenario.asyncDriver import (
+    AsyncDecisionDriver, runAsyncEpisodes, serveStubModel, createClient
+)
+
+from conftest import ENV_CONFIG
+
+
+def test_importWithoutOpenAI():
+    # openai 和 httpx 只在 createClient 里需要，没有安装时其他模块仍然可以导入
+    code = (
+        "import sys; sys.modules['openai'] = None; sys.modules['httpx'] = None; "
+        "import dilu.scenario.asyncDriver, dilu.scenario.decisionQueue, "
+        "dilu.scenario.episodeRunner"
+    )
+    subprocess.run([sys.executable, '-c', code], check=True)
+
+
+@pytest.fixture
+def stubServer():
+    pytest.importorskip('openai')
+    server = serveStubModel(action=1, delay=0.05)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def baseURL(server) -> str:
+    return f'http://127.0.0.1:{server.server_port}/v1'
+
+
+def test_runAsyncEpisodes(tmp_path, stubServer):
+    tasks = [('highway-v0', seed) for seed in range(4)]
+    results = runAsyncEpisodes(
+        tasks, 'stub', baseURL(stubServer), concurrency=3,
+        envConfigs={'highway-v0': ENV_CONFIG},
+        databaseDir=str(tmp_path), steps=5,
+        networkCacheDir=str(tmp_path / 'networks')
+    )
+    assert sorted(result['seed'] for result in results) == list(range(4))
+    for result in results:
+        assert len(result['frames']) == 5
+        assert [frame['action'] for frame in result['frames']] == [1] * 5
+
+
+def runDriver(driver: AsyncDecisionDriver, tasks) -> list:
+    async def collect():
+        try:
+            return [result async for result in driver.run(tasks)]
+        finally:
+            await driver.client.close()
+    return asyncio.run(collect())
+
+
+def test_concurrencyLimit(tmp_path, stubServer):
+    client = createClient(baseURL(stubServer))
+    # 记录同时发给模型服务的最大请求数
+    create = client.chat.completions.create
+    counts = {'inFlight': 0, 'peak': 0}
+
+    async def countingCreate(**kwargs):
+        counts['inFlight'] += 1
+        counts['peak'] = max(counts['peak'], counts['inFlight'])
+        try:
+            return await create(**kwargs)
+        finally:
+            counts['inFlight'] -= 1
+
+    client.chat.completions.create = countingCreate
+    driver = AsyncDecisionDriver(
+        client, 'stub', concurrency=2,
+        envConfigs={'highway-v0': ENV_CONFIG},
+        databaseDir=str(tmp_path), steps=4,
+        networkCacheDir=str(tmp_path / 'networks')
+    )
+    results = runDriver(driver, [('highway-v0', seed) for seed in range(4)])
+    assert len(results) == 4
+    assert driver.requests == 16
+    # 4 个 episode 同时等待回答，在途请求数等于 concurrency
+    assert counts['peak'] == 2
+
+
+def test_invalidOutputRetried(tmp_path):
+    pytest.importorskip('openai')
+    # 动作 9 不在可用动作里，检查请求之后仍然无效，使用默认动作 IDLE
+    server = serveStubModel(action=9)
+    try:
+        driver = AsyncDecisionDriver(
+            createClient(baseURL(server)), 'stub', concurrency=2,
+            envConfigs={'highway-v0': ENV_CONFIG},
+            databaseDir=str(tmp_path), steps=3,
+            networkCacheDir=str(tmp_path / 'networks')
+        )
+        results = runDriver(driver, [('highway-v0', 0)])
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert driver.requests == 6
+    assert [frame['action'] for frame in results[0]['frames']] == [1] * 3
+
+
+def test_failedEpisodeCancelsOthers(tmp_path, stubServer):
+    driver = AsyncDecisionDriver(
+        createClient(baseURL(stubServer)), 'stub',
+        envConfigs={'highway-v0': ENV_CONFIG},
+        databaseDir=str(tmp_path), steps=50,
+        networkCacheDir=str(tmp_path / 'networks')
+    )
+
+    async def collect():
+        try:
+            with pytest.raises(Exception):
+                [result async for result in driver.run(
+                    [('highway-v0', 0), ('missing-v0', 1), ('highway-v0', 2)]
+                )]
+            # 其余的 episode 已经取消并结束，环境都已归还
+            return asyncio.all_tasks() - {asyncio.current_task()}
+        finally:
+            await driver.client.close()
+    assert not asyncio.run(collect())
+    assert len(driver.worker.envs['highway-v0']) == 2
@@ -0,0 +1,97 @@
+import math
+import os
+import sqlite3
+
+import pytest
+
+from dilu.scenario.bufferedDBBridge import (
+    BufferedDBBridge, DBWriter, INSERT_PROMPT_LOG
+)
+
+from conftest import ENV_CONFIG, recordEpisode
+
+
+def queryRows(database: str, query: str) -> list:
+    conn = sqlite3.connect(database)
+    try:
+        return conn.execute(query).fetchall()
+    finally:
+        conn.close()
+
+
+def test_bufferedRowsMatchDBBridge(tmp_path):
+    # 缓冲模式写入和 DBBridge 相同的 vehINFO / promptsLLM 行。
+    # 车辆编号每次运行都不同，不比较编号和含有编号的描述
+    prompts = {}
+    for bufferedDB in (False, True):
+        database = str(tmp_path / f'episode-{bufferedDB}.db')
+        _, descriptions = recordEpisode(
+            'Highway_envScenario', 'highway-v0', 1, 25,
+            database=database, bufferedDB=bufferedDB
+        )
+        prompts[bufferedDB] = queryRows(database, """SELECT decisionFrame,
+            done, thoughtsAndAction FROM promptsLLM ORDER BY decisionFrame""")
+        assert len(prompts[bufferedDB]) == len(descriptions)
+        assert queryRows(
+            database, 'SELECT COUNT(DISTINCT frame) FROM vehINFO'
+        )[0][0] == len(descriptions)
+    assert prompts[True] == prompts[False]
+
+    # 编号是 id(vehicle) % 1000，可能重复，vehINFO 里同一帧同一编号只保留最后写入的行
+    expected = {}
+    for frame, vid, x, y, laneID, heading, speed in queryRows(
+            database, """SELECT frame, id, x, y, laneID, heading, speed
+            FROM vehicleLog ORDER BY rowid"""):
+        expected[(frame, str(vid))] = (
+            x, y, str(laneID), round(speed * math.cos(heading), 6),
+            round(speed * math.sin(heading), 6)
+        )
+    assert {
+        (frame, vid): (x, y, laneID, speedx, speedy)
+        for frame, vid, x, y, laneID, speedx, speedy in queryRows(
+            database, """SELECT frame, id, x, y, lane_id, ROUND(speedx, 6),
+            ROUND(speedy, 6) FROM vehINFO""")
+    } == expected
+    # cached 标记在 decisionLog 里
+    assert queryRows(
+        database, 'SELECT COUNT(*), SUM(cached) FROM decisionLog'
+    )[0] == (len(descriptions), 0)
+
+
+def test_promptsCountTowardsFlush(tmp_path):
+    database = str(tmp_path / 'episode.db')
+    gym = pytest.importorskip('gymnasium')
+    env = gym.make('highway-v0', config=ENV_CONFIG).unwrapped
+    env.reset(seed=1)
+    bridge = BufferedDBBridge(database, env, flushFrames=4)
+    bridge.createTable()
+    try:
+        # 只写 prompt，不写车辆帧，达到 flushFrames 时也要交给写线程
+        for frame in range(4):
+            bridge.insertPrompts(frame, '', False, 'description', '', '')
+        bridge.writer.sync()
+        assert queryRows(database, 'SELECT COUNT(*) FROM promptsLLM')[0][0] == 4
+    finally:
+        bridge.close()
+
+
+def test_writerReportsConnectionFailure(tmp_path):
+    # 数据库所在的目录不存在，写线程连接失败
+    writer = DBWriter(str(tmp_path / 'missing' / 'episode.db'), queueSize=1)
+    batch = [(INSERT_PROMPT_LOG, [('episode', 0, '', False, '', '', '', False)])]
+    with pytest.raises(RuntimeError):
+        writer.sync()
+    # 队列只有一个位置，写线程不再取出任务的话 submit 会一直等待
+    failures = 0
+    for _ in range(4):
+        try:
+            writer.submit(batch)
+        except RuntimeError:
+            failures += 1
+    try:
+        writer.close()
+    except RuntimeError:
+        failures += 1
+    assert failures
+    assert not writer.thread.is_alive()
+    assert not os.path.exists(tmp_path / 'missing')
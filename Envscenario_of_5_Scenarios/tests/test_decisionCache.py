@@ -0,0 +1,81 @@
+import sqlite3
+
+import numpy as np
+import pytest
+
+from dilu.scenario.decisionCache import DecisionCache
+from dilu.scenario.scenarioKey import KEY_DIM
+
+from conftest import ENV_CONFIG
+
+
+def test_lruEvictionAndStats():
+    cache = DecisionCache(maxSize=2)
+    signatures = [
+        cache.signature('highway-v0', np.full(KEY_DIM, value), [0, 1, 2])
+        for value in (0.0, 10.0, 20.0)
+    ]
+    assert cache.get(signatures[0]) is None
+    cache.put(signatures[0], 1, 'idle')
+    cache.put(signatures[1], 3, 'faster')
+    # 取过的签名移到最后，超过 maxSize 时淘汰最久没有用到的
+    assert cache.get(signatures[0]) == (1, 'idle')
+    cache.put(signatures[2], 4, 'slower')
+    assert cache.get(signatures[1]) is None
+    assert cache.get(signatures[2]) == (4, 'slower')
+    assert cache.stats() == {
+        'size': 2, 'hits': 2, 'misses': 2, 'evictions': 1, 'hitRate': 0.5
+    }
+
+
+def test_signatureQuantization():
+    cache = DecisionCache()
+    key = np.zeros(KEY_DIM, dtype=np.float32)
+    nearby = key.copy()
+    # egoSpeed 的尺度是 2 m/s，0.5 m/s 的差别量化后相同
+    nearby[2] += 0.5
+    assert cache.signature('merge-v0', key, [1]) == cache.signature('merge-v0', nearby, [1])
+    assert cache.signature('merge-v0', key, [1]) != cache.signature('merge-v0', key, [1, 2])
+    assert cache.signature('merge-v0', key, [1]) != cache.signature('highway-v0', key, [1])
+
+
+def test_cachedFramesLogged(tmp_path):
+    pytest.importorskip('openai')
+    from dilu.scenario.asyncDriver import (
+        AsyncDecisionDriver, createClient, serveStubModel
+    )
+    import asyncio
+
+    server = serveStubModel(action=1)
+    # 量化得很粗，相邻帧的签名相同，之后的帧直接使用缓存的决策
+    cache = DecisionCache(resolution=100.0)
+    driver = AsyncDecisionDriver(
+        createClient(f'http://127.0.0.1:{server.server_port}/v1'), 'stub',
+        envConfigs={'highway-v0': ENV_CONFIG}, databaseDir=str(tmp_path),
+        sharedDB=True, steps=15, decisionCache=cache,
+        networkCacheDir=str(tmp_path / 'networks')
+    )
+
+    async def collect():
+        try:
+            return [result async for result in driver.run([('highway-v0', 1)])]
+        finally:
+            await driver.client.close()
+    try:
+        result, = asyncio.run(collect())
+    finally:
+        server.shutdown()
+        server.server_close()
+    cachedFrames = [frame['frame'] for frame in result['frames'] if frame['cached']]
+    assert cachedFrames
+    assert cache.stats()['hits'] == len(cachedFrames)
+    assert driver.requests == len(result['frames']) - len(cachedFrames)
+    conn = sqlite3.connect(result['database'])
+    try:
+        logged = [row[0] for row in conn.execute(
+            'SELECT frame FROM promptLog WHERE episodeID = ? AND cached = 1 ORDER BY frame',
+            (result['episodeID'],)
+        )]
+    finally:
+        conn.close()
+    assert logged == cachedFrames
@@ -0,0 +1,72 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from dilu.scenario.decisionQueue import DecisionQueue
+
+
+class EchoCompletions:
+    # 按 /completions 的格式回答每个提示词，回答的顺序和提示词相反；
+    # dropIndex 给定时缺少这一个回答，另外返回一个 index 超出范围的回答
+    def __init__(self, dropIndex=None):
+        self.requests = []
+        self.dropIndex = dropIndex
+
+    async def create(self, model, prompt, **kwargs):
+        self.requests.append(list(prompt))
+        choices = [
+            SimpleNamespace(index=i, text=f'answer to {text}')
+            for i, text in enumerate(prompt) if i != self.dropIndex
+        ]
+        if self.dropIndex is not None:
+            choices.append(SimpleNamespace(index=len(prompt), text='extra'))
+        return SimpleNamespace(choices=choices[::-1])
+
+
+def makeQueue(completions: EchoCompletions, **kwargs) -> DecisionQueue:
+    client = SimpleNamespace(completions=completions)
+    return DecisionQueue(client, 'model', generationPrompt='', **kwargs)
+
+
+def test_promptsGroupedByPrefixAndRoutedByIndex():
+    completions = EchoCompletions()
+    queue = makeQueue(completions, window=0.05)
+    prompts = [('a', 'A1'), ('b', 'B1'), ('a', 'A2'), ('a', 'A3'), ('b', 'B2')]
+
+    async def run():
+        return await asyncio.gather(*(
+            queue.submit(text, prefixKey) for prefixKey, text in prompts
+        ))
+    answers = asyncio.run(run())
+    assert answers == [f'answer to {text}' for _, text in prompts]
+    # 窗口内到达的提示词按前缀分成两个请求
+    assert sorted(completions.requests) == [['A1', 'A2', 'A3'], ['B1', 'B2']]
+    assert queue.stats()['requests'] == 2
+    assert queue.stats()['maxBatchSize'] == 3
+
+
+def test_fullBatchDispatchedImmediately():
+    completions = EchoCompletions()
+    queue = makeQueue(completions, window=10.0, maxBatch=2)
+
+    async def run():
+        return await asyncio.wait_for(asyncio.gather(
+            queue.submit('A1', 'a'), queue.submit('A2', 'a')
+        ), timeout=1.0)
+    assert asyncio.run(run()) == ['answer to A1', 'answer to A2']
+
+
+def test_missingAnswerFailsOnlyItsPrompt():
+    completions = EchoCompletions(dropIndex=1)
+    queue = makeQueue(completions, window=0.01)
+
+    async def run():
+        return await asyncio.gather(
+            queue.submit('A1', 'a'), queue.submit('A2', 'a'),
+            queue.submit('A3', 'a'), return_exceptions=True
+        )
+    first, second, third = asyncio.run(run())
+    assert first == 'answer to A1'
+    assert isinstance(second, RuntimeError)
+    assert third == 'answer to A3'
@@ -0,0 +1,92 @@
+import importlib
+import json
+import os
+import random
+
+import gymnasium as gym
+import highway_env
+from highway_env.vehicle.behavior import IDMVehicle
+import numpy as np
+import pytest
+
+from conftest import ENV_CONFIG
+
+
+# 各场景模块在原始版本上生成的描述，车辆编号按 describeEpisode 里的 recordID 替换。
+# Roundabout_envScenario 原来只是占位文件，它的描述来自改为只描述最近车辆之后的版本
+BASELINE = os.path.join(os.path.dirname(__file__), 'data', 'describeBaseline.json')
+
+INTERSECTION_CONFIG = {
+    'action': {
+        'type': 'DiscreteMetaAction', 'longitudinal': True, 'lateral': False,
+        'target_speeds': [0, 4.5, 9]
+    },
+    'duration': 100
+}
+
+# (EnvScenario 模块, envType, 环境配置)
+CASES = [
+    ('Highway_envScenario', 'highway-v0', ENV_CONFIG),
+    ('Merge_envScenario', 'merge-v0', ENV_CONFIG),
+    ('Intersection_envScenario', 'intersection-v1', INTERSECTION_CONFIG),
+    ('Racetrack_envScenario', 'roundabout-v0', ENV_CONFIG),
+    ('Racetrack_envScenario', 'highway-v0', ENV_CONFIG),
+    ('Roundabout_envScenario', 'roundabout-v0', ENV_CONFIG),
+]
+
+STEPS = 15
+
+# intersection-v1 创建车辆时直接改 IDMVehicle 的类属性，会影响之后在同一进程里运行的场景，
+# 每个用例开始前恢复成导入时的值
+IDM_DEFAULTS = {
+    name: getattr(IDMVehicle, name)
+    for name in ('DISTANCE_WANTED', 'COMFORT_ACC_MAX', 'COMFORT_ACC_MIN')
+}
+
+
+@pytest.fixture(autouse=True)
+def restoreIDMVehicle():
+    for name, value in IDM_DEFAULTS.items():
+        setattr(IDMVehicle, name, value)
+    yield
+
+
+def describeEpisode(
+        module: str, envType: str, config: dict, seed: int, database: str
+) -> list:
+    # highway_env 有的地方用全局随机数，不固定的话结果和之前运行的测试有关
+    random.seed(seed)
+    np.random.seed(seed)
+    env = gym.make(envType, config=config).unwrapped
+    env.reset(seed=seed)
+    scenarioClass = importlib.import_module('dilu.scenario.' + module).EnvScenario
+    sce = scenarioClass(
+        env, envType, seed, database,
+        networkCacheDir=os.path.join(os.path.dirname(database), 'networks')
+    )
+    rng = np.random.RandomState(seed)
+    descriptions = []
+    count = 0
+    for frame in range(STEPS):
+        # 描述里的车辆编号默认是 id(vehicle) % 1000，每次运行都不同，
+        # 这里按车辆出现的先后给每辆车一个固定的 recordID
+        for veh in env.road.vehicles:
+            if getattr(veh, 'recordID', None) is None:
+                veh.recordID = count
+                count += 1
+        descriptions.append(sce.describe(frame))
+        actions = env.get_available_actions()
+        _, _, done, truncated, _ = env.step(actions[rng.randint(len(actions))])
+        if done or truncated:
+            break
+    return descriptions
+
+
+@pytest.mark.parametrize('module, envType, config', CASES)
+def test_describeMatchesBaseline(tmp_path, module, envType, config):
+    with open(BASELINE) as f:
+        baseline = json.load(f)
+    descriptions = describeEpisode(
+        module, envType, config, 1, str(tmp_path / 'episode.db')
+    )
+    assert descriptions == baseline[f'{module}/{envType}']
@@ -0,0 +1,29 @@
+from dilu.scenario.descriptionBuilder import FragmentCache
+from dilu.scenario.envScenarioCore import SV_STATE_LANE_POSITION
+
+from conftest import recordEpisode
+
+
+def test_fragmentsReusedForOneFrame():
+    cache = FragmentCache()
+    values = (1.005, 2.0, 0.0, -0.125, 30.0)
+    fragment = cache.render(SV_STATE_LANE_POSITION, *values)
+    assert fragment == SV_STATE_LANE_POSITION.format(*values)
+    cache.startFrame()
+    assert cache.render(SV_STATE_LANE_POSITION, *values) is fragment
+    assert (cache.hits, cache.misses) == (1, 1)
+    # 上一帧没有用到的片段不再保留
+    cache.startFrame()
+    cache.startFrame()
+    assert cache.render(SV_STATE_LANE_POSITION, *values) is not fragment
+    assert cache.misses == 2
+
+
+def test_laneRelationFragmentsReused(tmp_path):
+    # 车辆的车道关系在帧之间通常不变，这部分片段复用上一帧的结果
+    sce, descriptions = recordEpisode(
+        'Highway_envScenario', 'highway-v0', 1, 10,
+        database=str(tmp_path / 'episode.db')
+    )
+    assert len(descriptions) > 1
+    assert sce.fragments.hits > 0
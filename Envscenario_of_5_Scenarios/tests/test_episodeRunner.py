@@ -0,0 +1,36 @@
+import sqlite3
+
+from dilu.scenario.episodeRunner import runEpisodes
+
+from conftest import ENV_CONFIG
+
+
+def countFrames(database: str, table: str, episodeID: str) -> int:
+    conn = sqlite3.connect(database)
+    try:
+        return conn.execute(
+            f'SELECT COUNT(DISTINCT frame) FROM {table} WHERE episodeID = ?',
+            (episodeID,)
+        ).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_sharedDBPersistsEveryEpisode(tmp_path):
+    envConfigs = {
+        'highway-v0': ENV_CONFIG, 'merge-v0': ENV_CONFIG,
+        'roundabout-v0': ENV_CONFIG
+    }
+    tasks = [(envType, seed) for envType in envConfigs for seed in range(2)]
+    results = list(runEpisodes(
+        tasks, envConfigs, databaseDir=str(tmp_path), sharedDB=True,
+        steps=25, processes=2, networkCacheDir=str(tmp_path / 'networks')
+    ))
+    assert len(results) == len(tasks)
+    for result in results:
+        frames = len(result['frames'])
+        assert frames > 0
+        for table in ('vehicleLog', 'promptLog'):
+            assert countFrames(
+                result['database'], table, result['episodeID']
+            ) == frames
@@ -0,0 +1,109 @@
+import numpy as np
+
+from dilu.scenario.experienceMemory import IVFIndex, ExperienceMemory, normalize
+from dilu.scenario.scenarioKey import KEY_DIM
+
+
+def clusteredVectors(count: int, dim: int = 32, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(32, dim))
+    return (
+        centers[rng.integers(len(centers), size=count)]
+        + 0.3 * rng.normal(size=(count, dim))
+    ).astype(np.float32)
+
+
+def exactSearch(vectors: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    scores = normalize(queries) @ normalize(vectors).T
+    return np.argsort(-scores, axis=1, kind='stable')[:, :k]
+
+
+def test_ivfRecallMatchesExactScan():
+    vectors = clusteredVectors(2000)
+    queries = clusteredVectors(50, seed=1)
+    expected = exactSearch(vectors, queries, 5)
+
+    index = IVFIndex(32, trainSize=256)
+    index.add(vectors)
+    assert index.centroids is not None
+    # 查询所有簇时和逐个比较的结果相同
+    index.nprobe = len(index.centroids)
+    _, rows = index.search(queries, 5)
+    assert (rows == expected).all()
+
+    # 默认只查询最近的 8 个簇，召回率仍然接近逐个比较
+    index.nprobe = 8
+    _, rows = index.search(queries, 5)
+    recall = np.mean([
+        len(set(found) & set(exact)) / 5
+        for found, exact in zip(rows.tolist(), expected.tolist())
+    ])
+    assert recall >= 0.9
+
+
+def test_ivfRetrainsWhenGrownFourfold():
+    vectors = clusteredVectors(1024)
+    index = IVFIndex(32, trainSize=64)
+    index.add(vectors[:63])
+    assert index.centroids is None
+    index.add(vectors[63:64])
+    assert index.trainedCount == 64
+    assert len(index.centroids) == 8
+    index.add(vectors[64:255])
+    assert index.trainedCount == 64
+    assert sum(len(rows) for rows in index.lists) == 255
+    index.add(vectors[255:256])
+    assert index.trainedCount == 256
+    assert len(index.centroids) == 16
+    assert sorted(row for rows in index.lists for row in rows) == list(range(256))
+
+
+def test_ivfSaveLoad(tmp_path):
+    vectors = clusteredVectors(600)
+    queries = clusteredVectors(20, seed=1)
+    index = IVFIndex(32, trainSize=256)
+    index.add(vectors)
+    path = str(tmp_path / 'index.npz')
+    index.save(path)
+    loaded = IVFIndex(32, trainSize=256)
+    loaded.load(path)
+    assert len(loaded) == len(index)
+    assert loaded.trainedCount == index.trainedCount
+    for a, b in zip(index.search(queries, 5), loaded.search(queries, 5)):
+        assert np.array_equal(a, b)
+
+
+def test_memorySaveLoad(tmp_path):
+    memory = ExperienceMemory(str(tmp_path))
+    descriptions = [
+        f'You are driving on a {lanes}-lane highway at {speed} m/s.'
+        for lanes in range(2, 6) for speed in range(20, 30)
+    ]
+    memory.addBatch(
+        'highway-v0', descriptions,
+        [(description, f'answer {i}') for i, description in enumerate(descriptions)]
+    )
+    memory.save()
+    loaded = ExperienceMemory(str(tmp_path))
+    assert len(loaded) == len(descriptions)
+    query = 'You are driving on a 3-lane highway at 25 m/s.'
+    assert loaded.retrieve('highway-v0', query) == memory.retrieve('highway-v0', query)
+    assert loaded.retrieve('highway-v0', query)[0]['response'] == 'answer 15'
+
+
+def test_retrieveByKeyWithoutEmbedding(tmp_path):
+    # embed 为 None 时只按场景特征检索，不需要描述
+    memory = ExperienceMemory(str(tmp_path), embed=None)
+    keys = np.zeros((10, KEY_DIM), dtype=np.float32)
+    keys[:, 2] = np.arange(10) * 3.0
+    for i, key in enumerate(keys):
+        memory.add('merge-v0', '', f'question {i}', f'answer {i}', key)
+    query = keys[4].copy()
+    query[2] += 1.0
+    retrieved = memory.retrieve('merge-v0', k=2, key=query)
+    assert [entry['response'] for entry in retrieved] == ['answer 4', 'answer 5']
+    assert memory.retrieve('merge-v0', 'a description') == []
+
+    memory.save()
+    loaded = ExperienceMemory(str(tmp_path), embed=None)
+    assert loaded.retrieve('merge-v0', k=2, key=query) == retrieved
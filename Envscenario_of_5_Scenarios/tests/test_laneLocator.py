@@ -0,0 +1,44 @@
+import gymnasium as gym
+import highway_env
+import numpy as np
+import pytest
+
+from dilu.scenario.laneLocator import LaneLocator
+
+
+ENV_TYPES = [
+    'highway-v0', 'merge-v0', 'intersection-v1', 'roundabout-v0',
+    'racetrack-v0'
+]
+
+
+def samplePoints(network, rng: np.random.RandomState) -> np.ndarray:
+    # 每条车道的两端、两端之外和中点，横向在车道中心、边线和车道之外；
+    # 另外在整个路网范围内随机取点
+    points = []
+    for _from, toDict in network.graph.items():
+        for _to, lanes in toDict.items():
+            for lane in lanes:
+                width = lane.width_at(0)
+                for s in (-5, -0.5, 0, 0.5, lane.length / 2,
+                          lane.length - 0.5, lane.length, lane.length + 5):
+                    for r in (-1.5 * width, -width / 2, 0, width / 2, 1.5 * width):
+                        points.append(lane.position(s, r))
+    points = np.array(points)
+    low, high = points.min(axis=0) - 20, points.max(axis=0) + 20
+    return np.concatenate((points, rng.uniform(low, high, size=(500, 2))))
+
+
+@pytest.mark.parametrize('envType', ENV_TYPES)
+def test_closestLaneIndexMatchesNetwork(envType):
+    env = gym.make(envType).unwrapped
+    env.reset(seed=0)
+    network = env.road.network
+    locator = LaneLocator(network)
+    rng = np.random.RandomState(0)
+    for position in samplePoints(network, rng):
+        assert locator.closestLaneIndex(position) == \
+            network.get_closest_lane_index(position), position
+        heading = rng.uniform(-np.pi, np.pi)
+        assert locator.closestLaneIndex(position, heading) == \
+            network.get_closest_lane_index(position, heading), (position, heading)
@@ -0,0 +1,68 @@
+import os
+
+import gymnasium as gym
+import highway_env
+
+from dilu.scenario.networkGeometry import NetworkGeometry, configKey
+from dilu.scenario.sharedScenarioDB import ScenarioDatabase
+
+from conftest import ENV_CONFIG, recordEpisode
+
+
+def makeEnv(envType: str):
+    env = gym.make(envType, config=ENV_CONFIG).unwrapped
+    env.reset(seed=1)
+    return env
+
+
+def test_staleCacheEntryIsRebuilt(tmp_path):
+    # 缓存里同一个键下存的是另一个路网，车道数量相同也不能使用
+    env = makeEnv('highway-v0')
+    key = configKey(env, 'highway-v0')
+    expected = NetworkGeometry.fromNetwork(env.road.network)
+    env.road.network.lanes_list()[0].start += 1.0
+    stale = NetworkGeometry.fromNetwork(env.road.network)
+    env.road.network.lanes_list()[0].start -= 1.0
+    assert stale.laneCount == expected.laneCount
+    assert stale.hash != expected.hash
+
+    NetworkGeometry.memory[key] = stale
+    assert NetworkGeometry.forEnv(env, 'highway-v0', False).hash == expected.hash
+
+    NetworkGeometry.memory.pop(key)
+    stale.save(str(tmp_path), key)
+    geometry = NetworkGeometry.forEnv(env, 'highway-v0', str(tmp_path))
+    assert geometry.hash == expected.hash
+    NetworkGeometry.memory.pop(key)
+    assert NetworkGeometry.load(str(tmp_path), key).hash == expected.hash
+
+
+def test_sharedDBStoresNetworkOnce(tmp_path):
+    database = str(tmp_path / 'scenarios.db')
+    for seed in (1, 2):
+        recordEpisode(
+            'Highway_envScenario', 'highway-v0', seed, 2,
+            database=database, sharedDB=True
+        )
+    db = ScenarioDatabase.open(database)
+    db.close()
+    reopened = ScenarioDatabase.open(database)
+    try:
+        assert len(reopened.writtenNetworks) == 1
+    finally:
+        reopened.close()
+
+
+def test_networkCacheDir(tmp_path, monkeypatch):
+    # 默认目录在调用时从环境变量读取；networkCacheDir 指定其他目录，False 时不写磁盘
+    monkeypatch.setenv('DILU_NETWORK_CACHE', str(tmp_path / 'default'))
+    for networkCacheDir in (None, str(tmp_path / 'networks'), False):
+        monkeypatch.setattr(NetworkGeometry, 'memory', {})
+        recordEpisode(
+            'Highway_envScenario', 'highway-v0', 1, 1,
+            database=str(tmp_path / 'episode.db'),
+            networkCacheDir=networkCacheDir
+        )
+    assert len(os.listdir(tmp_path / 'default')) == 2
+    assert len(os.listdir(tmp_path / 'networks')) == 2
+    assert sorted(os.listdir(tmp_path)) == ['default', 'episode.db', 'networks']
@@ -0,0 +1,22 @@
+from dilu.scenario.promptBuilder import DELIMITER, PromptBuilder
+
+
+def test_defaultTemplatesFillDelimiter():
+    builder = PromptBuilder()
+    assert '{delimiter}' not in builder.systemMessage
+    assert f'delimited by {DELIMITER}.' in builder.systemMessage
+    prompt = builder.build('highway-v0', 'scene', 'actions')
+    assert f'{DELIMITER} Driving scenario description:\nscene\n' in prompt.human['content']
+
+
+def test_customTemplates():
+    builder = PromptBuilder(
+        systemMessage='Answer after {delimiter}.',
+        humanMessage='{delimiter}{scenario_description}|{available_actions}|{driving_intentions}',
+        delimiter='###'
+    )
+    prompt = builder.build('highway-v0', 'scene', 'actions', drivingIntentions='go')
+    assert prompt.messages == [
+        {'role': 'system', 'content': 'Answer after ###.'},
+        {'role': 'user', 'content': '###scene|actions|go'}
+    ]
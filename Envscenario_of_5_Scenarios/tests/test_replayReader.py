@@ -0,0 +1,52 @@
+import sqlite3
+
+import pytest
+
+from dilu.scenario.replayReader import replayCorpus, replayDatabaseEpisode
+
+from conftest import recordEpisode
+
+
+# (EnvScenario 模块, envType)，Racetrack 模块在 roundabout-v0 上生成的描述
+# 和 envType 默认的 Roundabout 模块不同
+CASES = [
+    ('Highway_envScenario', 'highway-v0'),
+    ('Merge_envScenario', 'merge-v0'),
+    ('Roundabout_envScenario', 'roundabout-v0'),
+    ('Racetrack_envScenario', 'roundabout-v0'),
+]
+
+
+def test_replaySharedDatabase(tmp_path):
+    database = str(tmp_path / 'scenarios.db')
+    online = {}
+    for module, envType in CASES:
+        sce, descriptions = recordEpisode(
+            module, envType, 1, 15, database=database, sharedDB=True
+        )
+        online[sce.dbBridge.episodeID] = descriptions
+    replayed = replayCorpus(database=database, processes=1)
+    assert replayed == online
+
+
+def test_replayBufferedDatabase(tmp_path):
+    # 缓冲模式的数据库只有一个 episode，和共享数据库一样记录了模块和路网
+    database = str(tmp_path / 'episode.db')
+    sce, descriptions = recordEpisode(
+        'Racetrack_envScenario', 'roundabout-v0', 1, 15,
+        database=database, bufferedDB=True
+    )
+    assert replayCorpus(database=database, processes=1) == {
+        sce.dbBridge.episodeID: descriptions
+    }
+
+
+def test_replayRejectsDBBridgeDatabase(tmp_path):
+    database = str(tmp_path / 'plain.db')
+    conn = sqlite3.connect(database)
+    conn.execute('CREATE TABLE vehINFO(id INT, frame INT)')
+    conn.close()
+    with pytest.raises(ValueError, match='sharedDB=True'):
+        replayDatabaseEpisode(database, 'episode')
+    with pytest.raises(ValueError, match='sharedDB=True'):
+        replayCorpus(database=database)
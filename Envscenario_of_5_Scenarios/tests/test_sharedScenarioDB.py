@@ -0,0 +1,36 @@
+import sqlite3
+
+from dilu.scenario.sharedScenarioDB import ScenarioDatabase
+
+from conftest import recordEpisode
+
+
+def countPerEpisode(database: str, table: str) -> dict:
+    conn = sqlite3.connect(database)
+    try:
+        return dict(conn.execute(
+            f'SELECT episodeID, COUNT(DISTINCT frame) FROM {table} GROUP BY episodeID'
+        ))
+    finally:
+        conn.close()
+
+
+def test_framesAndPromptsPersistedAcrossReopen(tmp_path):
+    database = str(tmp_path / 'scenarios.db')
+    frames = {}
+    for seed in range(2):
+        sce, descriptions = recordEpisode(
+            'Highway_envScenario', 'highway-v0', seed, 25,
+            database=database, sharedDB=True
+        )
+        frames[sce.dbBridge.episodeID] = len(descriptions)
+    # 关闭写线程后重新打开同一个数据库，之后的 episode 追加到已有的表里
+    ScenarioDatabase.closeAll()
+    sce, descriptions = recordEpisode(
+        'Merge_envScenario', 'merge-v0', 2, 25,
+        database=database, sharedDB=True
+    )
+    frames[sce.dbBridge.episodeID] = len(descriptions)
+    ScenarioDatabase.closeAll()
+    assert countPerEpisode(database, 'vehicleLog') == frames
+    assert countPerEpisode(database, 'promptLog') == frames
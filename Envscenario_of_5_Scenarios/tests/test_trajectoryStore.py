@@ -0,0 +1,35 @@
+import sqlite3
+
+import numpy as np
+
+from dilu.scenario.replayReader import replayCorpus
+from dilu.scenario.trajectoryStore import TrajectoryStore
+
+from conftest import recordEpisode
+
+
+def test_framesPersistedAndReplayed(tmp_path):
+    trajectoryDir = str(tmp_path / 'trajectories')
+    online = {}
+    prompts = {}
+    for seed in range(2):
+        database = str(tmp_path / f'episode-{seed}.db')
+        sce, descriptions = recordEpisode(
+            'Highway_envScenario', 'highway-v0', seed, 25,
+            database=database, trajectoryDir=trajectoryDir
+        )
+        online[sce.trajectory.episodeID] = descriptions
+        conn = sqlite3.connect(database)
+        try:
+            prompts[sce.trajectory.episodeID] = conn.execute(
+                'SELECT COUNT(*) FROM promptsLLM'
+            ).fetchone()[0]
+        finally:
+            conn.close()
+    store = TrajectoryStore(trajectoryDir)
+    assert sorted(store.episodes()) == sorted(online)
+    for episodeID, descriptions in online.items():
+        frames = np.unique(store.column('frame', episodeID))
+        assert frames.tolist() == list(descriptions)
+        assert prompts[episodeID] == len(descriptions)
+    assert replayCorpus(directory=trajectoryDir, processes=1) == online
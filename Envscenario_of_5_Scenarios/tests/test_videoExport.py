@@ -0,0 +1,32 @@
+import sqlite3
+import zipfile
+
+import pytest
+
+from dilu.scenario.videoExport import exportVideos
+
+from conftest import recordEpisode
+
+
+def test_exportSharedDatabase(tmp_path):
+    database = str(tmp_path / 'scenarios.db')
+    sce, descriptions = recordEpisode(
+        'Highway_envScenario', 'highway-v0', 1, 5,
+        database=database, sharedDB=True
+    )
+    outputs = exportVideos(
+        str(tmp_path / 'videos'), database=database, format='zip',
+        chunkFrames=2, processes=1
+    )
+    episodeID = sce.dbBridge.episodeID
+    with zipfile.ZipFile(outputs[episodeID]) as archive:
+        assert len(archive.namelist()) == len(descriptions)
+
+
+def test_exportRejectsDBBridgeDatabase(tmp_path):
+    database = str(tmp_path / 'plain.db')
+    conn = sqlite3.connect(database)
+    conn.execute('CREATE TABLE vehINFO(id INT, frame INT)')
+    conn.close()
+    with pytest.raises(ValueError, match='sharedDB=True'):
+        exportVideos(str(tmp_path / 'videos'), database=database, format='zip')
@@ -0,0 +1,197 @@
+from typing import List, Tuple, Optional, Union, Dict, Iterator
+import atexit
+import json
+import os
+import uuid
+
+import numpy as np
+
+from dilu.scenario.vehicleRecord import VehicleRecord, EGO
+from dilu.scenario.networkGeometry import NetworkGeometry, writeAtomic
+
+
+# 每一列单独保存为一个 .npy 文件，读取时用 mmap 打开，聚合分析不需要逐行查询
+COLUMNS: Tuple[Tuple[str, type], ...] = (
+    ('frame', np.int32),
+    ('id', np.int32),
+    ('isEgo', np.bool_),
+    ('x', np.float64),
+    ('y', np.float64),
+    ('heading', np.float64),
+    ('speed', np.float64),
+    ('acceleration', np.float64),
+    ('laneFrom', np.str_),
+    ('laneTo', np.str_),
+    ('laneID', np.int32),
+)
+
+META_FILE = 'meta.json'
+# 路网描述按哈希保存在轨迹目录里，回放时不需要仿真环境
+NETWORK_FILE = 'network-{}.json'
+
+
+def recordValues(frame: int, record: VehicleRecord) -> Tuple:
+    laneFrom, laneTo, laneID = record.laneIndex
+    return (
+        frame, record.id, record.relation == EGO,
+        record.x, record.y, record.heading, record.speed,
+        record.acceleration, str(laneFrom), str(laneTo), laneID
+    )
+
+
+class TrajectoryWriter:
+    # 把一个 episode 每帧的车辆记录按列缓存，每 chunkFrames 帧写成一个块目录。
+    # 块先写到临时目录再整体改名，读取方不会看到写了一半的块；
+    # 多个进程可以写同一个目录，块名里带有 episodeID
+    def __init__(
+            self, directory: str, envType: str = '', seed: int = 0,
+            episodeID: str = None, chunkFrames: int = 200,
+            geometry: Optional[NetworkGeometry] = None, scenario: str = ''
+    ) -> None:
+        self.directory = directory
+        self.envType = envType
+        self.seed = seed
+        self.episodeID = episodeID or uuid.uuid4().hex
+        self.chunkFrames = chunkFrames
+        self.scenario = scenario
+        self.chunkCount = 0
+        self.rows: List[Tuple] = []
+        self.frames: List[int] = []
+        # ego 在每一帧描述之前的 route，回放时用来得到同样的 nextLane
+        self.routes: Dict[str, List] = {}
+        self.closed = False
+        os.makedirs(directory, exist_ok=True)
+
+        self.networkHash = geometry.hash if geometry else None
+        if geometry:
+            networkPath = os.path.join(
+                directory, NETWORK_FILE.format(geometry.hash)
+            )
+            if not os.path.exists(networkPath):
+                writeAtomic(networkPath, json.dumps(geometry.description))
+        # 没有调用 close 时，进程退出前也要把缓冲区里的数据写完
+        atexit.register(self.close)
+
+    def append(
+            self, frame: int, egoRecord: VehicleRecord,
+            records: List[VehicleRecord], route: Optional[List] = None
+    ) -> None:
+        self.rows.append(recordValues(frame, egoRecord))
+        self.rows.extend(recordValues(frame, record) for record in records)
+        self.frames.append(frame)
+        if route is not None:
+            # route 在之后的 next_lane 中会被修改，这里立即复制
+            self.routes[str(frame)] = [list(lidx) for lidx in route]
+        if len(self.frames) >= self.chunkFrames:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self.frames:
+            return
+        name = f'{self.episodeID}-{self.chunkCount:05d}'
+        tmpPath = os.path.join(self.directory, '.' + name)
+        os.makedirs(tmpPath, exist_ok=True)
+        columns = list(zip(*self.rows))
+        for (column, dtype), values in zip(COLUMNS, columns):
+            np.save(
+                os.path.join(tmpPath, column + '.npy'),
+                np.array(values, dtype=dtype)
+            )
+        meta = {
+            'episodeID': self.episodeID,
+            'envType': self.envType,
+            'seed': self.seed,
+            'scenario': self.scenario,
+            'networkHash': self.networkHash,
+            'chunk': self.chunkCount,
+            'firstFrame': min(self.frames),
+            'lastFrame': max(self.frames),
+            'frames': len(self.frames),
+            'rows': len(self.rows),
+            'routes': self.routes
+        }
+        with open(os.path.join(tmpPath, META_FILE), 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmpPath, os.path.join(self.directory, name))
+        self.chunkCount += 1
+        self.rows = []
+        self.frames = []
+        self.routes = {}
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        atexit.unregister(self.close)
+        self.flush()
+
+
+class TrajectoryStore:
+    # 读取 TrajectoryWriter 写出的目录。index 里每一项对应一个块，
+    # 按 (episodeID, chunk) 排序，记录帧的范围和行数
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        self.index: List[Dict] = []
+        for name in os.listdir(directory):
+            metaPath = os.path.join(directory, name, META_FILE)
+            if name.startswith('.') or not os.path.exists(metaPath):
+                continue
+            with open(metaPath) as f:
+                meta = json.load(f)
+            meta['path'] = os.path.join(directory, name)
+            self.index.append(meta)
+        self.index.sort(key=lambda meta: (meta['episodeID'], meta['chunk']))
+
+    def episodes(self) -> List[str]:
+        return list(dict.fromkeys(meta['episodeID'] for meta in self.index))
+
+    def geometry(self, netHash: str) -> NetworkGeometry:
+        with open(os.path.join(self.directory, NETWORK_FILE.format(netHash))) as f:
+            return NetworkGeometry(json.load(f), netHash)
+
+    def loadChunk(
+            self, meta: Dict, columns: Optional[List[str]] = None
+    ) -> Dict[str, np.ndarray]:
+        names = columns or [column for column, _ in COLUMNS]
+        return {
+            name: np.load(
+                os.path.join(meta['path'], name + '.npy'), mmap_mode='r'
+            )
+            for name in names
+        }
+
+    def chunks(
+            self, episodeID: Optional[str] = None,
+            columns: Optional[List[str]] = None
+    ) -> Iterator[Dict[str, np.ndarray]]:
+        # 每个块的列都是 mmap 数组，逐块扫描不会复制数据
+        for meta in self.index:
+            if episodeID is None or meta['episodeID'] == episodeID:
+                yield self.loadChunk(meta, columns)
+
+    def column(
+            self, name: str, episodeID: Optional[str] = None
+    ) -> np.ndarray:
+        parts = [chunk[name] for chunk in self.chunks(episodeID, [name])]
+        if len(parts) == 1:
+            return parts[0]
+        if not parts:
+            return np.empty(0, dtype=dict(COLUMNS)[name])
+        return np.concatenate(parts)
+
+    def frame(self, episodeID: str, frame: int) -> Dict[str, np.ndarray]:
+        # 块内的行按帧的先后写入，用二分查找取出这一帧的行
+        for meta in self.index:
+            if meta['episodeID'] != episodeID:
+                continue
+            if meta['firstFrame'] <= frame <= meta['lastFrame']:
+                chunk = self.loadChunk(meta)
+                frames = chunk['frame']
+                start = int(np.searchsorted(frames, frame, side='left'))
+                end = int(np.searchsorted(frames, frame, side='right'))
+                if start < end:
+                    return {
+                        name: values[start:end]
+                        for name, values in chunk.items()
+                    }
+        raise KeyError(f"Frame {frame} of episode {episodeID} not found")
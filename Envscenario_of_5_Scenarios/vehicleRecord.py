@@ -0,0 +1,58 @@
+from typing import List, Tuple, Optional, Union, Dict
+
+from highway_env.road.road import LaneIndex
+from highway_env.vehicle.controller import MDPVehicle
+from highway_env.vehicle.behavior import IDMVehicle
+
+
+# 车辆相对 ego 的位置关系
+EGO = 'ego'
+AHEAD = 'ahead'
+BEHIND = 'behind'
+
+
+def vehicleID(veh: Union[IDMVehicle, MDPVehicle]) -> int:
+    # 描述和数据库里的车辆编号。回放时重建的车辆带有记录下来的编号
+    recordID = getattr(veh, 'recordID', None)
+    if recordID is not None:
+        return recordID
+    return id(veh) % 1000
+
+
+class VehicleRecord:
+    # 一帧里一辆车的状态。描述、数据库和回放只需要这些字段，
+    # 用 __slots__ 保存，不持有 IDMVehicle，仿真继续运行也不会改变已经记录的值
+    __slots__ = (
+        'id', 'laneIndex', 'x', 'y', 'heading', 'speed', 'acceleration',
+        'relation'
+    )
+
+    def __init__(
+            self, vid: int, laneIndex: LaneIndex, x: float, y: float,
+            heading: float, speed: float, acceleration: float, relation: str
+    ) -> None:
+        self.id = vid
+        self.laneIndex = laneIndex
+        self.x = x
+        self.y = y
+        self.heading = heading
+        self.speed = speed
+        self.acceleration = acceleration
+        self.relation = relation
+
+    @classmethod
+    def fromVehicle(
+            cls, veh: Union[IDMVehicle, MDPVehicle], relation: str
+    ) -> 'VehicleRecord':
+        return cls(
+            vehicleID(veh), veh.lane_index,
+            float(veh.position[0]), float(veh.position[1]),
+            float(veh.heading), float(veh.speed),
+            float(veh.action['acceleration']), relation
+        )
+
+    def __repr__(self) -> str:
+        return (
+            f"VehicleRecord({self.id}, {self.laneIndex}, {self.relation}, "
+            f"x={self.x:.2f}, y={self.y:.2f}, speed={self.speed:.2f})"
+        )
@@ -0,0 +1,172 @@
+from typing import List, Tuple, Optional, Union, Dict
+import math
+
+from highway_env.road.road import LaneIndex
+from highway_env.vehicle.controller import MDPVehicle
+from highway_env.vehicle.behavior import IDMVehicle
+import numpy as np
+
+from dilu.scenario.vehicleRecord import (
+    VehicleRecord, vehicleID, EGO, AHEAD, BEHIND
+)
+
+
+class VehicleSnapshot:
+    # 每个决策帧把 ego 和周车的状态一次性取到连续的 numpy 数组里，
+    # 距离、前后关系、危险区域和每条车道最近车辆都用批量的数组运算得到，
+    # 避免对每一辆 IDMVehicle 单独做 np.linalg.norm
+    def __init__(
+            self, ego: MDPVehicle, vehicles: List[IDMVehicle]
+    ) -> None:
+        self.ego = ego
+        self.vehicles: List[IDMVehicle] = list(vehicles)
+        count = len(self.vehicles)
+        self.rows: Dict[int, int] = {
+            id(veh): i for i, veh in enumerate(self.vehicles)
+        }
+
+        self.egoPosition = np.asarray(ego.position, dtype=float)
+        self.egoHeading = float(ego.heading)
+        self.egoUnitVector = np.array(
+            [math.cos(self.egoHeading), math.sin(self.egoHeading)]
+        )
+        self.egoVelocity = np.asarray(ego.velocity, dtype=float)
+
+        self.positions = np.empty((count, 2), dtype=float)
+        self.headings = np.empty(count, dtype=float)
+        self.speeds = np.empty(count, dtype=float)
+        self.velocities = np.empty((count, 2), dtype=float)
+        self.accelerations = np.empty(count, dtype=float)
+        self.laneIndices: List[LaneIndex] = []
+        for i, veh in enumerate(self.vehicles):
+            self.positions[i] = veh.position
+            self.headings[i] = veh.heading
+            self.speeds[i] = veh.speed
+            self.velocities[i] = veh.velocity
+            self.accelerations[i] = veh.action['acceleration']
+            self.laneIndices.append(veh.lane_index)
+
+        # road 用 (from, to) 编码成整数，lane 的序号单独存一列
+        self.roadKeys: Dict[Tuple[str, str], int] = {}
+        self.roadIDs = np.fromiter(
+            (self.roadKeys.setdefault(lidx[:2], len(self.roadKeys))
+             for lidx in self.laneIndices),
+            dtype=int, count=count
+        )
+        self.laneIDs = np.fromiter(
+            (lidx[2] for lidx in self.laneIndices), dtype=int, count=count
+        )
+
+        self.relativePositions = self.positions - self.egoPosition
+        self.distances = np.hypot(
+            self.relativePositions[:, 0], self.relativePositions[:, 1]
+        )
+        # 相对位置在 ego 朝向上的投影，>= 0 表示在 ego 前方
+        self.projections = self.relativePositions @ self.egoUnitVector
+        self.ahead = self.projections >= 0
+
+        self._dangerous: Dict[Tuple[float, ...], np.ndarray] = {}
+        self._records: Optional[List[VehicleRecord]] = None
+
+    def __len__(self) -> int:
+        return len(self.vehicles)
+
+    def rowOf(self, veh: Union[IDMVehicle, MDPVehicle]) -> Optional[int]:
+        return self.rows.get(id(veh))
+
+    def covers(self, vehicles: List[IDMVehicle]) -> bool:
+        return all(id(veh) in self.rows for veh in vehicles)
+
+    def rowsOf(self, vehicles: List[IDMVehicle]) -> np.ndarray:
+        return np.fromiter(
+            (self.rows[id(veh)] for veh in vehicles),
+            dtype=int, count=len(vehicles)
+        )
+
+    def egoRecord(self) -> VehicleRecord:
+        return VehicleRecord.fromVehicle(self.ego, EGO)
+
+    def records(self) -> List[VehicleRecord]:
+        # 按快照的行顺序，每帧只生成一次
+        if self._records is None:
+            ids = [vehicleID(veh) for veh in self.vehicles]
+            relations = np.where(self.ahead, AHEAD, BEHIND)
+            self._records = [
+                VehicleRecord(*fields) for fields in zip(
+                    ids, self.laneIndices,
+                    self.positions[:, 0].tolist(),
+                    self.positions[:, 1].tolist(),
+                    self.headings.tolist(), self.speeds.tolist(),
+                    self.accelerations.tolist(), relations.tolist()
+                )
+            ]
+        return self._records
+
+    def memberMask(self, vehicles: List[IDMVehicle]) -> np.ndarray:
+        mask = np.zeros(len(self.vehicles), dtype=bool)
+        mask[self.rowsOf(vehicles)] = True
+        return mask
+
+    def roadMask(self, lidx: LaneIndex) -> np.ndarray:
+        roadID = self.roadKeys.get(lidx[:2])
+        if roadID is None:
+            return np.zeros(len(self.vehicles), dtype=bool)
+        return self.roadIDs == roadID
+
+    def laneMask(self, lidx: LaneIndex) -> np.ndarray:
+        return self.roadMask(lidx) & (self.laneIDs == lidx[2])
+
+    def sideLaneMask(self, lidx: LaneIndex, numLanes: int) -> np.ndarray:
+        # 等价于 `sv.lane_index in network.all_side_lanes(lidx)`
+        return self.roadMask(lidx) & (self.laneIDs < numLanes)
+
+    def laneGroupMasks(
+            self, currentLaneIndex: LaneIndex, numLanes: int,
+            nextLane: Optional[LaneIndex]
+    ) -> Dict[str, np.ndarray]:
+        # 和 processSVsNormalLane 的分类规则一致：同一条 road 上按 lane 的相对
+        # 序号分到 current/left/right，不在同一条 road 上但在 nextLane 上的为 target
+        sameRoad = self.sideLaneMask(currentLaneIndex, numLanes)
+        laneRelative = self.laneIDs - currentLaneIndex[2]
+        if nextLane is not None:
+            target = self.laneMask(nextLane) & ~sameRoad
+        else:
+            target = np.zeros(len(self.vehicles), dtype=bool)
+        return {
+            'current lane': sameRoad & (laneRelative == 0),
+            'left lane': sameRoad & (laneRelative == -1),
+            'right lane': sameRoad & (laneRelative == 1),
+            'target lane': target
+        }
+
+    def closestRow(self, mask: np.ndarray) -> Optional[int]:
+        rows = np.flatnonzero(mask)
+        if rows.size == 0:
+            return None
+        # argmin 返回第一个最小值，与逐个比较 `dis < closestDis` 的结果一致
+        return int(rows[np.argmin(self.distances[rows])])
+
+    def closestAheadBehind(
+            self, mask: np.ndarray
+    ) -> Tuple[Optional[int], Optional[int]]:
+        return (
+            self.closestRow(mask & self.ahead),
+            self.closestRow(mask & ~self.ahead)
+        )
+
+    def dangerousMask(
+            self, theta1: float, theta2: float,
+            radius1: float, radius2: float
+    ) -> np.ndarray:
+        key = (theta1, theta2, radius1, radius2)
+        if key not in self._dangerous:
+            # 距离为 0 时夹角为 nan，所有比较都为 False，与逐车计算的结果一致
+            with np.errstate(invalid='ignore', divide='ignore'):
+                cosines = self.projections / self.distances
+            alpha = np.arccos(np.clip(cosines, -1, 1))
+            self._dangerous[key] = (
+                ((alpha <= theta1) & (self.distances <= radius1))
+                | ((alpha > theta1) & (alpha <= theta2)
+                   & (self.distances <= radius2))
+            )
+        return self._dangerous[key]
@@ -0,0 +1,333 @@
+from typing import List, Tuple, Optional, Union, Dict
+import io
+import json
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import subprocess
+import tarfile
+import tempfile
+import zipfile
+
+from highway_env.vehicle.kinematics import Vehicle
+from PIL import Image
+import numpy as np
+
+from dilu.scenario.replayReader import (
+    SELECT_EPISODES, SELECT_NETWORK, checkEpisodesTable, splitFrames
+)
+from dilu.scenario.trajectoryStore import TrajectoryStore, COLUMNS
+from dilu.scenario.sceneRenderer import ScenePainter, VehicleState
+
+
+SELECT_EPISODE_NETWORK = """SELECT networkHash FROM episodes
+    WHERE episodeID = ?;"""
+SELECT_FRAME_RANGE = """SELECT MIN(frame), MAX(frame)
+    FROM vehicleLog WHERE episodeID = ?;"""
+SELECT_CHUNK = """SELECT frame, id, isEgo, x, y, heading, speed,
+    acceleration, laneFrom, laneTo, laneID
+    FROM vehicleLog WHERE episodeID = ? AND frame BETWEEN ? AND ?
+    ORDER BY frame, rowid;"""
+
+# zip / tar 里保存 PNG 序列，其他格式交给 ffmpeg 编码
+ARCHIVE_FORMATS = ('zip', 'tar')
+
+# 一个渲染任务：(数据来源, 路径, episodeID, 块序号, 块的范围, 输出的分片文件, 格式, 帧率)。
+# 轨迹目录的块就是 TrajectoryWriter 写出的块，数据库按帧号切成 chunkFrames 帧一块
+ChunkTask = Tuple[str, str, str, int, Union[Dict, Tuple[int, int]], str, str, int]
+
+
+def frameStates(
+        columns: Dict[str, np.ndarray]
+) -> Tuple[VehicleState, Tuple[VehicleState, ...]]:
+    # 记录里没有车辆尺寸，使用 highway_env 的默认车长和车宽
+    ego = None
+    SVs = []
+    for row in range(len(columns['frame'])):
+        state = (
+            float(columns['x'][row]), float(columns['y'][row]),
+            float(columns['heading'][row]), Vehicle.LENGTH, Vehicle.WIDTH
+        )
+        if columns['isEgo'][row]:
+            ego = state
+        else:
+            SVs.append(state)
+    return ego, tuple(SVs)
+
+
+class ArchiveWriter:
+    # 一帧一个 PNG，直接写进 zip 或 tar，不在磁盘上留下单独的图片文件
+    def __init__(self, path: str, format: str) -> None:
+        self.format = format
+        if format == 'zip':
+            self.archive = zipfile.ZipFile(path, 'w', zipfile.ZIP_STORED)
+        else:
+            self.archive = tarfile.open(path, 'w')
+
+    def add(self, name: str, data: bytes) -> None:
+        if self.format == 'zip':
+            self.archive.writestr(name, data)
+        else:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            self.archive.addfile(info, io.BytesIO(data))
+
+    def write(self, frame: int, pixels: np.ndarray) -> None:
+        buffer = io.BytesIO()
+        Image.fromarray(pixels).save(buffer, format='PNG')
+        self.add(f'{frame:06d}.png', buffer.getvalue())
+
+    def close(self) -> None:
+        self.archive.close()
+
+    @staticmethod
+    def concat(parts: List[str], path: str, format: str) -> None:
+        # 分片里的 PNG 已经压缩过，按顺序原样拷进同一个容器
+        writer = ArchiveWriter(path, format)
+        try:
+            for part in parts:
+                if format == 'zip':
+                    with zipfile.ZipFile(part) as archive:
+                        for name in archive.namelist():
+                            writer.add(name, archive.read(name))
+                else:
+                    with tarfile.open(part) as archive:
+                        for member in archive.getmembers():
+                            writer.add(
+                                member.name, archive.extractfile(member).read()
+                            )
+        finally:
+            writer.close()
+
+
+def ffmpegPath() -> str:
+    path = shutil.which('ffmpeg')
+    if path is None:
+        raise RuntimeError(
+            "ffmpeg is required to export videos, use format='zip' or 'tar' "
+            "to export PNG sequences instead"
+        )
+    return path
+
+
+class FFmpegWriter:
+    # 把 RGBA 像素直接通过管道交给 ffmpeg 编码，不经过图片文件
+    def __init__(
+            self, path: str, width: int, height: int, fps: int,
+            codec: str = 'libx264'
+    ) -> None:
+        self.process = subprocess.Popen(
+            [
+                ffmpegPath(), '-loglevel', 'error', '-y',
+                '-f', 'rawvideo', '-pix_fmt', 'rgba',
+                '-s', f'{width}x{height}', '-r', str(fps), '-i', '-',
+                # yuv420p 要求宽高是偶数
+                '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2',
+                '-c:v', codec, '-pix_fmt', 'yuv420p', path
+            ],
+            stdin=subprocess.PIPE
+        )
+
+    def write(self, frame: int, pixels: np.ndarray) -> None:
+        self.process.stdin.write(np.ascontiguousarray(pixels).tobytes())
+
+    def close(self) -> None:
+        self.process.stdin.close()
+        if self.process.wait() != 0:
+            raise RuntimeError(
+                f"ffmpeg exited with code {self.process.returncode}"
+            )
+
+    @staticmethod
+    def concat(parts: List[str], path: str, format: str) -> None:
+        # 各分片的编码参数相同，用 concat demuxer 直接拼接，不重新编码
+        with tempfile.NamedTemporaryFile(
+                'w', suffix='.txt', dir=os.path.dirname(path) or '.',
+                delete=False
+        ) as f:
+            for part in parts:
+                f.write(f"file '{os.path.abspath(part)}'\n")
+            listPath = f.name
+        try:
+            subprocess.run(
+                [
+                    ffmpegPath(), '-loglevel', 'error', '-y', '-f', 'concat',
+                    '-safe', '0', '-i', listPath, '-c', 'copy', path
+                ],
+                check=True
+            )
+        finally:
+            os.remove(listPath)
+
+
+# 每个进程缓存自己的 ScenePainter（即各个路网的背景）和 TrajectoryStore
+painters: Dict[Tuple[Tuple[float, float], int], ScenePainter] = {}
+stores: Dict[str, TrajectoryStore] = {}
+
+
+def getPainter(viewRange: Tuple[float, float], dpi: int) -> ScenePainter:
+    key = (tuple(viewRange), dpi)
+    if key not in painters:
+        painters[key] = ScenePainter(viewRange, dpi)
+    return painters[key]
+
+
+def loadChunk(
+        source: str, path: str, episodeID: str,
+        chunk: Union[Dict, Tuple[int, int]], painter: ScenePainter
+) -> Tuple[str, Dict[str, np.ndarray]]:
+    # 返回块所在路网的哈希和块内所有行，路网描述第一次用到时交给 painter
+    if source == 'trajectory':
+        if path not in stores:
+            stores[path] = TrajectoryStore(path)
+        store = stores[path]
+        netHash = chunk['networkHash']
+        if netHash not in painter.descriptions:
+            painter.addNetwork(netHash, store.geometry(netHash).description)
+        return netHash, store.loadChunk(chunk)
+    conn = sqlite3.connect(path)
+    try:
+        netHash = conn.execute(
+            SELECT_EPISODE_NETWORK, (episodeID,)
+        ).fetchone()[0]
+        if netHash not in painter.descriptions:
+            network = conn.execute(SELECT_NETWORK, (netHash,)).fetchone()[0]
+            painter.addNetwork(netHash, json.loads(network))
+        rows = conn.execute(SELECT_CHUNK, (episodeID, *chunk)).fetchall()
+    finally:
+        conn.close()
+    if not rows:
+        return netHash, {}
+    return netHash, {
+        name: np.array(values, dtype=dtype)
+        for (name, dtype), values in zip(COLUMNS, zip(*rows))
+    }
+
+
+def renderChunk(
+        task: ChunkTask, viewRange: Tuple[float, float] = (100.0, 40.0),
+        dpi: int = 100
+) -> Tuple[str, int, str, int]:
+    source, path, episodeID, part, chunk, partPath, format, fps = task
+    painter = getPainter(viewRange, dpi)
+    netHash, columns = loadChunk(source, path, episodeID, chunk, painter)
+    canvas = painter.canvas(netHash)
+    # 第一帧画好后再创建分片文件，没有帧的块不产生文件
+    writer = None
+    frames = 0
+    try:
+        for frame, frameColumns in splitFrames(columns) if columns else ():
+            ego, SVs = frameStates(frameColumns)
+            if ego is None:
+                continue
+            pixels = canvas.draw(ego, SVs)
+            if writer is None:
+                if format in ARCHIVE_FORMATS:
+                    writer = ArchiveWriter(partPath, format)
+                else:
+                    writer = FFmpegWriter(
+                        partPath, canvas.width, canvas.height, fps
+                    )
+            writer.write(frame, pixels)
+            frames += 1
+    finally:
+        if writer is not None:
+            writer.close()
+    return episodeID, part, partPath, frames
+
+
+def renderChunkTask(args: Tuple) -> Tuple[str, int, str, int]:
+    return renderChunk(*args)
+
+
+def chunkTasks(
+        outputDir: str, directory: Optional[str], database: Optional[str],
+        episodes: Optional[List[str]], format: str, fps: int, chunkFrames: int
+) -> List[ChunkTask]:
+    tasks: List[ChunkTask] = []
+
+    def partPath(episodeID: str, part: int) -> str:
+        return os.path.join(outputDir, f'.{episodeID}.{part:05d}.{format}')
+
+    if directory:
+        parts: Dict[str, int] = {}
+        for meta in TrajectoryStore(directory).index:
+            episodeID = meta['episodeID']
+            if episodes is not None and episodeID not in episodes:
+                continue
+            part = parts[episodeID] = parts.get(episodeID, -1) + 1
+            tasks.append((
+                'trajectory', directory, episodeID, part, meta,
+                partPath(episodeID, part), format, fps
+            ))
+        return tasks
+    conn = sqlite3.connect(database)
+    try:
+        checkEpisodesTable(conn, database)
+        for row in conn.execute(SELECT_EPISODES).fetchall():
+            episodeID = row[0]
+            if episodes is not None and episodeID not in episodes:
+                continue
+            first, last = conn.execute(
+                SELECT_FRAME_RANGE, (episodeID,)
+            ).fetchone()
+            if first is None:
+                continue
+            for part, start in enumerate(range(first, last + 1, chunkFrames)):
+                tasks.append((
+                    'database', database, episodeID, part,
+                    (start, min(start + chunkFrames - 1, last)),
+                    partPath(episodeID, part), format, fps
+                ))
+    finally:
+        conn.close()
+    return tasks
+
+
+def exportVideos(
+        outputDir: str, directory: Optional[str] = None,
+        database: Optional[str] = None, episodes: Optional[List[str]] = None,
+        format: str = 'mp4', fps: int = 10, chunkFrames: int = 200,
+        viewRange: Tuple[float, float] = (100.0, 40.0), dpi: int = 100,
+        processes: Optional[int] = None
+) -> Dict[str, str]:
+    # 把轨迹目录或共享数据库里的 episode 导出为视频（或 zip / tar 里的 PNG 序列）。
+    # 每个 episode 按块拆成任务，由进程池并行渲染成分片，再按顺序拼接成
+    # {outputDir}/{episodeID}.{format}；返回 episodeID 到文件路径的映射
+    if format not in ARCHIVE_FORMATS:
+        ffmpegPath()
+    os.makedirs(outputDir, exist_ok=True)
+    tasks = [
+        (task, viewRange, dpi)
+        for task in chunkTasks(
+            outputDir, directory, database, episodes, format, fps, chunkFrames
+        )
+    ]
+    if processes == 1 or len(tasks) <= 1:
+        results = list(map(renderChunkTask, tasks))
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            results = list(pool.imap_unordered(renderChunkTask, tasks))
+
+    parts: Dict[str, List[Tuple[int, str, int]]] = {}
+    for episodeID, part, partPath, frames in results:
+        parts.setdefault(episodeID, []).append((part, partPath, frames))
+    concat = ArchiveWriter.concat if format in ARCHIVE_FORMATS else FFmpegWriter.concat
+    outputs: Dict[str, str] = {}
+    for episodeID, episodeParts in parts.items():
+        episodeParts.sort()
+        path = os.path.join(outputDir, f'{episodeID}.{format}')
+        partPaths = [partPath for _, partPath, frames in episodeParts if frames]
+        try:
+            if len(partPaths) == 1:
+                os.replace(partPaths[0], path)
+            elif partPaths:
+                concat(partPaths, path, format)
+        finally:
+            for _, partPath, _ in episodeParts:
+                if os.path.exists(partPath):
+                    os.remove(partPath)
+        if partPaths:
+            outputs[episodeID] = path
+    return outputs